@@ -0,0 +1,237 @@
+"""Banc de l'historique de conversation : taille du prompt contre latence.
+
+Une longue conversation (questions courtes, quelques réponses très longues) est
+rejouée sur le serveur en streaming, pour l'ancien historique (3 derniers
+échanges, sans limite de tokens) puis pour plusieurs budgets de tokens.
+Par tour : tokens du prompt évalués par Ollama, durée du prompt-eval, délai
+jusqu'à la première phrase.
+
+    python bench_context.py
+    python bench_context.py --budgets 128 512 1024 --prompt_tokens_per_second 1500
+    python bench_context.py --ollama_url http://192.168.1.17:11434/api/generate
+
+Vérifie aussi : budget respecté, résumé des anciens échanges pendant un creux
+et repris dans le prompt, historique vidé à l'approche d'un nouveau visiteur.
+"""
+import argparse
+import statistics
+import time
+
+from bench_pipeline import percentile
+from context_window import SUMMARY_RETRY, estimate_tokens, format_exchange
+from fake_ollama import FakeOllama
+from gemma2_server import OptimizedGemma2Server
+from pepper_config import DEFAULTS
+from response_cache import ResponseCache
+
+SHORT_REPLY = "La conférence commence à quatorze heures en salle A. Je peux vous y guider si vous voulez."
+LONG_REPLY = ("Cet après-midi il y a la keynote d'ouverture à quatorze heures en salle A, puis trois ateliers "
+              "en parallèle sur la robotique sociale, la vision embarquée et les grands modèles de langage, "
+              "une table ronde sur l'éthique des robots d'accueil à seize heures trente avec quatre intervenants "
+              "venus de l'industrie et de la recherche, les démonstrations sur les stands du hall B tout au long "
+              "de la journée et enfin le cocktail de clôture sur la terrasse à partir de dix-huit heures. "
+              "Dites-moi ce qui vous intéresse et je vous indique le chemin.")
+
+QUESTIONS = [
+    "bonjour Pepper",
+    "qu'est-ce qu'il y a au programme cet après-midi",
+    "où est la salle A",
+    "et l'atelier sur la vision embarquée il commence quand",
+    "est-ce qu'il reste des places pour la table ronde",
+    "qui sont les intervenants de la table ronde",
+    "où sont les toilettes",
+    "redis-moi tout le programme de l'après-midi s'il te plaît",
+    "où se trouve le hall B",
+    "à quelle heure est le cocktail",
+    "je peux venir avec un collègue",
+    "merci beaucoup Pepper",
+]
+LONG_TURNS = {1, 7}
+
+
+class LegacyContext(object):
+    """Ancien historique : liste tronquée par pop(0), 3 derniers échanges dans le prompt"""
+
+    def __init__(self, max_turns=8):
+        self.max_turns = max_turns
+        self.turns = []
+        self.last_update = 0.0
+
+    def __len__(self):
+        return len(self.turns)
+
+    def append(self, question, answer, now=None):
+        self.turns.append((question, answer))
+        if len(self.turns) > self.max_turns:
+            self.turns.pop(0)
+        self.last_update = now or time.time()
+
+    def last_question(self):
+        return self.turns[-1][0] if self.turns else ""
+
+    def render(self, budget):
+        text = "\n".join(format_exchange(h, a) for h, a in self.turns[-3:])
+        return text, estimate_tokens(text)
+
+    def summary_request(self, budget, now=None):
+        return None
+
+    def reset(self):
+        self.turns = []
+
+
+def make_server(ollama_url, budget):
+    server = OptimizedGemma2Server(port=0, pepper_port=0)
+    server.ollama_url = ollama_url
+    server.response_cache = ResponseCache(max_entries=0)
+    if budget is not None:
+        server.context_ratio = budget / server.num_ctx
+    return server
+
+
+def play_turn(server, session, question):
+    """Un tour en streaming : (délai première phrase, tokens d'historique du prompt)"""
+    start = time.time()
+    first_sentence = []
+    _, history_tokens = session.context.render(server.context_budget)
+    server.stream_with_gemma2(session, [{'conversation_text': question}],
+                              lambda sentence: first_sentence.append(time.time()) if not first_sentence else None)
+    return (first_sentence[0] if first_sentence else time.time()) - start, history_tokens
+
+
+def run_conversation(ollama, ollama_url, budget):
+    server = make_server(ollama_url, budget)
+    session = server.get_session({'robot_id': "bench"}, ("127.0.0.1", 0))
+    if budget is None:
+        session.context = LegacyContext(server.max_context_length)
+    rows = []
+    for index, question in enumerate(QUESTIONS):
+        if ollama is not None:
+            ollama.reply = LONG_REPLY if index in LONG_TURNS else SHORT_REPLY
+        received = len(ollama.requests) if ollama is not None else 0
+        first_sentence, history_tokens = play_turn(server, session, question)
+        result = ollama.requests[received] if ollama is not None else None
+        rows.append({
+            'history_tokens': history_tokens,
+            'prompt_tokens': len(result['payload']['prompt']) // 4 if result else None,
+            'first_sentence': first_sentence,
+        })
+    server.executor.shutdown(wait=True)
+    return server, session, rows
+
+
+def summarize(label, rows, prompt_tokens_per_second):
+    late = rows[len(rows) // 2:]  # seconde moitié : historique rempli
+    history = [row['history_tokens'] for row in late]
+    firsts = [row['first_sentence'] * 1000 for row in late]
+    prompts = [row['prompt_tokens'] for row in late if row['prompt_tokens'] is not None]
+    line = (f"{label:<14} historique {statistics.mean(history):>5.0f} tok (max {max(history):>4})  "
+            f"première phrase p50 {percentile(firsts, 0.5):>5.0f}ms p95 {percentile(firsts, 0.95):>5.0f}ms")
+    if prompts and prompt_tokens_per_second:
+        line += f"  prompt-eval ~{statistics.mean(prompts) / prompt_tokens_per_second * 1000:.0f}ms"
+    print(line)
+    return max(history), percentile(firsts, 0.5)
+
+
+def check_summary_and_reset(ollama_url):
+    """Creux après la conversation : résumé des échanges hors budget, puis nouveau visiteur"""
+    server = make_server(ollama_url, 128)
+    server.summary_idle = 0.0
+    session = server.get_session({'robot_id': "bench"}, ("127.0.0.1", 0))
+    for index, question in enumerate(QUESTIONS[:6]):
+        session.context.append(question, LONG_REPLY if index in LONG_TURNS else SHORT_REPLY)
+    before = len(session.context)
+    candidates = server.summary_candidates(time.time() + 1)
+    for candidate_session, request in candidates:
+        server.summarize_context(candidate_session, request)
+    summary, kept, used = session.context.pack(server.context_budget)
+    after = len(session.context)
+    prompt = server.build_prompt(session, "et demain")
+    print(f"📝 Résumé de {before - after} échanges : « {summary[:80]}… », "
+          f"{len(kept)} échanges gardés, {used}/{server.context_budget} tokens")
+
+    # Résumé en échec (Ollama coupé, réponse vide) : pas de nouvelle demande avant le délai
+    failing = server.get_session({'robot_id': "bench-failure"}, ("127.0.0.1", 0))
+    for index, question in enumerate(QUESTIONS[:6]):
+        failing.context.append(question, LONG_REPLY if index in LONG_TURNS else SHORT_REPLY)
+    delays = []
+    request = next((request for candidate, request in server.summary_candidates(time.time() + 1)
+                    if candidate is failing), None)
+    for _ in range(2):
+        if request is None:
+            break
+        failed_at = time.time()
+        server.apply_summary(failing, request, None)
+        retry_at = failing.context.summary_retry_at
+        delays.append(round(retry_at - failed_at))
+        early = server.summary_candidates(retry_at - 1)
+        request = next((request for candidate, request in server.summary_candidates(retry_at + 1)
+                        if candidate is failing), None)
+        if early:
+            request = None
+    backoff_ok = len(delays) == 2 and delays[0] >= SUMMARY_RETRY and delays[1] >= 2 * delays[0]
+    print(f"⏳ Résumé en échec redemandé après {delays} s")
+
+    session.visitor_id = 101
+    session.context.last_update = time.time() - server.visitor_reset_idle - 1
+    server.handle_voice_message(session, {'type': "visitor_approaching", 'person_id': 102, 'distance': 2.5})
+    server.executor.shutdown(wait=True)
+    return [
+        ("résumé demandé pour la session inactive", len(candidates) == 1),
+        ("échanges résumés retirés, résumé dans le prompt",
+         bool(summary) and after < before and f"Résumé: {summary}" in prompt),
+        ("résumé en échec redemandé après un délai croissant", backoff_ok),
+        ("historique vidé pour un nouveau visiteur",
+         len(session.context) == 0 and not session.context.summary
+         and server.metrics.counters.get(("context_resets_total", (("reason", "new_visitor"),)), 0) == 1),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budgets", type=int, nargs="+", default=[128, 256, 512, 1024, 2048],
+                        help="Budgets d'historique (tokens) comparés à l'ancien historique")
+    parser.add_argument("--ollama_url", default=None, help="Ollama réel (défaut : faux Ollama local)")
+    parser.add_argument("--prompt_tokens_per_second", type=float, default=800.0,
+                        help="Débit de prompt-eval du faux Ollama")
+    args = parser.parse_args()
+
+    ollama = None
+    ollama_url = args.ollama_url
+    if ollama_url is None:
+        ollama = FakeOllama(tokens_per_second=200.0, prompt_tokens_per_second=args.prompt_tokens_per_second).start()
+        ollama_url = ollama.url
+    rate = args.prompt_tokens_per_second if ollama is not None else None
+
+    checks = []
+    try:
+        print(f"💬 {len(QUESTIONS)} tours, {len(LONG_TURNS)} réponses longues ({estimate_tokens(LONG_REPLY)} tok)\n")
+        _, _, legacy_rows = run_conversation(ollama, ollama_url, None)
+        legacy_max, legacy_first = summarize("3 derniers", legacy_rows, rate)
+        results = {}
+        for budget in args.budgets:
+            _, _, rows = run_conversation(ollama, ollama_url, budget)
+            results[budget] = summarize(f"budget {budget}", rows, rate)
+        default_budget = int(DEFAULTS["generation"]["num_ctx"] * DEFAULTS["conversation"]["context_ratio"])
+        _, _, rows = run_conversation(ollama, ollama_url, default_budget)
+        _, default_first = summarize(f"défaut {default_budget}", rows, rate)
+        print()
+        for budget, (history_max, _) in results.items():
+            checks.append((f"budget {budget} respecté", history_max <= budget))
+        smallest = min(results)
+        checks.append((f"budget {smallest} : prompt plus court que l'ancien historique",
+                       results[smallest][0] < legacy_max))
+        if ollama is not None:
+            checks.append((f"budget {smallest} : première phrase plus rapide que l'ancien historique",
+                           results[smallest][1] < legacy_first))
+            # Budget par défaut proche de l'ancien historique : pas plus de 10 % de latence en plus
+            checks.append((f"budget par défaut ({default_budget}) : première phrase au niveau de l'ancien historique",
+                           default_first <= legacy_first * 1.1))
+        checks += check_summary_and_reset(ollama_url)
+    finally:
+        if ollama is not None:
+            ollama.stop()
+
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    raise SystemExit(0 if all(ok for _, ok in checks) else 1)
@@ -0,0 +1,226 @@
+"""Banc de latence voix -> réponse, sans Pepper, sans GPU, sans Ollama réel.
+
+Traces ALMemory rejouées dans VoiceToLLM via une fausse session qi, serveur Gemma2
+piloté en UDP local, réponses d'un faux Ollama (fake_ollama.py) au débit choisi.
+
+    python bench_pipeline.py --utterances 30 --json resultats.json
+    python bench_pipeline.py --trace visite.jsonl --baseline base.json --max_regression 0.15
+
+Étapes mesurées (p50/p95/p99) :
+    fin de parole -> datagramme reçu par le serveur
+    datagramme -> premier token LLM, -> dernier token, -> appel TTS
+    fin de parole -> appel TTS (bout en bout)
+"""
+import argparse
+import json
+import socket
+import sys
+import time
+
+from fake_ollama import FakeOllama
+from fake_qi import FakeSession, FakeTextToSpeech
+from gemma2_server import OptimizedGemma2Server
+from pepper_events import load_trace
+from replay_endpointing import synthetic_trace
+from response_cache import ResponseCache
+from testOnPepperStreamingVocal import VoiceToLLM
+
+STAGES = ("speech_end->datagram", "datagram->first_token", "datagram->last_token",
+          "datagram->tts", "speech_end->tts")
+
+
+def free_udp_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def split_into_utterances(events, gap=2.0):
+    utterances = []
+    for event in events:
+        if not utterances or event[0] - utterances[-1][-1][0] > gap:
+            utterances.append([])
+        utterances[-1].append(event)
+    return utterances
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class PipelineBench(object):
+    def __init__(self, tokens_per_second=50.0, server_mode="threads", cache=False, speculative=True,
+                 client_options=None):
+        self.ollama = FakeOllama(tokens_per_second=tokens_per_second).start()
+        server_port, client_port = free_udp_port(), free_udp_port()
+
+        if server_mode == "asyncio":
+            from gemma2_async_server import AsyncGemma2Server
+            self.server = AsyncGemma2Server(port=server_port, pepper_port=client_port)
+        else:
+            self.server = OptimizedGemma2Server(port=server_port, pepper_port=client_port)
+        self.server.ollama_url = self.ollama.url
+        if not cache:
+            self.server.response_cache = ResponseCache(max_entries=0)
+
+        # Heure d'arrivée de chaque fin d'énoncé définitive côté serveur
+        self.datagram_times = {}
+        process_voice_data = self.server.process_voice_data
+
+        def traced_process_voice_data(voice_data, sender_addr):
+            if voice_data.get('type') == 'conversation_end' and not voice_data.get('speculative'):
+                self.datagram_times[voice_data.get('utterance_id')] = time.time()
+            process_voice_data(voice_data, sender_addr)
+        self.server.process_voice_data = traced_process_voice_data
+
+        self.tts = FakeTextToSpeech(words_per_second=50.0)
+        self.session = FakeSession(tts=self.tts)
+        self.memory = self.session.service("ALMemory")
+        self.client = VoiceToLLM(self.session, llm_host="127.0.0.1", llm_port=server_port, speculative=speculative,
+                                 **(client_options or {}))
+        self.client.response_port = client_port
+        self.server_mode = server_mode
+
+    def start(self):
+        if self.server_mode == "asyncio":
+            import threading
+            self.server_thread = threading.Thread(target=self.server.run)
+            self.server_thread.daemon = True
+            self.server_thread.start()
+        else:
+            self.server.start_server()
+        self.client.start_detection()
+        time.sleep(0.5)
+
+    def stop(self):
+        self.client.stop_detection()
+        if self.server_mode == "asyncio":
+            self.server.loop.call_soon_threadsafe(self.server.stop_server)
+            self.server_thread.join(timeout=5)
+        else:
+            self.server.stop_server()
+        self.ollama.stop()
+
+    def replay_utterance(self, events, timeout=10.0):
+        """Rejoue un énoncé en temps réel ; renvoie les durées de chaque étape (ou None)"""
+        said_before = len(self.tts.said)
+        start = time.time()
+        origin = events[0][0]
+        speech_end = None
+        for t, key, value in events:
+            delay = start + (t - origin) - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.memory.raiseEvent(key, value)
+            if key == "WordRecognized":
+                speech_end = time.time()
+
+        deadline = time.time() + timeout
+        while len(self.tts.said) == said_before and time.time() < deadline:
+            time.sleep(0.005)
+        if speech_end is None or len(self.tts.said) == said_before:
+            return None
+
+        tts_time = self.tts.said[said_before][0]
+        datagram = self.datagram_times.get(self.client.utterance_id)
+        generations = [r for r in self.ollama.requests
+                       if r['received'] >= start and r['first_token']
+                       and r['payload'].get('options', {}).get('num_predict') != 1]
+        if datagram is None or not generations:
+            return None
+        generation = generations[-1]
+        return {
+            "speech_end->datagram": datagram - speech_end,
+            "datagram->first_token": generation['first_token'] - datagram,
+            "datagram->last_token": generation['last_token'] - datagram,
+            "datagram->tts": tts_time - datagram,
+            "speech_end->tts": tts_time - speech_end,
+        }
+
+    def run(self, utterances, pause=0.3):
+        samples = {stage: [] for stage in STAGES}
+        failures = 0
+        for events in utterances:
+            result = self.replay_utterance(events)
+            if result is None:
+                failures += 1
+            else:
+                for stage, value in result.items():
+                    samples[stage].append(value)
+            # Laisse Pepper finir de parler avant le visiteur suivant (say est asynchrone)
+            while self.client.player.is_speaking():
+                time.sleep(0.01)
+            time.sleep(pause)
+        return samples, failures
+
+
+def summarize(samples):
+    return {stage: {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95),
+                    "p99": percentile(values, 0.99), "n": len(values)}
+            for stage, values in samples.items()}
+
+
+def print_report(summary, baseline=None):
+    print(f"\n{'étape':<24} {'n':>4} {'p50':>8} {'p95':>8} {'p99':>8}" + ("   Δp95 vs base" if baseline else ""))
+    for stage in STAGES:
+        stats = summary[stage]
+        line = (f"{stage:<24} {stats['n']:>4} {stats['p50'] * 1000:>6.0f}ms "
+                f"{stats['p95'] * 1000:>6.0f}ms {stats['p99'] * 1000:>6.0f}ms")
+        if baseline and stage in baseline:
+            delta = stats['p95'] - baseline[stage]['p95']
+            line += f"   {delta * 1000:+.0f}ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trace", nargs="*", default=[], help="Traces enregistrées (--record_trace)")
+    parser.add_argument("--utterances", type=int, default=20, help="Énoncés synthétiques si aucune trace")
+    parser.add_argument("--tokens_per_second", type=float, default=50.0)
+    parser.add_argument("--server", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--cache", action="store_true", help="Active le cache de réponses du serveur")
+    parser.add_argument("--no_speculative", action="store_true")
+    parser.add_argument("--json", default=None, help="Écrit les résultats (sert de base de comparaison)")
+    parser.add_argument("--baseline", default=None, help="Résultats JSON d'une exécution précédente")
+    parser.add_argument("--max_regression", type=float, default=None,
+                        help="Code de sortie 1 si le p95 bout en bout régresse de plus de cette fraction")
+    args = parser.parse_args()
+
+    events = []
+    for path in args.trace:
+        events.extend(load_trace(path))
+    if not events:
+        events = synthetic_trace(args.utterances)
+    events.sort(key=lambda event: event[0])
+
+    bench = PipelineBench(tokens_per_second=args.tokens_per_second, server_mode=args.server,
+                          cache=args.cache, speculative=not args.no_speculative)
+    bench.start()
+    try:
+        samples, failures = bench.run(split_into_utterances(events))
+    finally:
+        bench.stop()
+
+    summary = summarize(samples)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)["summary"]
+    print_report(summary, baseline)
+    print(f"\nÉnoncés sans réponse mesurable: {failures}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"summary": summary, "failures": failures, "args": vars(args)}, f, indent=2)
+
+    if baseline and args.max_regression is not None:
+        before = baseline["speech_end->tts"]["p95"]
+        after = summary["speech_end->tts"]["p95"]
+        if after > before * (1 + args.max_regression):
+            print(f"❌ Régression bout en bout: p95 {before * 1000:.0f}ms -> {after * 1000:.0f}ms")
+            sys.exit(1)
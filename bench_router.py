@@ -0,0 +1,236 @@
+"""Banc du routeur multi-Ollama : répartition, bascule, disjoncteur, petit modèle.
+
+Plusieurs faux Ollama (fake_ollama.py) derrière le serveur, des robots simulés
+qui envoient des tours en parallèle en UDP local.
+
+    python bench_router.py --robots 8 --turns 3
+    python bench_router.py --server asyncio
+
+Scénarios :
+    balance   deux backends identiques : charge répartie, affinité de session
+    failover  un backend renvoie des 500 : tous les tours répondus, disjoncteur ouvert
+    down      un backend injoignable (port fermé) : bascule sans perte
+    slow      un backend muet au-delà du délai de génération : compté en échec, bascule
+    small     salutations vers le petit modèle, questions vers le gros
+"""
+import argparse
+import collections
+import itertools
+import socket
+import threading
+import time
+
+import wire_format
+from bench_pipeline import free_udp_port
+from fake_ollama import FakeOllama
+from gemma2_server import FALLBACK_RESPONSES, FILLER_WAIT, OptimizedGemma2Server
+from llm_router import OllamaBackend
+from response_cache import ResponseCache
+from udp_transport import ReliableUDPTransport
+
+QUESTIONS = [
+    "où se trouve la salle de conférence principale",
+    "à quelle heure commence la présentation du robot",
+    "est-ce qu'il y a un vestiaire près de l'entrée",
+    "qui organise l'événement cette année",
+]
+GREETINGS = ["bonjour", "salut Pepper", "merci", "au revoir"]
+# Backend "slow" : en-têtes après SLOW_LATENCY, délai de génération du serveur à la moitié
+SLOW_LATENCY = 2.0
+
+
+class RobotFleet(object):
+    """Robots simulés : un socket, un robot_id par robot, attente de la réponse finale"""
+
+    def __init__(self, server_port):
+        self.server_addr = ("127.0.0.1", server_port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.2)
+        self.port = self.sock.getsockname()[1]
+        self.udp = ReliableUDPTransport(self.sock.sendto)
+        self.utterance_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.partial = collections.defaultdict(list)
+        self.answered = {}
+        self.running = True
+
+    def start(self):
+        self.udp.start()
+        self.thread = threading.Thread(target=self.receive)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=1)
+        self.udp.stop()
+        self.sock.close()
+
+    def receive(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            message = self.udp.on_datagram(data, addr)
+            if message is None:
+                continue
+            response, _ = wire_format.decode(message)
+            if response.get('type') != 'llm_response' or response.get('text') == FILLER_WAIT:
+                continue
+            with self.lock:
+                utterance_id = response.get('utterance_id')
+                self.partial[utterance_id].append(response.get('text', ''))
+                if response.get('final', True):
+                    self.answered[utterance_id] = " ".join(filter(None, self.partial.pop(utterance_id)))
+
+    def send(self, msg):
+        self.udp.send(wire_format.encode(msg, "json"), self.server_addr)
+
+    def turn(self, robot_id, text, timeout=15.0):
+        utterance_id = next(self.utterance_ids)
+        now = time.time()
+        self.send({"type": "conversation_start", "timestamp": now, "utterance_id": utterance_id,
+                   "robot_id": robot_id})
+        self.send({"type": "conversation_end", "timestamp": now, "conversation_text": text,
+                   "utterance_id": utterance_id, "robot_id": robot_id})
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self.lock:
+                if utterance_id in self.answered:
+                    return self.answered[utterance_id]
+            time.sleep(0.01)
+        return None
+
+
+def generations(fake):
+    """Requêtes de génération reçues (hors ping de maintien / préremplissage)"""
+    return [r for r in fake.requests if r['payload'].get('options', {}).get('num_predict') != 1]
+
+
+def run_scenario(name, server_mode, robots, turns, tokens_per_second):
+    fakes = {}
+    backends, small_backends = [], []
+    if name == "balance":
+        fakes["a"] = FakeOllama(tokens_per_second=tokens_per_second, seed=1).start()
+        fakes["b"] = FakeOllama(tokens_per_second=tokens_per_second, seed=2).start()
+    elif name == "failover":
+        fakes["a"] = FakeOllama(tokens_per_second=tokens_per_second, failure_rate=1.0, seed=1).start()
+        fakes["b"] = FakeOllama(tokens_per_second=tokens_per_second, seed=2).start()
+    elif name == "down":
+        fakes["b"] = FakeOllama(tokens_per_second=tokens_per_second, seed=2).start()
+        backends.append(OllamaBackend(f"http://127.0.0.1:{free_udp_port()}/api/generate", "gemma2:9b", name="a"))
+    elif name == "slow":
+        fakes["a"] = FakeOllama(tokens_per_second=tokens_per_second, latency=SLOW_LATENCY, seed=1).start()
+        fakes["b"] = FakeOllama(tokens_per_second=tokens_per_second, seed=2).start()
+    elif name == "small":
+        fakes["a"] = FakeOllama(tokens_per_second=tokens_per_second, seed=1).start()
+        fakes["small"] = FakeOllama(tokens_per_second=tokens_per_second * 3, seed=3).start()
+    for key, fake in fakes.items():
+        if key == "small":
+            small_backends.append(OllamaBackend(fake.url, "gemma2:2b", name=key))
+        else:
+            backends.append(OllamaBackend(fake.url, "gemma2:9b", name=key))
+
+    server_port = free_udp_port()
+    fleet = RobotFleet(server_port)
+    kwargs = dict(port=server_port, pepper_port=fleet.port, backends=backends, small_backends=small_backends)
+    if server_mode == "asyncio":
+        from gemma2_async_server import AsyncGemma2Server
+        server = AsyncGemma2Server(**kwargs)
+        server_thread = threading.Thread(target=server.run)
+        server_thread.daemon = True
+        server_thread.start()
+    else:
+        server = OptimizedGemma2Server(**kwargs)
+        server.start_server()
+    # Sans cache : chaque tour doit atteindre un backend
+    server.response_cache = ResponseCache(max_entries=0)
+    if name == "slow":
+        server.generation_timeout = SLOW_LATENCY / 2
+    fleet.start()
+    time.sleep(0.5)
+    # Les vérifications de démarrage ne comptent pas
+    baseline = {key: len(generations(fake)) for key, fake in fakes.items()}
+
+    results = collections.defaultdict(list)
+
+    def robot(index):
+        robot_id = f"pepper-{index}"
+        for turn in range(turns):
+            if name == "small" and turn % 2 == 0:
+                text = GREETINGS[(index + turn) % len(GREETINGS)]
+            else:
+                text = QUESTIONS[(index + turn) % len(QUESTIONS)]
+            start = time.time()
+            answer = fleet.turn(robot_id, text)
+            results[robot_id].append((text, answer, time.time() - start))
+
+    threads = [threading.Thread(target=robot, args=(index,)) for index in range(robots)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    status = {backend["name"]: backend for backend in server.router.status()}
+    fleet.stop()
+    if server_mode == "asyncio":
+        server.loop.call_soon_threadsafe(server.stop_server)
+        server_thread.join(timeout=5)
+    else:
+        server.stop_server()
+    for fake in fakes.values():
+        fake.stop()
+
+    turns_done = [entry for entries in results.values() for entry in entries]
+    answered = [entry for entry in turns_done if entry[1] is not None and entry[1] not in FALLBACK_RESPONSES]
+    latencies = sorted(entry[2] for entry in answered)
+    served = {key: len(generations(fake)) - baseline[key] for key, fake in fakes.items()}
+    report = {
+        "answered": f"{len(answered)}/{len(turns_done)}",
+        "p50": latencies[len(latencies) // 2] if latencies else float('nan'),
+        "served": served,
+        "states": {key: value["state"] for key, value in status.items()},
+    }
+
+    checks = [("tous les tours répondus", len(answered) == len(turns_done))]
+    if name == "balance":
+        low, high = min(served.values()), max(served.values())
+        checks.append(("charge répartie (écart <= 50 %)", high and low >= high / 2))
+    elif name == "failover":
+        checks.append(("disjoncteur ouvert sur a", status["a"]["state"] == "open"))
+        checks.append(("b a tout servi", served["b"] == len(turns_done)))
+    elif name == "down":
+        checks.append(("disjoncteur ouvert sur a", status["a"]["state"] == "open"))
+    elif name == "slow":
+        checks.append(("disjoncteur ouvert sur a", status["a"]["state"] == "open"))
+        checks.append(("aucune requête restée comptée en cours sur a", status["a"]["outstanding"] == 0))
+    elif name == "small":
+        greetings = sum(1 for entry in turns_done if entry[0] in GREETINGS)
+        checks.append(("salutations sur le petit modèle", served["small"] == greetings))
+        checks.append(("questions sur le gros modèle", served["a"] == len(turns_done) - greetings))
+    return report, checks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--robots", type=int, default=6)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--tokens_per_second", type=float, default=200.0)
+    parser.add_argument("--scenario", action="append", choices=["balance", "failover", "down", "slow", "small"])
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.scenario or ["balance", "failover", "down", "slow", "small"]:
+        report, checks = run_scenario(name, args.server, args.robots, args.turns, args.tokens_per_second)
+        print(f"\n📊 {name} ({args.server}) : {report['answered']} répondus, p50 {report['p50']:.2f}s, "
+              f"servis {report['served']}, disjoncteurs {report['states']}")
+        for label, ok in checks:
+            print(f"   {'✅' if ok else '❌'} {label}")
+            failed = failed or not ok
+    raise SystemExit(1 if failed else 0)
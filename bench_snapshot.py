@@ -0,0 +1,114 @@
+"""Banc des lectures ALMemory : un getData par clé contre un getListData par tick.
+
+FakeMemory facture rpc_latency à chaque appel (aller-retour qi vers le robot).
+
+    python bench_snapshot.py --rpc_latency 0.008 --people 3
+    python bench_snapshot.py --duration 5 --interval 0.05
+
+Pour chaque boucle (voix : 4 clés, présence : PeopleList + 2 clés par personne) :
+RPC et durée de lecture par tick, puis cadence réellement tenue en 50ms.
+"""
+import argparse
+import time
+
+from fake_qi import FakeMemory
+from pepper_events import ALMemorySnapshot
+
+VOICE_KEYS = ["SpeechDetected", "ALSoundLocalization/SoundLocated",
+              "ALVoiceEmotionAnalysis/EmotionRecognized", "WordRecognized"]
+PEOPLE_LIST = "PeoplePerception/PeopleList"
+
+
+def fill_memory(memory, people):
+    memory.insertData("SpeechDetected", 1)
+    memory.insertData("ALSoundLocalization/SoundLocated", [[12, 345], [0.8, 0.3, 0.1, 0.7]])
+    memory.insertData("ALVoiceEmotionAnalysis/EmotionRecognized", [[0], [0, 2, 0, 1, 0]])
+    memory.insertData("WordRecognized", ["bonjour", 0.8])
+    person_ids = list(range(1000, 1000 + people))
+    memory.insertData(PEOPLE_LIST, person_ids)
+    for index, person_id in enumerate(person_ids):
+        memory.insertData(f"PeoplePerception/Person/{person_id}/Distance", 1.0 + index)
+        memory.insertData(f"PeoplePerception/Person/{person_id}/IsVisible", True)
+
+
+def person_keys(snapshot):
+    return [f"PeoplePerception/Person/{person_id}/{field}"
+            for person_id in snapshot.get(PEOPLE_LIST) or [] for field in ("Distance", "IsVisible")]
+
+
+def legacy_voice_tick(memory):
+    return [memory.getData(key) for key in VOICE_KEYS]
+
+
+def legacy_presence_tick(memory):
+    people_list = memory.getData(PEOPLE_LIST)
+    for person_id in people_list or []:
+        memory.getData(f"PeoplePerception/Person/{person_id}/Distance")
+        memory.getData(f"PeoplePerception/Person/{person_id}/IsVisible")
+
+
+def measure(tick, memory, ticks):
+    rpc_before = memory.rpc_count
+    start = time.perf_counter()
+    for _ in range(ticks):
+        tick()
+    elapsed = time.perf_counter() - start
+    return (memory.rpc_count - rpc_before) / ticks, elapsed / ticks
+
+
+def sustained_rate(run_tick, interval, duration):
+    """Boucle de polling historique : lecture puis sleep(interval)"""
+    ticks = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        run_tick()
+        ticks += 1
+        time.sleep(interval)
+    return ticks / duration
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rpc_latency", type=float, default=0.008, help="Coût d'un aller-retour qi (s)")
+    parser.add_argument("--people", type=int, default=3)
+    parser.add_argument("--ticks", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--duration", type=float, default=2.0)
+    args = parser.parse_args()
+
+    memory = FakeMemory(rpc_latency=args.rpc_latency)
+    fill_memory(memory, args.people)
+
+    voice = ALMemorySnapshot(memory, interval=args.interval)
+    voice.watch(*VOICE_KEYS)
+    presence = ALMemorySnapshot(memory, interval=args.interval)
+    presence.watch(PEOPLE_LIST)
+    presence.add_dynamic(person_keys)
+    presence.poll_once()  # premier tick : découvre les personnes
+
+    # Le snapshot doit rendre exactement les mêmes valeurs que les getData
+    assert [voice.poll_once()[key] for key in VOICE_KEYS] == legacy_voice_tick(memory)
+    snapshot = presence.poll_once()
+    assert all(snapshot[key] == memory.data[key] for key in person_keys(snapshot))
+
+    loops = [
+        ("voix, getData", lambda: legacy_voice_tick(memory)),
+        ("voix, snapshot", voice.poll_once),
+        (f"présence ({args.people} pers.), getData", lambda: legacy_presence_tick(memory)),
+        (f"présence ({args.people} pers.), snapshot", presence.poll_once),
+    ]
+    print(f"RPC à {args.rpc_latency * 1000:.1f}ms\n")
+    print(f"{'boucle':<30} {'RPC/tick':>9} {'lecture/tick':>13}")
+    for name, tick in loops:
+        rpcs, seconds = measure(tick, memory, args.ticks)
+        print(f"{name:<30} {rpcs:>9.1f} {seconds * 1000:>11.2f}ms")
+
+    target = 1.0 / args.interval
+    print(f"\nCadence tenue pour {target:.0f} Hz demandés (voix) :")
+    legacy_rate = sustained_rate(lambda: legacy_voice_tick(memory), args.interval, args.duration)
+    print(f"{'getData + sleep':<30} {legacy_rate:>8.1f} Hz")
+    ticks_before = voice.ticks
+    voice.start()
+    time.sleep(args.duration)
+    voice.stop()
+    print(f"{'ALMemorySnapshot':<30} {(voice.ticks - ticks_before) / args.duration:>8.1f} Hz")
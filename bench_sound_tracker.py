@@ -0,0 +1,119 @@
+"""Banc du suivi de direction des sons : débit et justesse du locuteur dominant.
+
+    python bench_sound_tracker.py --samples 20000
+    python bench_sound_tracker.py --trace visite.jsonl
+
+Trace synthétique : un locuteur à +20° (puis à -35° à mi-parcours, tête tournée
+de 10°) et une source de bruit à -80° moins sûre. Une trace enregistrée
+(--record_trace de testOnPepperStreamingVocal.py) est rejouée telle quelle.
+"""
+import argparse
+import math
+import random
+import time
+
+import numpy as np
+
+from pepper_events import load_trace
+from sound_tracker import SoundDirectionTracker, angle_diff
+
+SOUND_KEY = "ALSoundLocalization/SoundLocated"
+
+
+def sound_event(t, azimuth, confidence, head_yaw):
+    head = [0.0, 0.0, 1.2, 0.0, 0.0, head_yaw]
+    return [[int(t), int((t % 1) * 1e6)], [azimuth - head_yaw, 0.1, confidence, 0.5], head, head]
+
+
+def synthetic_trace(samples, rate=20.0, seed=1):
+    """(t, valeur SoundLocated, azimut attendu du locuteur en repère torse)"""
+    rng = random.Random(seed)
+    events = []
+    for index in range(samples):
+        t = index / rate
+        second_half = index >= samples // 2
+        speaker = math.radians(-35 if second_half else 20)
+        head_yaw = math.radians(10) if second_half else 0.0
+        if rng.random() < 0.25:
+            azimuth, confidence = math.radians(-80) + rng.gauss(0, 0.15), rng.uniform(0.3, 0.5)
+        else:
+            azimuth, confidence = speaker + rng.gauss(0, 0.08), rng.uniform(0.5, 0.9)
+        events.append((t, sound_event(t, azimuth, confidence, head_yaw), speaker))
+    return events
+
+
+def legacy_scalar(events):
+    """Ancien traitement : arctan2/sqrt NumPy sur un échantillon scalaire à la fois"""
+    for _, value, _ in events:
+        x, y, z, confidence = value[1][:4]
+        np.arctan2(y, x) * 180 / np.pi
+        np.sqrt(x * x + y * y + z * z)
+
+
+def streaming(events, tracker):
+    """Chemin du client : chaque événement ajouté puis direction dominante recalculée"""
+    errors = []
+    for t, value, expected in events:
+        tracker.add_event(value, t)
+        direction = tracker.dominant(t)
+        if expected is not None and direction is not None:
+            errors.append(abs(angle_diff(direction.azimuth, expected)))
+    return errors
+
+
+def batch(events, tracker, chunk=256):
+    """Relecture hors ligne : ajout vectorisé par paquets, une direction par paquet"""
+    times = np.array([t for t, _, _ in events])
+    values = [value for _, value, _ in events]
+    azimuths = np.array([value[1][0] + value[2][5] for value in values])
+    confidences = np.array([value[1][2] for value in values])
+    keep = confidences >= tracker.min_confidence
+    directions = []
+    for start in range(0, len(events), chunk):
+        stop = start + chunk
+        mask = keep[start:stop]
+        tracker.add_batch(times[start:stop][mask], azimuths[start:stop][mask], confidences[start:stop][mask])
+        directions.append(tracker.dominant(times[min(stop, len(events)) - 1]))
+    return directions
+
+
+def rate(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--trace", nargs="*", default=[], help="Traces ALMemory enregistrées (JSON lines)")
+    parser.add_argument("--min_rate", type=float, default=5000.0,
+                        help="Code de sortie 1 si le chemin client traite moins d'échantillons/s")
+    args = parser.parse_args()
+
+    events = []
+    for path in args.trace:
+        events.extend((t, value, None) for t, key, value in load_trace(path) if key == SOUND_KEY)
+    if not events:
+        events = synthetic_trace(args.samples)
+    count = len(events)
+    print(f"🎵 {count} échantillons SoundLocated")
+
+    _, legacy_time = rate(legacy_scalar, events)
+    errors, streaming_time = rate(streaming, events, SoundDirectionTracker())
+    _, batch_time = rate(batch, events, SoundDirectionTracker())
+
+    print(f"{'ancien (scalaire, sans suivi)':<34} {count / legacy_time:>12.0f} éch./s")
+    print(f"{'suivi, événement par événement':<34} {count / streaming_time:>12.0f} éch./s")
+    print(f"{'suivi, relecture vectorisée':<34} {count / batch_time:>12.0f} éch./s")
+
+    failed = count / streaming_time < args.min_rate
+    if errors:
+        # Les instants au-delà de 30° correspondent au basculement vers le nouveau locuteur
+        settled = [error for error in errors if error < math.radians(30)]
+        median = math.degrees(float(np.median(errors)))
+        print(f"Erreur d'azimut du locuteur : médiane {median:.1f}°, "
+              f"{len(settled) / len(errors):.0%} des instants à moins de 30°")
+        failed = failed or median > 5.0
+    print("❌ Hors objectif" if failed else "✅ OK")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,193 @@
+"""Post-traitement des réponses : corpus de correction et micro-banc de débit.
+
+Chaque cas du corpus (sortie brute d'un LLM -> phrases attendues pour la TTS)
+est vérifié sur le texte complet puis en streaming, découpé en tokens de
+taille aléatoire ; l'ancien traitement (re.sub non compilés, split('. '),
+re-découpage du tampon à chaque token) est passé sur le même corpus pour
+comparaison. Le banc mesure ensuite le coût par token des deux versions.
+
+    python bench_speech_text.py
+    python bench_speech_text.py --tokens 20000 --seed 3
+"""
+import argparse
+import random
+import re
+import time
+
+from speech_text import SentenceStream, clean_response, split_sentences
+
+CORPUS = [
+    # Rôle, markdown, emojis
+    ("Assistant: **Bonjour** ! Je suis Pepper 😊. Que puis-je faire pour vous ?",
+     ["Bonjour !", "Je suis Pepper.", "Que puis-je faire pour vous ?"]),
+    ("Réponse : Bienvenue 👋 ! La conférence commence à 14h.",
+     ["Bienvenue !", "La conférence commence à 14h."]),
+    ("## Programme\n- Keynote à 14h en *salle A*\n- Atelier __robotique__ à 15h",
+     ["Programme", "Keynote à 14h en salle A", "Atelier robotique à 15h"]),
+    ("Voici le programme :\n1. Keynote à 14h.\n2. Atelier à 15h.",
+     ["Voici le programme :", "Keynote à 14h.", "Atelier à 15h."]),
+    ("Plus d'infos sur [le site de l'événement](https://exemple.fr/programme). Bonne visite !",
+     ["Plus d'infos sur le site de l'événement.", "Bonne visite !"]),
+    ("Le code `WIFI2024` vous donne accès au réseau. 🎉🎉",
+     ["Le code WIFI2024 vous donne accès au réseau."]),
+    # Ponctuation forte autre que le point
+    ("Vous cherchez la salle A ? Elle est au premier étage ! Prenez l'ascenseur à droite.",
+     ["Vous cherchez la salle A ?", "Elle est au premier étage !", "Prenez l'ascenseur à droite."]),
+    ("Hmm… Je crois que c'est au fond du hall. Je vérifie...",
+     ["Hmm…", "Je crois que c'est au fond du hall.", "Je vérifie..."]),
+    ("Il y a des ateliers, des stands, etc. et un cocktail le soir. Ça vous tente ?",
+     ["Il y a des ateliers, des stands, etc. et un cocktail le soir.", "Ça vous tente ?"]),
+    ("C'est quoi ?! Je n'en sais rien.", ["C'est quoi ?!", "Je n'en sais rien."]),
+    # Abréviations, nombres, guillemets
+    ("M. Dupont vous attend à l'accueil. Mme. Martin arrive à 15h.",
+     ["M. Dupont vous attend à l'accueil.", "Mme. Martin arrive à 15h."]),
+    ("Le Dr. Bernard présente la version 2.5 du robot. Elle pèse 28.4 kg.",
+     ["Le Dr. Bernard présente la version 2.5 du robot.", "Elle pèse 28.4 kg."]),
+    ("Consultez p. ex. le plan à l'entrée. Il est affiché sur www.exemple.fr. Merci !",
+     ["Consultez p. ex. le plan à l'entrée.", "Il est affiché sur www.exemple.fr.", "Merci !"]),
+    ("Le thème est « Robots et société. » Les débats commencent à 16h.",
+     ["Le thème est « Robots et société. »", "Les débats commencent à 16h."]),
+    ('Il a dit "bienvenue." Puis il est parti.', ['Il a dit "bienvenue."', "Puis il est parti."]),
+    ("Nous sommes en 2024. Le salon fête ses 10 ans.", ["Nous sommes en 2024.", "Le salon fête ses 10 ans."]),
+    # Blancs et réponses vides
+    ("  Bonjour   à   tous .  ", ["Bonjour à tous."]),
+    ("La salle A.\n\nJe peux vous y conduire.", ["La salle A.", "Je peux vous y conduire."]),
+    ("Bonjour ! Bienvenue au salon.", ["Bonjour !", "Bienvenue au salon."]),
+    ("😊", []),
+    ("", []),
+    ("Sans ponctuation finale", ["Sans ponctuation finale"]),
+]
+
+# Sortie typique de Gemma pour le banc de débit
+BENCH_TEXT = ("Bonjour et bienvenue au salon ! La keynote d'ouverture commence à 14h en salle A, "
+              "puis M. Dupont présente les nouveautés du robot Pepper. Les ateliers ont lieu au premier étage, "
+              "etc. et le cocktail est servi à 18h30 sur la terrasse… Voulez-vous que je vous y accompagne ? ")
+
+
+class LegacyAccumulator(object):
+    """Ancien traitement (SentenceAccumulator + _clean_response), pour comparaison"""
+    SENTENCE_END_RE = re.compile(r'(?<=[.!?…])\s+')
+
+    def __init__(self, max_sentences):
+        self.max_sentences = max_sentences
+        self.buffer = ""
+        self.sentences = []
+
+    @property
+    def limit_reached(self):
+        return self.max_sentences is not None and len(self.sentences) >= self.max_sentences
+
+    @staticmethod
+    def clean(response):
+        response = re.sub(r'^(Assistant|A):\s*', '', response)
+        response = re.sub(r'^(Réponse|Response):\s*', '', response)
+        response = response.replace('*', '').replace('#', '')
+        sentences = response.split('. ')
+        if len(sentences) > 2:
+            response = '. '.join(sentences[:2]) + '.'
+        return response.strip()
+
+    def feed(self, token):
+        self.buffer += token
+        parts = self.SENTENCE_END_RE.split(self.buffer)
+        self.buffer = parts[-1]
+        return self._accept([p for p in parts[:-1] if p.strip()])
+
+    def flush(self):
+        rest, self.buffer = self.buffer, ""
+        return self._accept([rest])
+
+    def _accept(self, candidates):
+        new_sentences = []
+        for sentence in candidates:
+            if self.limit_reached:
+                break
+            sentence = self.clean(sentence)
+            if sentence:
+                self.sentences.append(sentence)
+                new_sentences.append(sentence)
+        return new_sentences
+
+
+def tokenize(text, rng, max_size=6):
+    """Découpe en morceaux de 1 à max_size caractères, comme les tokens d'Ollama"""
+    tokens = []
+    index = 0
+    while index < len(text):
+        size = rng.randint(1, max_size)
+        tokens.append(text[index:index + size])
+        index += size
+    return tokens
+
+
+def stream(processor, tokens):
+    sentences = []
+    for token in tokens:
+        sentences += processor.feed(token)
+    return sentences + processor.flush()
+
+
+def check_corpus(rng, rounds):
+    checks = []
+    legacy_ok = 0
+    for raw, expected in CORPUS:
+        whole = split_sentences(raw)
+        streamed = [stream(SentenceStream(None), tokenize(raw, rng)) for _ in range(rounds)]
+        ok = whole == expected and all(result == expected for result in streamed)
+        if not ok:
+            print(f"❌ {raw!r}\n   attendu : {expected}\n   obtenu  : {whole}, "
+                  f"{[result for result in streamed if result != expected][:1]}")
+        checks.append(ok)
+        legacy_ok += stream(LegacyAccumulator(None), tokenize(raw, rng)) == expected
+    print(f"📚 Corpus : {sum(checks)}/{len(CORPUS)} corrects (ancien traitement : {legacy_ok}/{len(CORPUS)})")
+    return all(checks)
+
+
+def throughput(factory, tokens, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        stream(factory(), tokens)
+    return (time.perf_counter() - start) / (repeat * len(tokens)) * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=5000, help="Tokens par flux pour la réponse longue")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    checks = [("corpus de correction, texte complet et streaming", check_corpus(rng, rounds=20))]
+    checks.append(("réponse complète limitée à 2 phrases",
+                   clean_response("Assistant: Un. Deux ! Trois ?", 2) == "Un. Deux !"))
+    early = SentenceStream(2)
+    fed = 0
+    for token in tokenize(BENCH_TEXT * 3, rng, 4):
+        fed += 1
+        early.feed(token)
+        if early.limit_reached:
+            break
+    checks.append(("arrêt signalé dès la 2e phrase", early.limit_reached and fed < len(BENCH_TEXT) // 3))
+
+    short_tokens = tokenize(BENCH_TEXT, rng, 4)
+    long_tokens = tokenize(BENCH_TEXT * (args.tokens * 4 // len(BENCH_TEXT) + 1), rng, 4)[:args.tokens]
+    print(f"\n{'flux':<34}{'ancien':>10}{'nouveau':>10}  (µs par token)")
+    results = {}
+    for label, tokens, max_sentences, repeat in (
+            ("réponse du serveur (2 phrases)", short_tokens, 2, args.repeat * 50),
+            ("réponse entière (5 phrases)", short_tokens, None, args.repeat * 50),
+            (f"flux long ({len(long_tokens)} tokens)", long_tokens, None, max(1, args.repeat // 4))):
+        legacy = throughput(lambda: LegacyAccumulator(max_sentences), tokens, repeat)
+        new = throughput(lambda: SentenceStream(max_sentences), tokens, repeat)
+        results[label] = (legacy, new)
+        print(f"{label:<34}{legacy:>10.2f}{new:>10.2f}")
+    _, new_long = results[f"flux long ({len(long_tokens)} tokens)"]
+    _, new_full = results["réponse entière (5 phrases)"]
+    # Tampon analysé une seule fois : le coût par token ne grandit pas avec la longueur du flux
+    checks.append(("flux long : coût par token borné", new_long < 2 * new_full))
+
+    print()
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    raise SystemExit(0 if all(ok for _, ok in checks) else 1)
@@ -0,0 +1,264 @@
+"""Banc de réglage : options Ollama et prompt système comparés sur un corpus d'énoncés.
+
+Chaque configuration (jeu d'options × prompt système) rejoue le même corpus dans
+OptimizedGemma2Server.process_with_gemma2, visiteur par visiteur (l'historique
+grandit comme sur le robot), contre le faux Ollama ou un Ollama réel (--backend).
+Par tour : latence, tokens évalués par Ollama (prompt / génération), longueur
+de la réponse après clean_response, réponse de secours (repli).
+
+    python bench_tuning.py
+    python bench_tuning.py --backend http://192.168.1.17:11434=gemma2:9b --trace visite.jsonl
+    python bench_tuning.py --config pepper.json --matrix matrice.json --corpus corpus.json --json reglage.json
+
+Corpus (--corpus) : liste de visiteurs, chacun une liste d'énoncés, texte ou
+{"text": ..., "expect": [mots attendus]} ; les traces --record_trace du client
+(--trace) sont découpées en énoncés puis en visiteurs. Matrice (--matrix) :
+{"options": {nom: options Ollama modifiées}, "prompts": {nom: prompt système}},
+options appliquées sur la section "generation" de --config.
+
+Une réponse est correcte si ce n'est pas un repli, qu'elle ne s'arrête pas au
+milieu d'une phrase (num_predict trop court) et qu'elle contient un des mots
+attendus s'il y en a. La configuration retenue est la plus rapide (p50) parmi
+celles qui répondent correctement assez souvent (--min_proper).
+"""
+import argparse
+import json
+import statistics
+import time
+
+from bench_pipeline import percentile, split_into_utterances
+from canned_replies import FALLBACK_RESPONSES
+from fake_ollama import FakeOllama
+from gemma2_server import OptimizedGemma2Server
+from llm_router import parse_backend
+from pepper_config import Config, DEFAULT_MODEL, merge
+from pepper_events import load_trace
+from response_cache import ResponseCache
+
+CORPUS = [
+    ["bonjour Pepper", "où sont les toilettes", "à quelle heure commence la keynote"],
+    ["est-ce qu'il reste des places pour l'atelier robotique", "c'est à quel étage", "merci beaucoup"],
+    ["où est le vestiaire", "je peux y laisser ma valise", "et le wifi c'est quoi le code"],
+    ["qu'est-ce qu'il y a au programme cet après-midi", "qui présente la table ronde", "au revoir Pepper"],
+]
+
+OPTION_SETS = {
+    "config": {},
+    "num_predict 60": {"num_predict": 60},
+    "num_predict 32": {"num_predict": 32},
+    "num_predict 20": {"num_predict": 20},
+    "num_ctx 2048": {"num_ctx": 2048},
+    "top_k 20": {"top_k": 20, "repeat_penalty": 1.05},
+}
+BRIEF_PROMPT = "Tu es Pepper, robot d'accueil d'un événement. Réponds en une ou deux phrases courtes."
+
+# Réponse du faux Ollama : deux phrases dites par Pepper, une troisième coupée par max_sentences
+TUNING_REPLY = ("Les toilettes sont au rez-de-chaussée, juste à droite de l'accueil principal. "
+                "Vous pouvez aussi utiliser celles du premier étage, près de la salle A. "
+                "Je reste à votre disposition si vous avez d'autres questions sur l'événement.")
+SENTENCE_END = ".!?…»\""
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        visitors = json.load(f)
+    return [[turn if isinstance(turn, dict) else {"text": turn} for turn in visitor] for visitor in visitors]
+
+
+def trace_corpus(paths, visitor_gap):
+    """Énoncés des traces du client (mots reconnus comme VoiceToLLM), regroupés par visiteur"""
+    events = sorted((event for path in paths for event in load_trace(path)), key=lambda event: event[0])
+    visitors = []
+    last_end = None
+    for utterance in split_into_utterances(events):
+        words = []
+        for _, key, value in utterance:
+            if key == "WordRecognized" and value and len(value) >= 2 and value[0].strip() and value[1] > 0.4:
+                if not words or value[0].strip() != words[-1]:
+                    words.append(value[0].strip())
+        if not words:
+            continue
+        if last_end is None or utterance[0][0] - last_end > visitor_gap:
+            visitors.append([])
+        visitors[-1].append({"text": " ".join(words)})
+        last_end = utterance[-1][0]
+    return visitors
+
+
+def build_matrix(path, base_prompt):
+    options, prompts = dict(OPTION_SETS), {"config": base_prompt, "bref": BRIEF_PROMPT}
+    if path:
+        with open(path, encoding='utf-8') as f:
+            matrix = json.load(f)
+        options = matrix.get("options") or {"config": {}}
+        prompts = matrix.get("prompts") or {"config": base_prompt}
+    return [(option_name, option_set, prompt_name, prompt)
+            for option_name, option_set in options.items() for prompt_name, prompt in prompts.items()]
+
+
+def make_server(backend_spec, config, options, system_prompt):
+    # Backend neuf par configuration : pas d'état de disjoncteur hérité de la précédente
+    server = OptimizedGemma2Server(port=0, pepper_port=0, backends=[parse_backend(backend_spec, DEFAULT_MODEL)])
+    server.response_cache = ResponseCache(max_entries=0)
+    if config is not None:
+        server.apply_config(config)
+    server.apply_generation_options(merge(server.generation_options, options))
+    server.system_prompt = system_prompt
+    return server
+
+
+def counter(server, name):
+    return server.metrics.counters.get((name, ()), 0)
+
+
+def play_turn(server, session, turn):
+    prompt_tokens = counter(server, "ollama_prompt_tokens_total")
+    eval_tokens = counter(server, "ollama_eval_tokens_total")
+    start = time.time()
+    answer = server.process_with_gemma2(session, [{'conversation_text': turn["text"]}])
+    latency = time.time() - start
+    fallback = answer in FALLBACK_RESPONSES
+    complete = answer.rstrip()[-1:] in tuple(SENTENCE_END) if answer else False
+    expect = turn.get("expect") or []
+    relevant = not expect or any(word.lower() in answer.lower() for word in expect)
+    return {
+        'latency': latency,
+        'prompt_tokens': counter(server, "ollama_prompt_tokens_total") - prompt_tokens,
+        'eval_tokens': counter(server, "ollama_eval_tokens_total") - eval_tokens,
+        'words': len(answer.split()),
+        'fallback': fallback,
+        'complete': complete,
+        'proper': not fallback and complete and relevant,
+        'answer': answer,
+    }
+
+
+def run_configuration(backend_spec, config, corpus, option_set, system_prompt, rounds, warmup):
+    server = make_server(backend_spec, config, option_set, system_prompt)
+    # Premier appel hors mesure : chargement du modèle (num_ctx modifié = rechargement côté Ollama)
+    for index in range(warmup):
+        server.process_with_gemma2(server.get_session({'robot_id': f"warmup-{index}"}, ("127.0.0.1", 0)),
+                                   [{'conversation_text': "bonjour"}])
+    turns = []
+    for round_index in range(rounds):
+        for visitor_index, visitor in enumerate(corpus):
+            session = server.get_session({'robot_id': f"visitor-{round_index}-{visitor_index}"}, ("127.0.0.1", 0))
+            for turn in visitor:
+                turns.append(dict(play_turn(server, session, turn), text=turn["text"]))
+    server.executor.shutdown(wait=True)
+    return turns
+
+
+def summarize(turns):
+    latencies = [turn['latency'] for turn in turns]
+    return {
+        'n': len(turns),
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'prompt_tokens': statistics.mean(turn['prompt_tokens'] for turn in turns),
+        'eval_tokens': statistics.mean(turn['eval_tokens'] for turn in turns),
+        'words': statistics.mean(turn['words'] for turn in turns),
+        'fallback_rate': sum(turn['fallback'] for turn in turns) / len(turns),
+        'proper_rate': sum(turn['proper'] for turn in turns) / len(turns),
+    }
+
+
+def choose(results, min_proper):
+    """Configuration la plus rapide parmi celles qui répondent correctement assez souvent"""
+    eligible = [result for result in results if result['summary']['proper_rate'] >= min_proper]
+    return min(eligible, key=lambda result: result['summary']['p50']) if eligible else None
+
+
+def print_report(results, chosen):
+    baseline = results[0]['summary']
+    print(f"\n{'options':<16}{'prompt':<8}{'p50':>8}{'p95':>8}{'Δp50':>8}{'tok prompt':>11}{'tok gén.':>9}"
+          f"{'mots':>6}{'replis':>8}{'corrects':>10}")
+    for result in sorted(results, key=lambda result: result['summary']['p50']):
+        summary = result['summary']
+        mark = " ⭐" if result is chosen else ""
+        print(f"{result['options_name']:<16}{result['prompt_name']:<8}"
+              f"{summary['p50'] * 1000:>6.0f}ms{summary['p95'] * 1000:>6.0f}ms"
+              f"{(summary['p50'] - baseline['p50']) * 1000:>+6.0f}ms"
+              f"{summary['prompt_tokens']:>11.0f}{summary['eval_tokens']:>9.0f}{summary['words']:>6.1f}"
+              f"{summary['fallback_rate']:>8.0%}{summary['proper_rate']:>10.0%}{mark}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", default=None,
+                        help="Ollama réel, http://hote:11434[=modele] (défaut : faux Ollama local)")
+    parser.add_argument("--config", default=None, help="Fichier de config : options et prompt de référence")
+    parser.add_argument("--matrix", default=None, help="Jeux d'options et prompts à comparer (JSON)")
+    parser.add_argument("--corpus", default=None, help="Énoncés enregistrés par visiteur (JSON)")
+    parser.add_argument("--trace", nargs="*", default=[], help="Traces --record_trace du client")
+    parser.add_argument("--visitor_gap", type=float, default=15.0,
+                        help="Silence (s) entre deux énoncés d'une trace au-delà duquel c'est un autre visiteur")
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=1, help="Appels non mesurés avant chaque configuration")
+    parser.add_argument("--min_proper", type=float, default=0.95,
+                        help="Part minimale de réponses correctes pour retenir une configuration")
+    parser.add_argument("--tokens_per_second", type=float, default=400.0, help="Débit du faux Ollama")
+    parser.add_argument("--prompt_tokens_per_second", type=float, default=800.0)
+    parser.add_argument("--json", default=None, help="Écrit le rapport complet (tours compris)")
+    args = parser.parse_args()
+
+    config = Config.load(args.config) if args.config else None
+    base_prompt = (config or Config.load()).get("conversation", "system_prompt")
+    corpus = load_corpus(args.corpus) if args.corpus else [[{"text": text} for text in visitor] for visitor in CORPUS]
+    if args.trace:
+        corpus += trace_corpus(args.trace, args.visitor_gap)
+    matrix = build_matrix(args.matrix, base_prompt)
+
+    ollama = None
+    backend_spec = args.backend
+    if backend_spec is None:
+        ollama = FakeOllama(tokens_per_second=args.tokens_per_second,
+                            prompt_tokens_per_second=args.prompt_tokens_per_second, reply=TUNING_REPLY).start()
+        backend_spec = ollama.url
+
+    print(f"🎛️  {len(matrix)} configurations × {sum(len(visitor) for visitor in corpus) * args.rounds} tours "
+          f"({len(corpus)} visiteurs) sur {parse_backend(backend_spec, DEFAULT_MODEL).name}")
+    results = []
+    try:
+        for options_name, option_set, prompt_name, prompt in matrix:
+            turns = run_configuration(backend_spec, config, corpus, option_set, prompt, args.rounds, args.warmup)
+            summary = summarize(turns)
+            print(f"   {options_name} / {prompt_name} : p50 {summary['p50'] * 1000:.0f}ms, "
+                  f"{summary['proper_rate']:.0%} corrects")
+            results.append({'options_name': options_name, 'options': option_set, 'prompt_name': prompt_name,
+                            'prompt': prompt, 'summary': summary, 'turns': turns})
+    finally:
+        if ollama is not None:
+            ollama.stop()
+
+    chosen = choose(results, args.min_proper)
+    print_report(results, chosen)
+    if chosen is None:
+        print(f"\n❌ Aucune configuration ne répond correctement à {args.min_proper:.0%}")
+    else:
+        print(f"\n⭐ Retenue : {chosen['options_name']} / {chosen['prompt_name']}, options {chosen['options']}")
+        for turn in chosen['turns'][:3]:
+            print(f"   « {turn['text']} » -> « {turn['answer']} »")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"results": results, "chosen": chosen and [chosen['options_name'], chosen['prompt_name']],
+                       "args": vars(args)}, f, indent=2, ensure_ascii=False)
+
+    if ollama is not None:
+        # Faux Ollama : réponse connue, les écarts entre configurations sont attendus
+        by_name = {(result['options_name'], result['prompt_name']): result['summary'] for result in results}
+        checks = []
+        if ("num_predict 20", "config") in by_name:
+            checks.append(("num_predict trop court : réponses tronquées non retenues",
+                           by_name[("num_predict 20", "config")]['proper_rate'] < args.min_proper
+                           and chosen is not None and chosen['options_name'] != "num_predict 20"))
+        if chosen is not None and ("config", "config") in by_name:
+            checks.append(("configuration retenue plus rapide que la config de base",
+                           chosen['summary']['p50'] < by_name[("config", "config")]['p50']))
+        checks.append(("aucun repli", all(result['summary']['fallback_rate'] == 0 for result in results)))
+        print()
+        for label, ok in checks:
+            print(f"   {'✅' if ok else '❌'} {label}")
+        raise SystemExit(0 if all(ok for _, ok in checks) else 1)
+    raise SystemExit(0 if chosen is not None else 1)
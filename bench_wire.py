@@ -0,0 +1,73 @@
+"""Micro-banc des formats de datagrammes : débit encodage/décodage et taille.
+
+    python bench_wire.py --iterations 50000
+
+"json (avant)" reproduit l'ancien encodage (json.dumps par défaut + UTF-8).
+"""
+import argparse
+import json
+import time
+
+import wire_format
+
+SAMPLES = [
+    {"type": "conversation_start", "timestamp": 1718000000.123, "utterance_id": 42, "robot_id": "pepper-accueil"},
+    {"type": "speech_chunk", "timestamp": 1718000000.456, "words": "bonjour", "confidence": 0.82,
+     "utterance_id": 42, "robot_id": "pepper-accueil"},
+    {"type": "conversation_end", "timestamp": 1718000001.789,
+     "conversation_text": "bonjour où se trouve la salle de conférence principale", "utterance_id": 42,
+     "speculative": True, "robot_id": "pepper-accueil"},
+    {"type": "llm_response", "text": "La salle de conférence principale est au premier étage, à gauche.",
+     "timestamp": 1718000002.012, "model": "gemma2:9b", "turn_id": 1718000000000, "seq": 0, "final": False,
+     "utterance_id": 42},
+]
+
+
+def legacy_encode(msg):
+    return json.dumps(msg, ensure_ascii=False).encode('utf-8')
+
+
+def legacy_decode(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def measure(encode, decode, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for msg in SAMPLES:
+            encode(msg)
+    encode_time = time.perf_counter() - start
+
+    encoded = [encode(msg) for msg in SAMPLES]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for data in encoded:
+            decode(data)
+    decode_time = time.perf_counter() - start
+
+    count = iterations * len(SAMPLES)
+    return count / encode_time, count / decode_time, [len(data) for data in encoded]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    for msg in SAMPLES:
+        for codec in wire_format.CODECS:
+            decoded, detected = wire_format.decode(wire_format.encode(msg, codec))
+            assert detected == codec, (codec, detected)
+            assert decoded.keys() == msg.keys(), (codec, decoded)
+
+    codecs = [("json (avant)", legacy_encode, legacy_decode)]
+    for codec in wire_format.CODECS:
+        codecs.append((codec, lambda msg, codec=codec: wire_format.encode(msg, codec),
+                       lambda data: wire_format.decode(data)[0]))
+
+    types = [msg["type"] for msg in SAMPLES]
+    print(f"{'format':<14} {'encode/s':>10} {'decode/s':>10}   " + "  ".join(f"{t[:12]:>12}" for t in types))
+    for name, encode, decode in codecs:
+        encode_rate, decode_rate, sizes = measure(encode, decode, args.iterations)
+        print(f"{name:<14} {encode_rate:>10.0f} {decode_rate:>10.0f}   "
+              + "  ".join(f"{size:>10} o" for size in sizes))
@@ -0,0 +1,19 @@
+"""Réponses fixes du serveur, partagées avec le client Pepper (qui en garde l'audio prêt)."""
+
+FALLBACK_NOT_UNDERSTOOD = "Je n'ai pas bien compris. Pouvez-vous répéter ?"
+FALLBACK_TECHNICAL = "Je rencontre un problème technique. Pouvez-vous réessayer ?"
+FALLBACK_TIMEOUT = "Désolé, je réfléchis trop lentement. Pouvez-vous répéter ?"
+FALLBACK_ERROR = "Je n'ai pas pu traiter votre demande. Reformulez s'il vous plaît."
+FALLBACK_BUSY = "Je suis très sollicité en ce moment. Pouvez-vous reposer votre question dans un instant ?"
+FALLBACK_RESPONSES = (FALLBACK_NOT_UNDERSTOOD, FALLBACK_TECHNICAL, FALLBACK_TIMEOUT, FALLBACK_ERROR, FALLBACK_BUSY)
+FALLBACK_KINDS = {
+    FALLBACK_NOT_UNDERSTOOD: "not_understood",
+    FALLBACK_TECHNICAL: "technical",
+    FALLBACK_TIMEOUT: "timeout",
+    FALLBACK_ERROR: "error",
+    FALLBACK_BUSY: "busy",
+}
+# Réponse d'attente immédiate quand la file dépasse le budget
+FILLER_WAIT = "Un instant…"
+# Tout ce que le serveur peut dire sans passer par le LLM
+CANNED_REPLIES = FALLBACK_RESPONSES + (FILLER_WAIT,)
@@ -0,0 +1,136 @@
+"""Historique de conversation d'une session, rangé sous un budget de tokens.
+
+Les échanges (question, réponse) vont dans une deque bornée à max_turns.
+pack(budget) garde les plus récents qui tiennent dans le budget, précédés du
+résumé des plus anciens : un échange très long ne fait plus exploser le
+prompt-eval, et plusieurs échanges courts passent là où il n'en passait que 3.
+
+Les échanges qui ne tiennent plus (hors budget ou sortis de la deque)
+attendent un résumé : le serveur appelle summary_request() quand la session
+est inactive, fait résumer par le LLM, puis apply_summary(). Tant qu'aucun
+résumé n'a abouti, ils sont simplement absents du prompt, comme avant.
+Un résumé en échec n'est redemandé qu'après un délai qui double à chaque
+échec (SUMMARY_RETRY, plafonné à SUMMARY_RETRY_MAX).
+"""
+import collections
+import math
+import threading
+import time
+
+# Délai avant de redemander un résumé après un échec (s), doublé à chaque échec consécutif
+SUMMARY_RETRY = 15.0
+SUMMARY_RETRY_MAX = 600.0
+
+Exchange = collections.namedtuple("Exchange", "question answer tokens")
+
+
+def estimate_tokens(text):
+    """Approximation du tokenizer Gemma sur du français : ~3,5 caractères par token"""
+    return int(math.ceil(len(text) / 3.5)) if text else 0
+
+
+def format_exchange(question, answer):
+    return f"H: {question}\nA: {answer}"
+
+
+class ContextWindow(object):
+    def __init__(self, max_turns=8):
+        self.max_turns = max_turns
+        self.turns = collections.deque()
+        self.overflow = []  # sortis de la deque, pas encore résumés
+        self.summary = ""
+        self.lock = threading.Lock()
+        self.epoch = 0  # change à chaque reset : un résumé en cours n'est plus appliqué
+        self.summarizing = False
+        self.summary_failures = 0
+        self.summary_retry_at = 0.0
+        self.last_update = 0.0
+
+    def __len__(self):
+        with self.lock:
+            return len(self.turns)
+
+    def append(self, question, answer, now=None):
+        exchange = Exchange(question, answer, estimate_tokens(format_exchange(question, answer)) + 1)
+        with self.lock:
+            self.turns.append(exchange)
+            while len(self.turns) > self.max_turns:
+                self.overflow.append(self.turns.popleft())
+            # Sans résumé qui aboutisse, on n'accumule pas indéfiniment
+            del self.overflow[:-self.max_turns]
+            self.last_update = now or time.time()
+
+    def last_question(self):
+        with self.lock:
+            return self.turns[-1].question if self.turns else ""
+
+    def reset(self):
+        with self.lock:
+            self.turns.clear()
+            self.overflow = []
+            self.summary = ""
+            self.epoch += 1
+            self.summarizing = False
+            self.summary_failures = 0
+            self.summary_retry_at = 0.0
+            self.last_update = 0.0
+
+    def _pack(self, budget):
+        summary = self.summary
+        used = estimate_tokens(summary)
+        if used > budget:
+            summary, used = "", 0
+        kept = []
+        # Du plus récent au plus ancien, sans trou : on s'arrête au premier qui ne tient pas
+        for exchange in reversed(self.turns):
+            if used + exchange.tokens > budget:
+                break
+            kept.append(exchange)
+            used += exchange.tokens
+        kept.reverse()
+        return summary, kept, used
+
+    def pack(self, budget):
+        """(résumé, échanges retenus du plus ancien au plus récent, tokens utilisés)"""
+        with self.lock:
+            return self._pack(budget)
+
+    def render(self, budget):
+        """Historique pour le prompt (texte, tokens estimés) ; texte vide sans historique"""
+        summary, kept, used = self.pack(budget)
+        lines = [f"Résumé: {summary}"] if summary else []
+        lines.extend(format_exchange(exchange.question, exchange.answer) for exchange in kept)
+        return "\n".join(lines), used
+
+    def summary_request(self, budget, now=None):
+        """(epoch, résumé actuel, échanges à résumer) ou None ; marque un résumé en cours"""
+        with self.lock:
+            if self.summarizing or (now or time.time()) < self.summary_retry_at:
+                return None
+            _, kept, _ = self._pack(budget)
+            dropped = list(self.turns)[:len(self.turns) - len(kept)]
+            folded = self.overflow + dropped
+            if not folded:
+                return None
+            self.summarizing = True
+            return self.epoch, self.summary, folded
+
+    def apply_summary(self, request, summary, now=None):
+        """Remplace les échanges résumés par le résumé ; summary None = échec, on réessaiera plus tard"""
+        epoch, _, folded = request
+        with self.lock:
+            if epoch != self.epoch:
+                return False
+            self.summarizing = False
+            if not summary:
+                self.summary_failures += 1
+                delay = min(SUMMARY_RETRY_MAX, SUMMARY_RETRY * 2 ** (self.summary_failures - 1))
+                self.summary_retry_at = (now or time.time()) + delay
+                return False
+            self.summary_failures = 0
+            self.summary_retry_at = 0.0
+            folded_ids = {id(exchange) for exchange in folded}
+            self.overflow = [exchange for exchange in self.overflow if id(exchange) not in folded_ids]
+            self.turns = collections.deque(exchange for exchange in self.turns if id(exchange) not in folded_ids)
+            self.summary = summary
+            return True
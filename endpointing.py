@@ -0,0 +1,125 @@
+import collections
+
+SPECULATIVE = "speculative"
+FINAL = "final"
+RETRACT = "retract"
+
+
+class FixedEndpointer(object):
+    """Comportement historique : fin 1.5s après le DÉBUT de parole, une fois SpeechDetected à 0"""
+
+    def __init__(self, silence_timeout=1.5):
+        self.silence_timeout = silence_timeout
+        self.reset()
+
+    def reset(self):
+        self.speech_active = False
+        self.speech_start_time = None
+
+    def on_speech(self, active, t):
+        if active and self.speech_start_time is None:
+            self.speech_start_time = t
+        self.speech_active = active
+        return None
+
+    def on_word(self, word, confidence, t):
+        return None
+
+    def update(self, t):
+        if self.speech_start_time is None or self.speech_active:
+            return None
+        if t - self.speech_start_time > self.silence_timeout:
+            self.reset()
+            return FINAL
+        return None
+
+
+class AdaptiveEndpointer(object):
+    """Fin d'énoncé mesurée depuis le dernier mot reconnu, seuil adaptatif.
+
+    Le seuil part de base_timeout, ne descend jamais sous ~1.5x les pauses
+    habituelles entre mots (percentile 90 des dernières pauses), s'allonge
+    après un seul mot ou un mot peu sûr et se raccourcit pour les longues phrases.
+    Une fin spéculative est proposée à speculative_ratio du seuil ; si un mot
+    arrive ensuite, on_word renvoie RETRACT.
+    """
+
+    def __init__(self, base_timeout=0.6, min_timeout=0.35, max_timeout=1.5,
+                 speculative_ratio=0.5, pause_history=200):
+        self.base_timeout = base_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.speculative_ratio = speculative_ratio
+        # Pauses inter-mots des énoncés précédents (conservées entre deux reset)
+        self.pauses = collections.deque(maxlen=pause_history)
+        self.reset()
+
+    def reset(self):
+        self.speech_active = False
+        self.speech_start_time = None
+        self.speech_end_time = None
+        self.last_word_time = None
+        self.last_confidence = 1.0
+        self.word_count = 0
+        self.speculative_sent = False
+
+    def on_speech(self, active, t):
+        if active and self.speech_start_time is None:
+            self.speech_start_time = t
+        if self.speech_active and not active:
+            self.speech_end_time = t
+        resumed = active and not self.speech_active
+        self.speech_active = active
+        if resumed and self.speculative_sent:
+            self.speculative_sent = False
+            return RETRACT
+        return None
+
+    def on_word(self, word, confidence, t):
+        if self.speech_start_time is None:
+            self.speech_start_time = t
+        if self.last_word_time is not None:
+            self.pauses.append(t - self.last_word_time)
+        self.last_word_time = t
+        self.last_confidence = confidence
+        self.word_count += 1
+        if self.speculative_sent:
+            self.speculative_sent = False
+            return RETRACT
+        return None
+
+    def pause_floor(self):
+        if len(self.pauses) < 5:
+            return 0.0
+        ordered = sorted(self.pauses)
+        return 1.5 * ordered[int(0.9 * (len(ordered) - 1))]
+
+    def silence_threshold(self):
+        threshold = max(self.base_timeout, self.pause_floor())
+        if self.word_count <= 1:
+            threshold *= 1.3
+        elif self.word_count > 6:
+            threshold *= 0.85
+        if self.last_confidence < 0.6:
+            threshold *= 1.0 + (0.6 - self.last_confidence)
+        return min(self.max_timeout, max(self.min_timeout, threshold))
+
+    def update(self, t):
+        if self.speech_start_time is None or self.speech_active:
+            return None
+        if self.last_word_time is None:
+            # Bruit sans mot reconnu : on abandonne après le délai maximal
+            if t - self.speech_start_time > self.max_timeout:
+                self.reset()
+                return FINAL
+            return None
+
+        silence = t - max(self.last_word_time, self.speech_end_time or 0.0)
+        threshold = self.silence_threshold()
+        if silence >= threshold:
+            self.reset()
+            return FINAL
+        if not self.speculative_sent and silence >= threshold * self.speculative_ratio:
+            self.speculative_sent = True
+            return SPECULATIVE
+        return None
@@ -0,0 +1,179 @@
+"""Serveur HTTP qui imite Ollama (/api/generate, /api/embeddings, /api/tags) pour les bancs d'essai.
+
+Débit de tokens, coût du prompt-eval, latence et taux d'erreur sont configurables ;
+chaque requête est horodatée (premier / dernier token) dans FakeOllama.requests.
+
+    python fake_ollama.py --port 11434 --tokens_per_second 40
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = ("Bonjour, je suis Pepper, ravi de vous accueillir. "
+                 "Je peux vous guider dans l'événement. "
+                 "N'hésitez pas à me poser vos questions sur le programme.")
+
+
+class FakeOllama(object):
+    def __init__(self, host="127.0.0.1", port=0, tokens_per_second=50.0, prompt_tokens_per_second=800.0,
+                 latency=0.0, failure_rate=0.0, reply=DEFAULT_REPLY, seed=0):
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.reply = reply
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.active = 0
+
+        handler = type("FakeOllamaHandler", (FakeOllamaHandler,), {"ollama": self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://{host}:{self.port}/api/generate"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.failure_rate
+
+    def tokens_for(self, payload):
+        words = self.reply.split(" ")
+        return [word if index == 0 else " " + word for index, word in enumerate(words)]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ollama = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json(200, {"models": [{"name": "gemma2:9b"}]})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        ollama = self.ollama
+
+        if ollama.latency:
+            time.sleep(ollama.latency)
+        if ollama.should_fail():
+            self.send_json(500, {"error": "injected failure"})
+            return
+
+        if self.path == "/api/embeddings":
+            text = payload.get("prompt", "")
+            vector = [0.0] * 16
+            for index, char in enumerate(text.lower()):
+                vector[(ord(char) + index) % 16] += 1.0
+            self.send_json(200, {"embedding": vector})
+            return
+        if self.path != "/api/generate":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        self.generate(payload)
+
+    def generate(self, payload):
+        ollama = self.ollama
+        record = {'received': time.time(), 'payload': payload, 'first_token': None, 'last_token': None,
+                  'aborted': False}
+        with ollama.lock:
+            ollama.requests.append(record)
+            ollama.active += 1
+        try:
+            prompt = payload.get("prompt", "")
+            context = payload.get("context") or []
+            # Seuls les nouveaux tokens sont évalués quand un context est fourni
+            prompt_tokens = max(1, len(prompt) // 4)
+            prompt_eval = prompt_tokens / ollama.prompt_tokens_per_second if prompt else 0.0
+            time.sleep(prompt_eval)
+
+            options = payload.get("options", {})
+            tokens = ollama.tokens_for(payload)[:options.get("num_predict", 100)]
+            if not prompt:
+                tokens = []
+            stats = {
+                "model": payload.get("model"),
+                "done": True,
+                "context": context + list(range(prompt_tokens + len(tokens))),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_eval * 1e9),
+                "eval_count": len(tokens),
+                "eval_duration": int(len(tokens) / ollama.tokens_per_second * 1e9),
+            }
+
+            if not payload.get("stream", True):
+                time.sleep(len(tokens) / ollama.tokens_per_second)
+                record['first_token'] = record['last_token'] = time.time()
+                self.send_json(200, dict(stats, response="".join(tokens)))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for token in tokens:
+                    time.sleep(1.0 / ollama.tokens_per_second)
+                    self.write_chunk({"model": payload.get("model"), "response": token, "done": False})
+                    now = time.time()
+                    record['first_token'] = record['first_token'] or now
+                    record['last_token'] = now
+                self.write_chunk(dict(stats, response=""))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # Le client a fermé la connexion : Ollama arrête aussi la génération
+                record['aborted'] = True
+                self.close_connection = True
+        finally:
+            with ollama.lock:
+                ollama.active -= 1
+
+    def write_chunk(self, data):
+        line = (json.dumps(data, ensure_ascii=False) + "\n").encode('utf-8')
+        self.wfile.write(f"{len(line):x}\r\n".encode('ascii') + line + b"\r\n")
+        self.wfile.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens_per_second", type=float, default=50.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure_rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeOllama(host="0.0.0.0", port=args.port, tokens_per_second=args.tokens_per_second,
+                      latency=args.latency, failure_rate=args.failure_rate)
+    print(f"🧪 Faux Ollama sur le port {fake.port} ({args.tokens_per_second} tokens/s)")
+    try:
+        fake.httpd.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
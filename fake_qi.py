@@ -0,0 +1,223 @@
+"""Faux services NAOqi pour faire tourner les clients sans robot.
+
+FakeSession().service("ALMemory") expose getData, subscriber(key).signal et
+raiseEvent comme le vrai ALMemory ; insertData met à jour une valeur sans
+déclencher de signal (comportement des extracteurs en mode polling).
+"""
+import os
+import threading
+import time
+
+# Audio rendu par sayToFile : 16 kHz, 16 bits, mono
+AUDIO_BYTES_PER_SECOND = 32000
+
+
+class FakeSignal(object):
+    def __init__(self):
+        self.handlers = {}
+        self.next_link = 1
+        self.lock = threading.Lock()
+
+    def connect(self, handler):
+        with self.lock:
+            link = self.next_link
+            self.next_link += 1
+            self.handlers[link] = handler
+        return link
+
+    def disconnect(self, link):
+        with self.lock:
+            self.handlers.pop(link, None)
+
+    def __call__(self, value):
+        with self.lock:
+            handlers = list(self.handlers.values())
+        for handler in handlers:
+            handler(value)
+
+
+class FakeSubscriber(object):
+    def __init__(self, signal):
+        self.signal = signal
+
+
+class FakeMemory(object):
+    def __init__(self, rpc_latency=0.0):
+        self.data = {}
+        self.signals = {}
+        self.rpc_latency = rpc_latency
+        self.rpc_count = 0
+        self.lock = threading.Lock()
+
+    def _rpc(self):
+        with self.lock:
+            self.rpc_count += 1
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+    def getData(self, key):
+        self._rpc()
+        return self.data.get(key)
+
+    def getListData(self, keys):
+        """Un seul aller-retour pour toutes les clés"""
+        self._rpc()
+        return [self.data.get(key) for key in keys]
+
+    def insertData(self, key, value):
+        self.data[key] = value
+
+    def raiseEvent(self, key, value):
+        self.data[key] = value
+        signal = self.signals.get(key)
+        if signal is not None:
+            signal(value)
+
+    def subscriber(self, key):
+        self._rpc()
+        if key not in self.signals:
+            self.signals[key] = FakeSignal()
+        return FakeSubscriber(self.signals[key])
+
+    def subscribeToEvent(self, key, module, method):
+        self._rpc()
+
+    def unsubscribeToEvent(self, key, module):
+        self._rpc()
+
+
+class FakeFuture(object):
+    """Sous-ensemble de qi.Future : wait, cancel, isFinished, isCanceled"""
+
+    def __init__(self):
+        self.finished = threading.Event()
+        self.canceled = False
+
+    def wait(self, timeout=None):
+        # timeout en millisecondes, comme qi.Future.wait
+        self.finished.wait(None if timeout is None else timeout / 1000.0)
+
+    def cancel(self):
+        self.canceled = True
+        self.finished.set()
+
+    def isFinished(self):
+        return self.finished.is_set()
+
+    def isCanceled(self):
+        return self.canceled
+
+
+class FakeTextToSpeech(object):
+    def __init__(self, words_per_second=3.0, synthesis_latency=0.0):
+        self.words_per_second = words_per_second
+        # Délai de synthèse avant le premier son (say) ; sayToFile coûte autant
+        self.synthesis_latency = synthesis_latency
+        self.said = []
+        self.started = []  # (heure, texte) du premier son de chaque say
+        self.rendered = []
+        self.stopped = []  # (heure, texte) des phrases coupées par stopAll/cancel
+        self.speaking = None
+        self.lock = threading.Lock()
+
+    def say(self, text, _async=False):
+        self.said.append((time.time(), text))
+        future = FakeFuture()
+        with self.lock:
+            self.speaking = (text, future)
+        if not _async:
+            self.speak(text, future)
+            return None
+        thread = threading.Thread(target=self.speak, args=(text, future))
+        thread.daemon = True
+        thread.start()
+        return future
+
+    def speak(self, text, future):
+        # Synthèse puis durée de la phrase, écourtées par cancel() / stopAll()
+        if not future.finished.wait(self.synthesis_latency):
+            self.started.append((time.time(), text))
+            future.finished.wait(len(text.split()) / self.words_per_second)
+        if future.canceled:
+            self.stopped.append((time.time(), text))
+        future.finished.set()
+        with self.lock:
+            if self.speaking and self.speaking[1] is future:
+                self.speaking = None
+
+    def stopAll(self):
+        with self.lock:
+            speaking = self.speaking
+        if speaking is not None and not speaking[1].isFinished():
+            speaking[1].cancel()
+
+    def sayToFile(self, text, path):
+        """Rend la phrase dans un fichier sans la dire (taille proportionnelle à la durée)"""
+        time.sleep(self.synthesis_latency)
+        duration = len(text.split()) / self.words_per_second
+        with open(path, 'wb') as f:
+            f.write(bytes(int(duration * AUDIO_BYTES_PER_SECOND)))
+        self.rendered.append((time.time(), text))
+
+
+class FakeAudioPlayer(object):
+    """playFile rejoue un fichier de sayToFile sans délai de synthèse"""
+
+    def __init__(self):
+        self.played = []  # (heure, chemin)
+        self.playing = None
+        self.lock = threading.Lock()
+
+    def playFile(self, path, _async=False):
+        duration = os.path.getsize(path) / AUDIO_BYTES_PER_SECOND
+        future = FakeFuture()
+        self.played.append((time.time(), path))
+        with self.lock:
+            self.playing = future
+        thread = threading.Thread(target=self.play, args=(duration, future))
+        thread.daemon = True
+        thread.start()
+        if not _async:
+            future.wait()
+            return None
+        return future
+
+    def play(self, duration, future):
+        future.finished.wait(duration)
+        future.finished.set()
+
+    def stopAll(self):
+        with self.lock:
+            playing = self.playing
+        if playing is not None and not playing.isFinished():
+            playing.cancel()
+
+
+class FakeService(object):
+    """Service générique : enregistre les appels, ne fait rien"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = []
+
+    def __getattr__(self, method):
+        def call(*args, **kwargs):
+            self.calls.append((method, args, kwargs))
+        return call
+
+
+class FakeSession(object):
+    def __init__(self, memory=None, tts=None):
+        self.services = {
+            "ALMemory": memory or FakeMemory(),
+            "ALTextToSpeech": tts or FakeTextToSpeech(),
+            "ALAudioPlayer": FakeAudioPlayer(),
+        }
+
+    def service(self, name):
+        if name not in self.services:
+            self.services[name] = FakeService(name)
+        return self.services[name]
+
+    def registerService(self, name, obj):
+        self.services[name] = obj
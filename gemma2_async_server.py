@@ -0,0 +1,451 @@
+import asyncio
+import json
+import time
+
+import wire_format
+from server_logging import get_logger, turn_context, turn_id
+from server_metrics import trace_context
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from speech_text import SentenceStream
+from udp_transport import ReliableUDPTransport
+from gemma2_server import (
+    OptimizedGemma2Server,
+    FALLBACK_NOT_UNDERSTOOD,
+    FALLBACK_TECHNICAL,
+    FALLBACK_TIMEOUT,
+    FALLBACK_ERROR,
+)
+
+log = get_logger("asyncio")
+
+
+class Gemma2DatagramProtocol(asyncio.DatagramProtocol):
+    """Réception UDP sur la boucle d'événements (aucun thread par socket)"""
+
+    def __init__(self, server):
+        self.server = server
+
+    def connection_made(self, transport):
+        self.server.transport = transport
+
+    def datagram_received(self, data, addr):
+        trace = self.server.metrics.new_trace()
+        start = time.perf_counter()
+        try:
+            message = self.server.udp.on_datagram(data, addr)
+        except Exception:
+            # Une exception ici remonterait dans la boucle d'événements
+            self.server.metrics.inc("receive_errors_total")
+            log.exception("❌ Erreur réception depuis %s", addr)
+            return
+        if message is None:
+            return
+        decoded = time.perf_counter()
+        try:
+            voice_data, codec = wire_format.decode(message)
+        except (ValueError, IndexError) as e:
+            self.server.metrics.inc("receive_errors_total")
+            log.error("❌ Datagramme invalide depuis %s : %s", addr, e)
+            return
+        trace.add("receive", decoded - start)
+        trace.add("decode", time.perf_counter() - decoded)
+        self.server.remember_codec(addr, voice_data, codec)
+        with trace_context(trace):
+            self.server.process_voice_data(voice_data, addr)
+
+    def error_received(self, exc):
+        log.error("❌ Erreur réception : %s", exc)
+
+
+class AsyncGemma2Server(OptimizedGemma2Server):
+    """Variante asyncio : même protocole, un seul thread, pool HTTP persistant vers Ollama"""
+
+    def __init__(self, port=8888, pepper_port=8889, streaming=True, max_workers=4, keep_alive="30m",
+                 cache_file=None, prompt_mode="prompt", wire_codec=None, backends=None, small_backends=None):
+        # Pas de cache par embeddings ici : l'appel HTTP synchrone bloquerait la boucle
+        super(AsyncGemma2Server, self).__init__(port, pepper_port, streaming, max_workers, keep_alive,
+                                                cache_file=cache_file, prompt_mode=prompt_mode,
+                                                wire_codec=wire_codec, backends=backends,
+                                                small_backends=small_backends)
+        self.max_concurrent_requests = max_workers
+        # Le socket du serveur threads ne sert pas : réception et envois passent par le transport asyncio
+        self.sock.close()
+        self.transport = None
+        # Même protocole fiable, mais les envois passent par le transport asyncio
+        self.udp = ReliableUDPTransport(lambda data, addr: self.transport.sendto(data, addr))
+        self.http = None
+        self.llm_slots = None
+        self.stopped = None
+        self.loop = None
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        if aiohttp is None:
+            raise RuntimeError("Le mode asyncio nécessite aiohttp (pip install aiohttp)")
+
+        self.stopped = asyncio.Event()
+        self.llm_slots = asyncio.Semaphore(self.max_concurrent_requests)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrent_requests * len(self.router.all_backends()),
+                                        limit_per_host=self.max_concurrent_requests, keepalive_timeout=60)
+        self.http = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+
+        loop = self.loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: Gemma2DatagramProtocol(self),
+                                            local_addr=('0.0.0.0', self.port))
+        self.is_running = True
+        # Sauvegarde du cache de réponses hors de la boucle
+        self.response_cache.start_saver()
+
+        print(f"🧠 SERVEUR GEMMA2:9B ASYNCIO")
+        print(f"📡 Réception Pepper: port {self.port}")
+        await self.check_ollama_status_async()
+        print("\n✅ Gemma2:9B prêt pour conversations professionnelles!")
+        warm_task = loop.create_task(self.keep_model_warm_async())
+        retransmit_task = loop.create_task(self.retransmit_async())
+
+        try:
+            await self.stopped.wait()
+        finally:
+            self.is_running = False
+            warm_task.cancel()
+            retransmit_task.cancel()
+            self.transport.close()
+            await self.http.close()
+            self.response_cache.stop_saver()
+            self.response_cache.save()
+            print(f"💾 Cache de réponses: {self.response_cache.stats()}")
+            self.prompt_eval_report()
+            self.stop_metrics()
+            print(f"📶 Transport UDP: {dict(self.udp.stats)}")
+            print("🛑 Serveur Gemma2 asyncio arrêté")
+
+    def stop_server(self):
+        if self.stopped is not None:
+            self.stopped.set()
+
+    async def check_ollama_status_async(self):
+        """Vérification qu'Ollama et Gemma2 sont prêts, sur chaque backend"""
+        for backend in self.router.all_backends():
+            try:
+                print(f"🔎 Test de connexion à Ollama : {backend.url} ({backend.model})")
+                async with self.http.post(backend.url, json={
+                    "model": backend.model,
+                    "prompt": "Bonjour",
+                    "stream": False,
+                    "keep_alive": self.keep_alive,
+                    "options": {"num_predict": 1}
+                }, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                    backend.last_activity = time.time()
+                    print(f"Réponse connexion Ollama HTTP Code : {response.status}")
+                    if response.status == 200:
+                        print(f"✅ {backend.name} prêt et optimisé")
+                    else:
+                        print(f"⚠️  Problème Ollama: {response.status} {await response.text()}")
+                    self.router.record_probe(backend, response.status == 200)
+            except Exception as e:
+                self.router.record_probe(backend, False)
+                print(f"❌ Ollama non accessible ({backend.name}): {e}")
+                print("💡 Lancez: ollama serve")
+
+    async def probe_backend_async(self, backend):
+        try:
+            async with self.http.get(backend.endpoint("tags"), timeout=aiohttp.ClientTimeout(total=2)) as response:
+                ok = response.status == 200
+        except Exception:
+            ok = False
+        self.router.record_probe(backend, ok)
+        log.info("🩺 Sonde %s : %s", backend.name, "OK" if ok else "échec")
+
+    async def keep_model_warm_async(self):
+        """Sondes des backends coupés, et ping pendant les creux pour éviter le rechargement à froid"""
+        while self.is_running:
+            await asyncio.sleep(self.health_interval)
+            for session, request in self.summary_candidates():
+                asyncio.get_running_loop().create_task(self.summarize_context_async(session, request))
+            for backend in self.router.all_backends():
+                if self.router.probe_due(backend):
+                    await self.probe_backend_async(backend)
+                    continue
+                if time.time() - backend.last_activity < self.warm_interval:
+                    continue
+                backend.last_activity = time.time()
+                try:
+                    async with self.http.post(backend.url, json=self.warmup_payload(backend),
+                                              timeout=aiohttp.ClientTimeout(total=60)) as response:
+                        self.router.record_probe(backend, response.status == 200)
+                        if response.status != 200:
+                            log.warning("⚠️  Ping de maintien Ollama (%s): %s", backend.name, response.status)
+                except Exception as e:
+                    self.router.record_probe(backend, False)
+                    log.error("❌ Ping de maintien Ollama (%s): %s", backend.name, e)
+
+    async def summarize_context_async(self, session, request):
+        summary = None
+        try:
+            backend = self.summary_backend()
+            if backend is None:
+                return
+            backend.last_activity = time.time()
+            with self.metrics.span("context_summary"):
+                async with self.http.post(backend.url, json=self.summary_payload(request, backend),
+                                          timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    if response.status == 200:
+                        summary = (await response.json()).get('response', '').strip()
+        except Exception as e:
+            log.warning("⚠️  Résumé de l'historique: %s", e)
+        finally:
+            self.apply_summary(session, request, summary)
+
+    async def retransmit_async(self):
+        while self.is_running:
+            await asyncio.sleep(self.udp.retransmit_interval / 3)
+            self.udp.poll_retransmits()
+
+    def submit(self, session, task, *args):
+        asyncio.get_running_loop().create_task(self._run_ordered(session, task, args))
+
+    async def _run_ordered(self, session, task, args):
+        # asyncio.Lock réveille les attentes dans l'ordre FIFO : ordre garanti par session
+        if not hasattr(session, 'async_lock'):
+            session.async_lock = asyncio.Lock()
+            session.async_pending = 0
+        session.async_pending += 1
+        session.running = True
+        try:
+            async with session.async_lock:
+                async with self.llm_slots:
+                    await task(session, *args)
+        except Exception:
+            log.exception("❌ Erreur session %s", session.key)
+        finally:
+            session.async_pending -= 1
+            session.running = session.async_pending > 0
+
+    async def run_turn(self, session, ticket, conversation, trace=None):
+        if not self.start_turn(session, ticket, trace):
+            return
+        try:
+            await self.answer_turn(session, conversation, trace, ticket)
+        finally:
+            self.release_turn(session, ticket)
+
+    async def answer_turn(self, session, conversation, trace=None, ticket=None):
+        utterance_id = conversation[-1].get('utterance_id')
+        trace = trace or self.metrics.new_trace()
+        trace.turn = turn_id(session.key, utterance_id)
+        with turn_context(session.key, utterance_id), trace_context(trace):
+            if self.streaming:
+                await self.stream_response_to_pepper_async(session, conversation, ticket)
+            else:
+                llm_response = await self.process_with_gemma2_async(session, conversation)
+                if not (ticket and ticket.cancelled):
+                    self.send_response_to_pepper(llm_response, session, utterance_id=utterance_id)
+        self.metrics.finish(trace, "barge_in" if ticket and ticket.cancelled else "answered")
+
+    async def process_with_gemma2_async(self, session, conversation):
+        try:
+            conversation_text = self.extract_conversation_text(conversation)
+            if not conversation_text.strip():
+                return FALLBACK_NOT_UNDERSTOOD
+
+            cached = self.cached_response(session, conversation_text)
+            if cached is not None:
+                return cached
+
+            tried = []
+            while True:
+                backend = self.route_generation(session, conversation_text, tried)
+                if backend is None:
+                    return FALLBACK_TECHNICAL
+                tried.append(backend)
+                payload = self.generation_payload(session, conversation_text, False, backend)
+                start_time = time.time()
+                ok = False
+                try:
+                    async with self.http.post(backend.url, json=payload) as response:
+                        ok = response.status < 500
+                        if response.status != 200:
+                            log.error("❌ Erreur Ollama (%s): %s %s", backend.name, response.status,
+                                      await response.text())
+                            if ok:
+                                return FALLBACK_TECHNICAL
+                            continue
+                        result = await response.json()
+                except aiohttp.ClientConnectionError as e:
+                    log.warning("🔀 %s injoignable : %s", backend.name, e)
+                    continue
+                finally:
+                    self.router.release(backend, ok, time.time() - start_time)
+                self.record_generation(session, payload, result, backend)
+                return self.handle_generation(session, conversation_text, result, time.time() - start_time)
+
+        except asyncio.TimeoutError:
+            self.metrics.inc("ollama_timeouts_total")
+            log.warning("⏱️ Timeout Ollama !")
+            return FALLBACK_TIMEOUT
+        except Exception:
+            log.exception("❌ Erreur Gemma2")
+            return FALLBACK_ERROR
+
+    async def stream_with_gemma2_async(self, session, conversation, on_sentence, speculation=None, cancel=None):
+        """Équivalent asynchrone de stream_with_gemma2"""
+        accumulator = SentenceStream(self.max_sentences, self.clean_sentence)
+        remember = speculation is None
+        cancel = cancel or speculation
+
+        try:
+            conversation_text = self.extract_conversation_text(conversation)
+            if not conversation_text.strip():
+                on_sentence(FALLBACK_NOT_UNDERSTOOD)
+                return FALLBACK_NOT_UNDERSTOOD
+
+            cached = self.cached_response(session, conversation_text, remember)
+            if cached is not None:
+                return self.replay_cached(cached, on_sentence)
+
+            tried = []
+            timed_out = False
+            while True:
+                backend = self.route_generation(session, conversation_text, tried)
+                if backend is None:
+                    fallback = FALLBACK_TIMEOUT if timed_out else FALLBACK_TECHNICAL
+                    return self.stream_fallback(accumulator, on_sentence, fallback)
+                tried.append(backend)
+                payload = self.generation_payload(session, conversation_text, True, backend)
+                start_time = time.time()
+                final_chunk = None
+                first_token = None
+                ok = False
+                try:
+                    async with self.http.post(backend.url, json=payload,
+                                              timeout=aiohttp.ClientTimeout(total=self.generation_timeout)) as response:
+                        if response.status != 200:
+                            log.error("❌ Erreur Ollama (%s): %s %s", backend.name, response.status,
+                                      await response.text())
+                            if response.status >= 500:
+                                continue
+                            ok = True
+                            on_sentence(FALLBACK_TECHNICAL)
+                            return FALLBACK_TECHNICAL
+
+                        async for line in response.content:
+                            if cancel is not None and cancel.cancelled:
+                                response.close()
+                                break
+                            line = line.strip()
+                            if not line:
+                                continue
+                            chunk = json.loads(line)
+                            if first_token is None:
+                                # Vu du client : chargement + prompt-eval, mesuré même si le flux est coupé
+                                first_token = time.time()
+                                self.metrics.record("ollama_first_token", first_token - start_time)
+                            for sentence in accumulator.feed(chunk.get('response', '')):
+                                on_sentence(sentence)
+                            if accumulator.limit_reached:
+                                # close() coupe la connexion au lieu de la rendre au pool : Ollama s'arrête
+                                response.close()
+                                break
+                            if chunk.get('done'):
+                                final_chunk = chunk
+                                break
+                        ok = True
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if first_token is not None:
+                        raise
+                    # Injoignable ou muet jusqu'au délai : rien n'a encore été dit, on bascule
+                    if isinstance(e, asyncio.TimeoutError):
+                        timed_out = True
+                        self.metrics.inc("ollama_timeouts_total")
+                    log.warning("🔀 %s injoignable ou trop lent : %s", backend.name, e or type(e).__name__)
+                    continue
+                finally:
+                    self.router.release(backend, ok, (first_token or time.time()) - start_time)
+                break
+
+            self.record_generation(session, payload, final_chunk, backend)
+            if cancel is not None and cancel.cancelled:
+                return None
+
+            return self.finish_stream(session, conversation_text, accumulator, on_sentence, start_time, remember)
+
+        except asyncio.TimeoutError:
+            self.metrics.inc("ollama_timeouts_total")
+            log.warning("⏱️ Timeout Ollama !")
+            return self.stream_fallback(accumulator, on_sentence, FALLBACK_TIMEOUT)
+        except Exception:
+            log.exception("❌ Erreur Gemma2 (stream)")
+            return self.stream_fallback(accumulator, on_sentence, FALLBACK_ERROR)
+
+    def schedule_prefill(self, session):
+        now = time.time()
+        if (self.prompt_mode != "prompt" or session.prefill_running
+                or now - session.last_prefill < self.prefill_interval):
+            return
+        session.prefill_running = True
+        session.last_prefill = now
+        asyncio.get_running_loop().create_task(self.prefill_prompt_async(session, list(session.current_conversation)))
+
+    async def prefill_prompt_async(self, session, conversation):
+        try:
+            backend = self.prefill_backend(session)
+            if backend is None:
+                return
+            async with self.http.post(backend.url, json=self.prefill_payload(session, conversation, backend),
+                                      timeout=aiohttp.ClientTimeout(total=10)) as response:
+                await response.read()
+        except Exception as e:
+            log.warning("⚠️  Préremplissage Ollama: %s", e)
+        finally:
+            session.prefill_running = False
+
+    def schedule_prewarm(self, session):
+        if self.prewarm_due(session):
+            asyncio.get_running_loop().create_task(self.prewarm_async(session))
+
+    async def prewarm_async(self, session):
+        try:
+            backend = self.prefill_backend(session)
+            if backend is None:
+                return
+            async with self.http.post(backend.url, json=self.prewarm_payload(session, backend),
+                                      timeout=aiohttp.ClientTimeout(total=60)) as response:
+                await response.read()
+            log.info("🔥 Modèle préchauffé sur %s", backend.name)
+        except Exception as e:
+            log.warning("⚠️  Préchauffage Ollama: %s", e)
+
+    async def speculate_turn(self, session, speculation):
+        if speculation.cancelled:
+            return
+        with turn_context(session.key, speculation.utterance_id), trace_context(speculation.trace):
+            response = await self.stream_with_gemma2_async(
+                session, speculation.conversation,
+                lambda sentence: self.speculative_sentence(session, speculation, sentence),
+                speculation=speculation)
+            self.speculation_done(session, speculation, response)
+
+    async def stream_response_to_pepper_async(self, session, conversation, ticket=None):
+        turn_id = next(self.turn_counter)
+        utterance_id = conversation[-1].get('utterance_id')
+        fragments = []
+
+        def send_fragment(sentence):
+            if ticket and ticket.cancelled:
+                return
+            fragments.append(sentence)
+            self.send_response_to_pepper(sentence, session, turn_id=turn_id,
+                                         seq=len(fragments) - 1, final=False, utterance_id=utterance_id)
+
+        await self.stream_with_gemma2_async(session, conversation, send_fragment, cancel=ticket)
+        if ticket and ticket.cancelled:
+            return
+        self.send_response_to_pepper('', session, turn_id=turn_id, seq=len(fragments), final=True,
+                                     utterance_id=utterance_id)
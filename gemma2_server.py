@@ -2,28 +2,237 @@ import socket
 import json
 import threading
 import time
+import itertools
+import collections
 import requests
-import re
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+from canned_replies import (
+    FALLBACK_NOT_UNDERSTOOD,
+    FALLBACK_TECHNICAL,
+    FALLBACK_TIMEOUT,
+    FALLBACK_ERROR,
+    FALLBACK_BUSY,
+    FALLBACK_RESPONSES,
+    FALLBACK_KINDS,
+    FILLER_WAIT,
+    CANNED_REPLIES,
+)
+from context_window import ContextWindow, format_exchange
+from response_cache import ResponseCache
+import speech_text
+from speech_text import SentenceStream
+from tts_cache import text_key
+from udp_transport import ReliableUDPTransport
+import wire_format
+from server_logging import get_logger, setup_logging, turn_context, turn_id
+from llm_router import LLMRouter, parse_backend
+from pepper_config import (Config, DEFAULTS, DEFAULT_MODEL, DEFAULT_OLLAMA_URL, DEFAULT_SMALL_MODEL,
+                           DEFAULT_SYSTEM_PROMPT, parse_address)
+from server_metrics import MetricsRegistry, StatsFileWriter, current_trace, serve_metrics, trace_context
+
+log = get_logger()
+
+# Seuls ces messages attendent une réponse : l'adresse de réponse de la session suit leur expéditeur.
+# Les autres (indices de visiteur en approche envoyés d'un autre socket, etc.) ne la changent pas.
+REPLY_MESSAGES = ("conversation_end",)
+
+
+class SpeculativeTurn(object):
+    """Génération lancée sur une fin spéculative, confirmée ou jetée à la fin définitive.
+
+    Tant que le tour n'est pas confirmé, les phrases sont gardées en mémoire ;
+    à la confirmation elles partent d'un coup et les suivantes sont envoyées directement.
+    """
+
+    def __init__(self, utterance_id, conversation, conversation_text, turn_id):
+        self.utterance_id = utterance_id
+        self.conversation = conversation
+        self.conversation_text = conversation_text
+        self.turn_id = turn_id
+        self.trace = None
+        self.lock = threading.Lock()
+        self.sentences = []
+        self.response = None
+        self.committed = False
+        self.cancelled = False
+        self.done = False
+
+
+class TurnTicket(object):
+    """Tour admis en file : abandonné si un énoncé plus récent du même robot arrive ou si le délai expire"""
+
+    def __init__(self, utterance_id, deadline):
+        self.utterance_id = utterance_id
+        self.queued_at = time.time()
+        self.deadline = self.queued_at + deadline
+        self.superseded = False
+        self.released = False
+        # Le visiteur a coupé la parole au robot (conversation_cancel)
+        self.cancelled = False
+
+
+def same_utterance(text_a, text_b):
+    return " ".join(text_a.lower().split()) == " ".join(text_b.lower().split())
+
+
+class ConversationSession(object):
+    """État de conversation d'un robot (clé : robot_id ou IP de l'expéditeur)"""
+
+    def __init__(self, key, addr, max_turns=8):
+        self.key = key
+        self.addr = addr
+        self.last_seen = time.time()
+
+        # Buffer conversation
+        self.current_conversation = []
+        self.conversation_active = False
+        # Historique rangé sous budget de tokens, résumé des anciens échanges
+        self.context = ContextWindow(max_turns)
+        # Visiteur (person_id de la détection) à qui appartient l'historique
+        self.visitor_id = None
+        # Tokens renvoyés par Ollama (mode context) : préfixe déjà évalué, sur ce backend
+        self.ollama_context = None
+        self.backend = None
+        # Origine de la réponse en cours (nom du backend, "cache"), annoncée dans le champ model des réponses
+        self.reply_source = None
+        # Génération spéculative en cours (SpeculativeTurn) et préremplissage du prompt
+        self.speculative_turn = None
+        self.prefill_running = False
+        self.last_prefill = 0
+        # Dernier préchauffage demandé par un visiteur en approche
+        self.last_prewarm = 0
+
+        # Tours admis pas encore démarrés (TurnTicket), du plus ancien au plus récent
+        self.queued_turns = collections.deque()
+        # Tour en cours de génération (TurnTicket ou SpeculativeTurn confirmé), annulable
+        self.active_turn = None
+
+        # File de tâches : un seul worker à la fois par session (ordre garanti)
+        self.lock = threading.Lock()
+        self.pending = collections.deque()
+        self.running = False
+
 
 class OptimizedGemma2Server(object):
-    def __init__(self, port=8888, pepper_port=8889):
+    def __init__(self, port=8888, pepper_port=8889, streaming=True, max_workers=4, keep_alive="30m",
+                 cache_file=None, cache_embed_model=None, prompt_mode="prompt", wire_codec=None,
+                 backends=None, small_backends=None):
         self.port = port
         self.pepper_port = pepper_port
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.pepper_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Réponses envoyées depuis le port d'écoute : les accusés du client reviennent ici
+        self.udp = ReliableUDPTransport(self.sock.sendto)
+        # Format des réponses : None = celui du robot (mémorisé par IP), sinon forcé
+        self.wire_codec = wire_codec
+        self.peer_codecs = {}
         self.is_running = False
         
-        # Configuration Ollama optimisée
-        self.ollama_url = "http://192.168.1.17:11434/api/generate"
-        self.model_name = "gemma2:9b"
-        
-        # Buffer conversation
-        self.current_conversation = []
-        self.conversation_active = False
+        # Configuration Ollama optimisée : un ou plusieurs serveurs, petit modèle optionnel
+        self.router = LLMRouter(backends or [parse_backend(DEFAULT_OLLAMA_URL, DEFAULT_MODEL)],
+                                small_backends or [])
+
+        # Connexions HTTP persistantes + modèle gardé en VRAM entre deux visiteurs
+        self.background_workers = 2
+        self.http = self.create_http_session(max_workers + self.background_workers)
+        self.keep_alive = keep_alive
+        self.warm_interval = 120
+        # Délai max d'une génération (en-têtes puis entre deux morceaux du flux)
+        self.generation_timeout = 30
+        self.health_interval = 5
+
+        # Cache des questions fréquentes : un hit court-circuite Ollama
+        self.cache_embed_model = cache_embed_model
+        self.response_cache = ResponseCache(path=cache_file,
+                                            embed=self.embed_text if cache_embed_model else None)
+        # Phrases servies par le cache : marquées d'une cache_key, le robot en garde l'audio
+        self.frequent_sentences = collections.OrderedDict()
+        self.max_frequent_sentences = 1024
+        self.frequent_lock = threading.Lock()
         
+        # Sessions par robot + pool borné d'appels LLM concurrents
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.session_ttl = 600
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemma2")
+        # Tâches de fond (préremplissage, préchauffage, résumés) : jamais devant un tour admis
+        self.background_executor = ThreadPoolExecutor(max_workers=self.background_workers,
+                                                      thread_name_prefix="gemma2-bg")
+
+        # Admission : au-delà de turn_budget tours en cours ou en file, réponse d'attente ;
+        # au-delà de max_outstanding_turns, refus. Un tour pas démarré après turn_deadline est abandonné.
+        self.admission_lock = threading.Lock()
+        self.outstanding_turns = 0
+        self.turn_budget = max_workers
+        self.max_outstanding_turns = max_workers * 3
+        self.max_session_queue = 1
+        self.turn_deadline = 10.0
+
+        # Options Ollama de chaque génération : remplacées d'un bloc au rechargement de la config
+        self.generation_options = dict(DEFAULTS["generation"])
+        # robot_id -> (hôte, port) des robots déclarés ; les autres reçoivent à leur adresse d'envoi
+        self.robots = {}
+        self.config = None
+
         # Optimisations conversationnelles
-        self.conversation_context = []
+        self.system_prompt = DEFAULT_SYSTEM_PROMPT
         self.max_context_length = 8
+        # Part de num_ctx réservée à l'historique dans le prompt (résumé + derniers échanges) :
+        # ~200 tokens par défaut, plus est possible au prix d'un prompt-eval plus long
+        self.context_ratio = DEFAULTS["conversation"]["context_ratio"]
+        # Session inactive depuis summary_idle : les échanges hors budget sont résumés en tâche de fond
+        self.summary_idle = 8.0
+        self.summary_tokens = 80
+        # Nouveau visiteur après visitor_reset_idle sans échange : on repart d'un historique vide
+        self.visitor_reset_idle = 15.0
+
+        # "prompt" : prompt texte complet à chaque tour
+        # "context" : réutilise le tableau context d'Ollama, seuls les nouveaux tokens sont évalués
+        self.prompt_mode = prompt_mode
+        self.prompt_eval_stats = {mode: {'turns': 0, 'tokens': 0, 'ms': 0.0} for mode in ("prompt", "context")}
+
+        # Streaming : chaque phrase part dès qu'elle est générée
+        self.streaming = streaming
+        self.max_sentences = 2
+        # Chunks de parole : préremplissage du KV cache + génération sur fin spéculative
+        self.prefill_interval = 0.3
+        self.speculative_generation = True
+        # Visiteur en approche (détection de présence) : au plus un préchauffage par robot et par période
+        self.prewarm_interval = 30.0
+
+        # Démarre à l'horodatage : les numéros de tour restent croissants après un redémarrage
+        self.turn_counter = itertools.count(int(time.time() * 1000))
+
+        # Durées par étape et compteurs, exportés via /metrics ou un fichier de stats
+        self.metrics = MetricsRegistry()
+        self.metrics.add_collector(self.metrics_gauges)
+        self.metrics_server = None
+        self.stats_writer = None
+
+    @property
+    def num_ctx(self):
+        return self.generation_options["num_ctx"]
+
+    @num_ctx.setter
+    def num_ctx(self, num_ctx):
+        self.generation_options = dict(self.generation_options, num_ctx=num_ctx)
+
+    @property
+    def ollama_url(self):
+        return self.router.primary.url
+
+    @ollama_url.setter
+    def ollama_url(self, url):
+        self.router.primary.url = url
+
+    @property
+    def model_name(self):
+        return self.router.primary.model
+
+    @model_name.setter
+    def model_name(self, model):
+        self.router.primary.model = model
 
     def start_server(self):
         try:
@@ -38,213 +247,1177 @@ class OptimizedGemma2Server(object):
             # Vérification Ollama
             self.check_ollama_status()
 
+            self.udp.start()
+            self.response_cache.start_saver()
             self.receiver_thread = threading.Thread(target=self.receive_voice_data)
             self.receiver_thread.daemon = True
             self.receiver_thread.start()
 
+            self.warm_thread = threading.Thread(target=self.keep_model_warm)
+            self.warm_thread.daemon = True
+            self.warm_thread.start()
+
         except Exception as e:
             print(f"❌ Erreur démarrage: {e}")
 
+    def create_http_session(self, pool_size):
+        """Session requests avec pool keep-alive (une connexion par worker), un pool par backend"""
+        http = requests.Session()
+        # pool_connections = nombre d'hôtes gardés : au-delà, passer d'un backend à l'autre fermerait le pool
+        hosts = len({backend.base_url for backend in self.router.all_backends()})
+        http.mount("http://", HTTPAdapter(pool_connections=max(1, hosts), pool_maxsize=pool_size))
+        return http
+
     def check_ollama_status(self):
-        """Vérification qu'Ollama et Gemma2 sont prêts"""
+        """Vérification qu'Ollama et Gemma2 sont prêts, sur chaque backend"""
+        for backend in self.router.all_backends():
+            try:
+                print(f"🔎 Test de connexion à Ollama : {backend.url} ({backend.model})")
+                response = self.http.post(backend.url, json={
+                    "model": backend.model,
+                    "prompt": "Bonjour",
+                    "stream": False,
+                    "keep_alive": self.keep_alive,
+                    "options": {
+                        "temperature": 0.7,
+                        "top_p": 0.9,
+                        "max_tokens": 50
+                    }
+                }, timeout=10)
+                backend.last_activity = time.time()
+
+                print(f"Réponse connexion Ollama HTTP Code : {response.status_code}")
+                if response.status_code == 200:
+                    print(f"✅ {backend.name} prêt et optimisé\nRéponse : {response.json()}")
+                else:
+                    print(f"⚠️  Problème Ollama: {response.status_code} {response.text}")
+                self.router.record_probe(backend, response.status_code == 200)
+
+            except Exception as e:
+                self.router.record_probe(backend, False)
+                print(f"❌ Ollama non accessible ({backend.name}): {e}")
+                print("💡 Lancez: ollama serve")
+
+    def warmup_payload(self, backend=None):
+        # Prompt vide : Ollama charge le modèle et prolonge keep_alive sans générer
+        return {"model": (backend or self.router.primary).model, "prompt": "", "keep_alive": self.keep_alive}
+
+    def probe_backend(self, backend):
+        """Sonde légère d'un backend coupé : /api/tags répond sans toucher au GPU"""
         try:
-            print(f"🔎 Test de connexion à Ollama : {self.ollama_url}")
-            response = requests.post(self.ollama_url, json={
-                "model": self.model_name,
-                "prompt": "Bonjour",
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "max_tokens": 50
-                }
-            }, timeout=10)
-
-            print(f"Réponse connexion Ollama HTTP Code : {response.status_code}")
-            if response.status_code == 200:
-                print(f"✅ Gemma2:9B prêt et optimisé\nRéponse : {response.json()}")
-            else:
-                print(f"⚠️  Problème Ollama: {response.status_code} {response.text}")
+            ok = self.http.get(backend.endpoint("tags"), timeout=2).status_code == 200
+        except Exception:
+            ok = False
+        self.router.record_probe(backend, ok)
+        log.info("🩺 Sonde %s : %s", backend.name, "OK" if ok else "échec")
 
-        except Exception as e:
-            print(f"❌ Ollama non accessible: {e}")
-            print("💡 Lancez: ollama serve")
+    def keep_model_warm(self):
+        """Sondes des backends coupés, et ping pendant les creux pour éviter le rechargement à froid"""
+        while self.is_running:
+            time.sleep(self.health_interval)
+            for session, request in self.summary_candidates():
+                self.background_executor.submit(self.summarize_context, session, request)
+            for backend in self.router.all_backends():
+                if self.router.probe_due(backend):
+                    self.probe_backend(backend)
+                    continue
+                if time.time() - backend.last_activity < self.warm_interval:
+                    continue
+                backend.last_activity = time.time()
+                try:
+                    response = self.http.post(backend.url, json=self.warmup_payload(backend), timeout=60)
+                    self.router.record_probe(backend, response.status_code == 200)
+                    if response.status_code != 200:
+                        log.warning("⚠️  Ping de maintien Ollama (%s): %s", backend.name, response.status_code)
+                except Exception as e:
+                    self.router.record_probe(backend, False)
+                    log.error("❌ Ping de maintien Ollama (%s): %s", backend.name, e)
 
     def receive_voice_data(self):
         while self.is_running:
             try:
-                data, addr = self.sock.recvfrom(4096)
-                print(f"\n📥 Reçu UDP depuis {addr} : {data!r}")
-                voice_data = json.loads(data.decode('utf-8'))
-                print(f"➡️ Données reçues : {voice_data}")
-                self.process_voice_data(voice_data, addr)
-            except Exception as e:
-                print(f"❌ Erreur réception : {e}")
+                data, addr = self.sock.recvfrom(65535)
+                trace = self.metrics.new_trace()
+                start = time.perf_counter()
+                message = self.udp.on_datagram(data, addr)
+                if message is None:
+                    # Accusé, fragment partiel ou doublon
+                    continue
+                decoded = time.perf_counter()
+                voice_data, codec = wire_format.decode(message)
+                trace.add("receive", decoded - start)
+                trace.add("decode", time.perf_counter() - decoded)
+                self.remember_codec(addr, voice_data, codec)
+                log.debug("📥 Reçu UDP depuis %s (%s, %d octets) : %s", addr, codec, len(message), voice_data)
+                with trace_context(trace):
+                    self.process_voice_data(voice_data, addr)
+            except Exception:
+                if self.is_running:
+                    self.metrics.inc("receive_errors_total")
+                    log.exception("❌ Erreur réception")
+
+    def remember_codec(self, addr, voice_data, codec):
+        """Format des réponses pour ce robot : binaire/msgpack reçu ou annoncé ; un JSON simple ne rétrograde pas"""
+        advertised = wire_format.peer_codec(voice_data, codec)
+        if advertised is not None:
+            self.peer_codecs[addr[0]] = advertised
+        else:
+            self.peer_codecs.setdefault(addr[0], "json")
+
+    def get_session(self, voice_data, sender_addr):
+        key = voice_data.get('robot_id') or sender_addr[0]
+        now = time.time()
+        with self.sessions_lock:
+            session = self.sessions.get(key)
+            if session is None:
+                # Nettoyage des sessions inactives à chaque nouveau robot
+                for old_key in [k for k, v in self.sessions.items()
+                                if now - v.last_seen > self.session_ttl and not v.running]:
+                    del self.sessions[old_key]
+                session = ConversationSession(key, sender_addr, self.max_context_length)
+                self.sessions[key] = session
+                log.info("🤖 Nouvelle session: %s", key)
+            elif voice_data.get('type') in REPLY_MESSAGES:
+                session.addr = sender_addr
+            session.last_seen = now
+        return session
+
+    def submit(self, session, task, *args):
+        """Exécute task dans le pool, dans l'ordre d'arrivée pour cette session"""
+        with session.lock:
+            session.pending.append((task, args))
+            if session.running:
+                return
+            session.running = True
+        self.executor.submit(self._drain_session, session)
+
+    def _drain_session(self, session):
+        while True:
+            with session.lock:
+                if not session.pending:
+                    session.running = False
+                    return
+                task, args = session.pending.popleft()
+            try:
+                task(session, *args)
+            except Exception:
+                log.exception("❌ Erreur session %s", session.key)
 
     def process_voice_data(self, voice_data, sender_addr):
         try:
-            msg_type = voice_data.get('type')
-            print(f"🔎 Type de message : {msg_type}")
+            session = self.get_session(voice_data, sender_addr)
+            with turn_context(session.key, voice_data.get('utterance_id')):
+                self.handle_voice_message(session, voice_data)
+        except Exception:
+            log.exception("❌ Erreur traitement")
+
+    def handle_voice_message(self, session, voice_data):
+        msg_type = voice_data.get('type')
+        log.debug("🔎 Type de message : %s", msg_type)
+
+        if msg_type == 'conversation_start':
+            session.conversation_active = True
+            session.current_conversation = []
+            # Dès le début du nouvel énoncé : inutile de finir de générer la réponse au précédent
+            self.supersede_active_turn(session, voice_data.get('utterance_id'))
+            log.info("🎤 NOUVELLE CONVERSATION (%s)", session.key)
+            
+        elif msg_type == 'speech_chunk' and session.conversation_active:
+            session.current_conversation.append(voice_data)
+            log.debug("📝 Chunk reçu: %s", voice_data.get('words'))
+            self.schedule_prefill(session)
+            
+        elif msg_type == 'conversation_end' and voice_data.get('speculative'):
+            # Fin probable mais pas confirmée : on génère sans rien envoyer
+            log.info("⏳ Fin spéculative : %s", voice_data.get('conversation_text', ''))
+            if self.streaming and self.speculative_generation:
+                self.start_speculation(session, voice_data)
+
+        elif msg_type == 'conversation_retract':
+            log.info("↩️ Fin spéculative annulée")
+            self.cancel_speculation(session)
+
+        elif msg_type == 'conversation_cancel':
+            self.cancel_turn(session, voice_data.get('utterance_id'))
+
+        elif msg_type == 'visitor_approaching':
+            log.info("🚶 Visiteur en approche (%s, %s m)", session.key, voice_data.get('distance', '?'))
+            if self.visitor_changed(session, voice_data.get('person_id')):
+                self.reset_context(session, "new_visitor")
+            self.schedule_prewarm(session)
+
+        elif msg_type == 'conversation_end':
+            speculation = session.speculative_turn
+            session.speculative_turn = None
+            if (speculation and not speculation.cancelled
+                    and speculation.utterance_id == voice_data.get('utterance_id')
+                    and same_utterance(speculation.conversation_text, voice_data.get('conversation_text', ''))):
+                log.info("✅ Fin confirmée : génération spéculative conservée")
+                self.commit_speculation(session, speculation)
+                session.conversation_active = False
+                return
+            if speculation:
+                speculation.cancelled = True
+                self.metrics.finish(speculation.trace, "speculation_cancelled")
+
+            log.info("✅ TRAITEMENT GEMMA2:9B (fin de phrase détectée)")
+            log.debug("--- Conversation : %d chunks reçus, conversation_text : %s",
+                      len(session.current_conversation), voice_data.get('conversation_text', '<absent>'))
             
-            if msg_type == 'conversation_start':
-                self.conversation_active = True
-                self.current_conversation = []
-                print(f"🎤 NOUVELLE CONVERSATION")
-                
-            elif msg_type == 'speech_chunk' and self.conversation_active:
-                self.current_conversation.append(voice_data)
-                words = voice_data.get('words')
-                print(f"📝 Chunk reçu: {words}")
-                
-            elif msg_type == 'conversation_end':
-                print(f"✅ TRAITEMENT GEMMA2:9B (fin de phrase détectée)")
-                
-                # Log les données reçues pour debug
-                print(f"--- Données conversation complète :")
-                print(json.dumps(self.current_conversation, indent=2, ensure_ascii=False))
-                print(f"--- conversation_text (direct) reçu: {voice_data.get('conversation_text', '<absent>')}")
-                
-                # Ajout immédiat du texte si fourni par le message direct
-                if 'conversation_text' in voice_data:
-                    self.current_conversation.append(voice_data)
-                
-                if self.current_conversation:
-                    llm_response = self.process_with_gemma2()
-                    self.send_response_to_pepper(llm_response, sender_addr[0])
-                self.conversation_active = False
-                
+            # Ajout immédiat du texte si fourni par le message direct
+            if 'conversation_text' in voice_data:
+                session.current_conversation.append(voice_data)
+            
+            if session.current_conversation:
+                # Copie : le tour suivant peut commencer pendant la génération
+                self.admit_turn(session, list(session.current_conversation), current_trace.get())
+            session.conversation_active = False
+
+    def schedule_prefill(self, session):
+        """Préremplit le KV cache d'Ollama avec le début du prompt pendant que le visiteur parle"""
+        now = time.time()
+        if (self.prompt_mode != "prompt" or session.prefill_running
+                or now - session.last_prefill < self.prefill_interval):
+            return
+        session.prefill_running = True
+        session.last_prefill = now
+        self.background_executor.submit(self.prefill_prompt, session, list(session.current_conversation))
+
+    def prefill_payload(self, session, conversation, backend=None):
+        conversation_text = self.extract_conversation_text(conversation)
+        payload = self.generation_payload(session, conversation_text, False, backend)
+        # Seulement le préfixe commun avec le prompt final : Ollama réutilise ce KV cache
+        payload["prompt"] = payload["prompt"].rsplit("\nAssistant:", 1)[0]
+        payload["options"] = dict(payload["options"], num_predict=1)
+        return payload
+
+    def prefill_backend(self, session):
+        # Le tour final ira de préférence au même serveur : son KV cache sera déjà chaud
+        backend = self.router.choose(preferred=session.backend)
+        if backend is not None:
+            session.backend = backend
+            backend.last_activity = time.time()
+        return backend
+
+    def prefill_prompt(self, session, conversation):
+        try:
+            backend = self.prefill_backend(session)
+            if backend is None:
+                return
+            self.http.post(backend.url, json=self.prefill_payload(session, conversation, backend), timeout=10).close()
         except Exception as e:
-            print(f"❌ Erreur traitement : {e}")
+            log.warning("⚠️  Préremplissage Ollama: %s", e)
+        finally:
+            session.prefill_running = False
 
-    def process_with_gemma2(self):
-        """Traitement ultra-optimisé avec Gemma2:9B"""
+    def prewarm_due(self, session):
+        """Préchauffage utile : pas de conversation en cours, pas de préchauffage récent, Ollama pas saturé"""
+        now = time.time()
+        if (session.conversation_active or session.active_turn is not None
+                or now - session.last_prewarm < self.prewarm_interval):
+            self.metrics.inc("prewarm_total", outcome="skipped")
+            return False
+        if self.outstanding_turns >= self.turn_budget:
+            self.metrics.inc("prewarm_total", outcome="shed")
+            return False
+        session.last_prewarm = now
+        self.metrics.inc("prewarm_total", outcome="sent")
+        return True
+
+    def schedule_prewarm(self, session):
+        if self.prewarm_due(session):
+            self.background_executor.submit(self.prewarm, session)
+
+    def prewarm_payload(self, session, backend):
+        if self.prompt_mode != "prompt":
+            return self.warmup_payload(backend)
+        # Modèle chargé et préfixe système + historique évalué avant le premier mot
+        return self.prefill_payload(session, [], backend)
+
+    def prewarm(self, session):
         try:
-            # Extraire le texte, supporte conversation_text direct
-            if self.current_conversation and isinstance(self.current_conversation[-1], dict) and 'conversation_text' in self.current_conversation[-1]:
-                conversation_text = self.current_conversation[-1]['conversation_text']
+            backend = self.prefill_backend(session)
+            if backend is None:
+                return
+            with self.metrics.span("prewarm"):
+                self.http.post(backend.url, json=self.prewarm_payload(session, backend), timeout=60).close()
+            log.info("🔥 Modèle préchauffé sur %s", backend.name)
+        except Exception as e:
+            log.warning("⚠️  Préchauffage Ollama: %s", e)
+
+    def start_speculation(self, session, voice_data):
+        if self.outstanding_turns >= self.turn_budget:
+            # Ollama saturé : pas de génération qui risque d'être jetée
+            self.metrics.inc("admission_total", decision="speculation_shed")
+            log.info("🚦 Spéculation ignorée (%d tours en cours)", self.outstanding_turns)
+            return
+        conversation = list(session.current_conversation) + [voice_data]
+        self.cancel_speculation(session)
+        speculation = SpeculativeTurn(voice_data.get('utterance_id'), conversation,
+                                      self.extract_conversation_text(conversation), next(self.turn_counter))
+        speculation.trace = current_trace.get() or self.metrics.new_trace()
+        speculation.trace.turn = turn_id(session.key, speculation.utterance_id)
+        session.speculative_turn = speculation
+        self.submit(session, self.speculate_turn, speculation)
+
+    def cancel_speculation(self, session):
+        speculation = session.speculative_turn
+        session.speculative_turn = None
+        if speculation:
+            with speculation.lock:
+                speculation.cancelled = True
+            self.metrics.finish(speculation.trace, "speculation_cancelled")
+
+    def cancel_turn(self, session, utterance_id=None):
+        """Barge-in : le robot s'est tu, la génération de ce tour (et des précédents) ne sert plus"""
+        cancelled = 0
+        speculation = session.speculative_turn
+        if speculation and (utterance_id is None or speculation.utterance_id is None
+                            or speculation.utterance_id <= utterance_id):
+            self.cancel_speculation(session)
+            cancelled += 1
+        with self.admission_lock:
+            for ticket in list(session.queued_turns):
+                if utterance_id is None or ticket.utterance_id is None or ticket.utterance_id <= utterance_id:
+                    session.queued_turns.remove(ticket)
+                    ticket.superseded = ticket.cancelled = True
+                    self._release(ticket)
+                    cancelled += 1
+        active = session.active_turn
+        if active is not None and (utterance_id is None or active.utterance_id is None
+                                   or active.utterance_id <= utterance_id):
+            self._cancel_active(active)
+            cancelled += 1
+        if cancelled:
+            self.metrics.inc("barge_in_total")
+            log.info("✋ Barge-in : %d tour(s) annulé(s) (énoncé %s)", cancelled, utterance_id)
+
+    def supersede_active_turn(self, session, utterance_id):
+        """Le visiteur a repris la parole : la génération d'un énoncé plus ancien ne sert plus"""
+        active = session.active_turn
+        if (active is None or active.cancelled or utterance_id is None or active.utterance_id is None
+                or active.utterance_id >= utterance_id):
+            return
+        self._cancel_active(active)
+        self.metrics.inc("admission_total", decision="superseded")
+        log.info("🚦 Tour en cours (énoncé %s) remplacé par l'énoncé %s", active.utterance_id, utterance_id)
+
+    def _cancel_active(self, active):
+        if isinstance(active, SpeculativeTurn):
+            with active.lock:
+                active.cancelled = True
+            self.metrics.finish(active.trace, "barge_in")
+        else:
+            active.cancelled = True
+
+    def speculate_turn(self, session, speculation):
+        if speculation.cancelled:
+            return
+        with turn_context(session.key, speculation.utterance_id), trace_context(speculation.trace):
+            response = self.stream_with_gemma2(session, speculation.conversation,
+                                               lambda sentence: self.speculative_sentence(session, speculation, sentence),
+                                               speculation=speculation)
+            self.speculation_done(session, speculation, response)
+
+    def speculative_sentence(self, session, speculation, sentence):
+        with speculation.lock:
+            if speculation.cancelled:
+                return
+            speculation.sentences.append(sentence)
+            if speculation.committed:
+                self.send_response_to_pepper(sentence, session, turn_id=speculation.turn_id,
+                                             seq=len(speculation.sentences) - 1, final=False,
+                                             utterance_id=speculation.utterance_id)
+
+    def speculation_done(self, session, speculation, response):
+        with speculation.lock:
+            speculation.done = True
+            speculation.response = response
+            if speculation.committed and not speculation.cancelled:
+                self.complete_speculation(session, speculation)
+
+    def commit_speculation(self, session, speculation):
+        with speculation.lock, trace_context(speculation.trace):
+            speculation.committed = True
+            if not speculation.done:
+                session.active_turn = speculation
+            for seq, sentence in enumerate(speculation.sentences):
+                self.send_response_to_pepper(sentence, session, turn_id=speculation.turn_id,
+                                             seq=seq, final=False, utterance_id=speculation.utterance_id)
+            if speculation.done:
+                self.complete_speculation(session, speculation)
+
+    def complete_speculation(self, session, speculation):
+        # Appelé sous speculation.lock, une fois le tour confirmé ET la génération terminée
+        if session.active_turn is speculation:
+            session.active_turn = None
+        if speculation.response and speculation.response not in FALLBACK_RESPONSES:
+            self.cache_response(session, speculation.conversation_text, speculation.response)
+            self.remember_exchange(session, speculation.conversation_text, speculation.response)
+        self.send_response_to_pepper('', session, turn_id=speculation.turn_id,
+                                     seq=len(speculation.sentences), final=True,
+                                     utterance_id=speculation.utterance_id)
+        self.metrics.finish(speculation.trace, "speculation_committed")
+
+    def admit_turn(self, session, conversation, trace=None):
+        """Admission d'un tour définitif : file bornée par robot et globale, avec délai"""
+        utterance_id = conversation[-1].get('utterance_id')
+        self.supersede_active_turn(session, utterance_id)
+        superseded = 0
+        ticket = None
+        with self.admission_lock:
+            # Les tours en file plus anciens du même robot sont dépassés : on les abandonne
+            while len(session.queued_turns) >= self.max_session_queue:
+                old = session.queued_turns.popleft()
+                old.superseded = True
+                superseded += 1
+                self._release(old)
+            if self.outstanding_turns >= self.max_outstanding_turns:
+                decision = "rejected"
             else:
-                # fallback mots chunks si jamais utile
-                detected_words = []
-                for chunk in self.current_conversation:
-                    words = chunk.get('words')
-                    if words and isinstance(words, str):
-                        detected_words.append(words)
-                conversation_text = " ".join(detected_words).strip()
-            
-            print(f"🧠 GEMMA2 PROMPT envoyé : '{conversation_text}'")
+                ticket = TurnTicket(utterance_id, self.turn_deadline)
+                session.queued_turns.append(ticket)
+                self.outstanding_turns += 1
+                decision = "filler" if self.outstanding_turns > self.turn_budget else "admitted"
+            outstanding = self.outstanding_turns
 
-            if not conversation_text.strip():
-                print("🚨 conversation_text vide, envoi réponse défaut")
-                return "Je n'ai pas bien compris. Pouvez-vous répéter ?"
-
-            system_prompt = (
-                "Tu es un assistant professionnel dans un événement. "
-                "Réponds de manière concise, claire et professionnelle. "
-                "Maximum 2 phrases courtes. Sois naturel et aidant."
-            )
-
-            context = ""
-            if self.conversation_context:
-                context = "\n".join([f"H: {h}\nA: {a}" for h, a in self.conversation_context[-3:]])
-                context = f"\nContexte récent:\n{context}\n"
-
-            full_prompt = (
-                f"{system_prompt}{context}\n"
-                f"Humain: {conversation_text}\n"
-                f"Assistant:"
-            )
-
-            print(f"🧠 PROMPT FINAL:\n{full_prompt}\n")
-
-            # Appel à Ollama
-            start_time = time.time()
-            response = requests.post(self.ollama_url, json={
-                "model": self.model_name,
-                "prompt": full_prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "top_k": 40,
-                    "repeat_penalty": 1.1,
-                    "num_ctx": 4096,
-                    "num_predict": 100,
-                    "stop": ["Humain:", "H:"]
-                }
-            }, timeout=30)
-
-            processing_time = time.time() - start_time
+        if superseded:
+            self.metrics.inc("admission_total", superseded, decision="superseded")
+            log.info("🚦 %d tour(s) en file remplacé(s) par l'énoncé %s", superseded, utterance_id)
+        self.metrics.inc("admission_total", decision=decision)
+        if decision == "rejected":
+            log.warning("🚦 Tour refusé : %d tours en cours (max %d)", outstanding, self.max_outstanding_turns)
+            self.send_response_to_pepper(FALLBACK_BUSY, session, utterance_id=utterance_id)
+            self.metrics.finish(trace, "rejected")
+            return
+        if decision == "filler":
+            log.info("🚦 File chargée (%d tours) : réponse d'attente", outstanding)
+            self.send_response_to_pepper(FILLER_WAIT, session, utterance_id=utterance_id)
+        self.submit(session, self.run_turn, ticket, conversation, trace)
 
-            if response.status_code == 200:
-                result = response.json()
-                print(f"🧠 Réponse RAW Ollama JSON:\n{result}\n")
-                gemma_response = result.get('response', '').strip()
-                gemma_response = self.clean_response(gemma_response)
-                self.conversation_context.append((conversation_text, gemma_response))
-                if len(self.conversation_context) > self.max_context_length:
-                    self.conversation_context.pop(0)
-                print(f"⚡ GEMMA2 RÉPOND ({processing_time:.2f}s): '{gemma_response}'")
-                return gemma_response
+    def _release(self, ticket):
+        # Appelé sous admission_lock
+        if not ticket.released:
+            ticket.released = True
+            self.outstanding_turns -= 1
+
+    def start_turn(self, session, ticket, trace):
+        """True si le tour doit être traité maintenant ; sinon il est abandonné (et libéré)"""
+        with self.admission_lock:
+            if ticket in session.queued_turns:
+                session.queued_turns.remove(ticket)
+            superseded = ticket.superseded
+            expired = not superseded and time.time() > ticket.deadline
+            if expired:
+                self._release(ticket)
+        if superseded:
+            self.metrics.finish(trace, "superseded")
+            return False
+        if expired:
+            self.metrics.inc("admission_total", decision="expired")
+            log.warning("🚦 Tour abandonné : %.1fs d'attente", time.time() - ticket.queued_at)
+            self.send_response_to_pepper(FALLBACK_TIMEOUT, session, utterance_id=ticket.utterance_id)
+            self.metrics.finish(trace, "expired")
+            return False
+        self.metrics.observe("stage_seconds", time.time() - ticket.queued_at, stage="queue_wait")
+        session.active_turn = ticket
+        return True
+
+    def release_turn(self, session, ticket):
+        if session.active_turn is ticket:
+            session.active_turn = None
+        with self.admission_lock:
+            self._release(ticket)
+
+    def run_turn(self, session, ticket, conversation, trace=None):
+        if not self.start_turn(session, ticket, trace):
+            return
+        try:
+            self.answer_turn(session, conversation, trace, ticket)
+        finally:
+            self.release_turn(session, ticket)
+
+    def answer_turn(self, session, conversation, trace=None, ticket=None):
+        utterance_id = conversation[-1].get('utterance_id')
+        trace = trace or self.metrics.new_trace()
+        trace.turn = turn_id(session.key, utterance_id)
+        with turn_context(session.key, utterance_id), trace_context(trace):
+            if self.streaming:
+                self.stream_response_to_pepper(session, conversation, ticket)
             else:
-                print(f"❌ Erreur Ollama: {response.status_code} {response.text}")
-                return "Je rencontre un problème technique. Pouvez-vous réessayer ?"
+                llm_response = self.process_with_gemma2(session, conversation)
+                if not (ticket and ticket.cancelled):
+                    self.send_response_to_pepper(llm_response, session, utterance_id=utterance_id)
+        self.metrics.finish(trace, "barge_in" if ticket and ticket.cancelled else "answered")
 
-        except requests.Timeout:
-            print("⏱️ Timeout Ollama !")
-            return "Désolé, je réfléchis trop lentement. Pouvez-vous répéter ?"
+    def extract_conversation_text(self, conversation):
+        """Texte de la conversation, supporte conversation_text direct"""
+        if conversation and isinstance(conversation[-1], dict) and 'conversation_text' in conversation[-1]:
+            return conversation[-1]['conversation_text']
+        # fallback mots chunks si jamais utile
+        detected_words = []
+        for chunk in conversation:
+            words = chunk.get('words')
+            if words and isinstance(words, str):
+                detected_words.append(words)
+        return " ".join(detected_words).strip()
+
+    def build_prompt(self, session, conversation_text):
+        context, _ = session.context.render(self.context_budget)
+        if context:
+            context = f"\nContexte récent:\n{context}\n"
+
+        return (
+            f"{self.system_prompt}{context}\n"
+            f"Humain: {conversation_text}\n"
+            f"Assistant:"
+        )
+
+    def generation_payload(self, session, conversation_text, stream, backend=None):
+        with self.metrics.span("prompt_build"):
+            return self._generation_payload(session, conversation_text, stream, backend or self.router.primary)
+
+    def _generation_payload(self, session, conversation_text, stream, backend):
+        payload = {
+            "model": backend.model,
+            "prompt": self.build_prompt(session, conversation_text),
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": dict(self.generation_options)
+        }
+        if self.prompt_mode == "context" and session.ollama_context and not backend.small:
+            # Système + historique déjà dans le KV cache : seul le nouveau tour est évalué
+            payload["prompt"] = f"\nHumain: {conversation_text}\nAssistant:"
+            payload["context"] = session.ollama_context
+        return payload
+
+    def record_generation(self, session, payload, result, backend=None):
+        """Mémorise le context Ollama du tour et cumule les compteurs prompt-eval.
+
+        result vaut None si la génération a été interrompue (pas de context renvoyé).
+        Le context d'un petit modèle n'est pas gardé : il ne vaut que pour ce modèle.
+        """
+        if self.prompt_mode == "context" and not (backend and backend.small):
+            context = result.get('context') if result else None
+            # Proche de num_ctx : on repart du préfixe fixe plutôt que de laisser Ollama tronquer
+            if context and len(context) > self.num_ctx * 3 // 4:
+                context = None
+            session.ollama_context = context
+
+        if not result or not result.get('done'):
+            self.metrics.inc("generations_total", outcome="interrupted")
+            return
+        # Durées mesurées par Ollama lui-même (nanosecondes)
+        self.metrics.inc("generations_total", outcome="done")
+        self.metrics.record("ollama_load", result.get('load_duration', 0) / 1e9)
+        self.metrics.record("ollama_prompt_eval", result.get('prompt_eval_duration', 0) / 1e9)
+        self.metrics.record("ollama_eval", result.get('eval_duration', 0) / 1e9)
+        self.metrics.inc("ollama_prompt_tokens_total", result.get('prompt_eval_count', 0))
+        self.metrics.inc("ollama_eval_tokens_total", result.get('eval_count', 0))
+        mode = "context" if "context" in payload else "prompt"
+        tokens = result.get('prompt_eval_count', 0)
+        eval_ms = result.get('prompt_eval_duration', 0) / 1e6
+        stats = self.prompt_eval_stats[mode]
+        stats['turns'] += 1
+        stats['tokens'] += tokens
+        stats['ms'] += eval_ms
+        log.debug("🧮 prompt_eval (%s): %d tokens en %.0f ms", mode, tokens, eval_ms)
+
+    def prompt_eval_report(self):
+        for mode, stats in self.prompt_eval_stats.items():
+            if stats['turns']:
+                print(f"🧮 {mode}: {stats['tokens'] / stats['turns']:.0f} tokens et "
+                      f"{stats['ms'] / stats['turns']:.0f} ms de prompt-eval par tour ({stats['turns']} tours)")
+
+    def remember_exchange(self, session, conversation_text, gemma_response):
+        session.context.append(conversation_text, gemma_response)
+
+    @property
+    def context_budget(self):
+        """Tokens d'historique autorisés dans le prompt"""
+        return int(self.num_ctx * self.context_ratio)
+
+    def reset_context(self, session, reason):
+        session.context.reset()
+        session.ollama_context = None
+        self.metrics.inc("context_resets_total", reason=reason)
+        log.info("🧹 Historique de %s remis à zéro (%s)", session.key, reason)
+
+    def visitor_changed(self, session, person_id):
+        """Autre visiteur qu'au dernier échange, et historique inactif : on repart de zéro"""
+        previous, session.visitor_id = session.visitor_id, person_id
+        if person_id is None or previous is None or person_id == previous:
+            return False
+        return bool(len(session.context)) and time.time() - session.context.last_update > self.visitor_reset_idle
+
+    def summary_candidates(self, now=None):
+        """(session, demande de résumé) des sessions inactives dont des échanges sortent du budget"""
+        now = now or time.time()
+        if self.summary_backend() is None:
+            # Disjoncteurs ouverts : pas de résumé tant que les sondes n'ont pas rétabli un backend
+            return []
+        with self.sessions_lock:
+            sessions = list(self.sessions.values())
+        candidates = []
+        for session in sessions:
+            if (session.conversation_active or session.active_turn is not None
+                    or now - session.context.last_update < self.summary_idle):
+                continue
+            request = session.context.summary_request(self.context_budget, now)
+            if request is not None:
+                candidates.append((session, request))
+        return candidates
+
+    def summary_payload(self, request, backend):
+        _, summary, folded = request
+        history = "\n".join(format_exchange(exchange.question, exchange.answer) for exchange in folded)
+        if summary:
+            history = f"Résumé précédent: {summary}\n{history}"
+        return {
+            "model": backend.model,
+            "prompt": (
+                "Résume cet échange entre un visiteur (H) et l'assistant (A) d'un événement en une ou deux "
+                "phrases : ce que le visiteur cherche et ce qui lui a été répondu. Pas de préambule.\n"
+                f"{history}\nRésumé:"
+            ),
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {"temperature": 0.2, "num_ctx": self.num_ctx, "num_predict": self.summary_tokens},
+        }
+
+    def summary_backend(self):
+        # Petit modèle de préférence : le résumé ne doit pas occuper le gros modèle
+        return self.router.choose(prefer_small=True)
+
+    def apply_summary(self, session, request, summary):
+        summary = " ".join(summary.split()) if summary else None
+        applied = session.context.apply_summary(request, summary)
+        self.metrics.inc("context_summaries_total", outcome="applied" if applied else "failed")
+        if applied:
+            log.info("📝 Historique de %s résumé (%d échanges) : %s", session.key, len(request[2]), summary)
+
+    def summarize_context(self, session, request):
+        summary = None
+        try:
+            backend = self.summary_backend()
+            if backend is None:
+                return
+            backend.last_activity = time.time()
+            with self.metrics.span("context_summary"):
+                response = self.http.post(backend.url, json=self.summary_payload(request, backend), timeout=30)
+            if response.status_code == 200:
+                summary = response.json().get('response', '').strip()
         except Exception as e:
-            print(f"❌ Erreur Gemma2: {e}")
-            return "Je n'ai pas pu traiter votre demande. Reformulez s'il vous plaît."
+            log.warning("⚠️  Résumé de l'historique: %s", e)
+        finally:
+            self.apply_summary(session, request, summary)
+
+    def embed_text(self, text):
+        embeddings_url = self.router.primary.endpoint("embeddings")
+        response = self.http.post(embeddings_url, json={"model": self.cache_embed_model, "prompt": text},
+                                  timeout=5)
+        response.raise_for_status()
+        return response.json()['embedding']
+
+    def cache_context(self, session):
+        # La même question n'a pas la même réponse selon l'échange précédent
+        return session.context.last_question()
+
+    def cached_response(self, session, conversation_text, remember=True):
+        response = self.response_cache.get(conversation_text, self.cache_context(session))
+        if response is not None:
+            self.metrics.inc("cache_hits_total")
+            log.info("💾 CACHE HIT: '%s'", response)
+            self.remember_frequent(response)
+            session.reply_source = "cache"
+            if remember:
+                self.remember_exchange(session, conversation_text, response)
+        return response
+
+    def cache_response(self, session, conversation_text, gemma_response):
+        # Appelé avant remember_exchange : même contexte qu'à la recherche
+        if gemma_response and gemma_response not in FALLBACK_RESPONSES:
+            self.response_cache.put(conversation_text, gemma_response, self.cache_context(session))
+
+    def route_generation(self, session, conversation_text, exclude=()):
+        """Réserve un backend pour ce tour (même serveur que la session si possible) ; None si tous coupés"""
+        backend = self.router.acquire(conversation_text, preferred=session.backend, exclude=exclude)
+        if backend is None:
+            self.metrics.inc("no_backend_total")
+            log.error("❌ Aucun backend Ollama disponible")
+            return None
+        if not backend.small and backend is not session.backend:
+            if session.backend is not None:
+                log.info("🔀 Session %s : %s -> %s", session.key, session.backend.name, backend.name)
+            # Les tokens de context ne valent que pour le serveur qui les a produits
+            session.ollama_context = None
+            session.backend = backend
+        if exclude:
+            self.metrics.inc("backend_failovers_total")
+        self.metrics.inc("backend_requests_total", backend=backend.name)
+        # Petit modèle ou bascule compris : le robot voit le backend qui a réellement répondu
+        session.reply_source = backend.name
+        return backend
+
+    def process_with_gemma2(self, session, conversation):
+        """Traitement ultra-optimisé avec Gemma2:9B"""
+        try:
+            conversation_text = self.extract_conversation_text(conversation)
+            log.info("🧠 GEMMA2 PROMPT envoyé : '%s'", conversation_text)
+
+            if not conversation_text.strip():
+                log.warning("🚨 conversation_text vide, envoi réponse défaut")
+                return FALLBACK_NOT_UNDERSTOOD
+
+            cached = self.cached_response(session, conversation_text)
+            if cached is not None:
+                return cached
+
+            tried = []
+            while True:
+                backend = self.route_generation(session, conversation_text, tried)
+                if backend is None:
+                    return FALLBACK_TECHNICAL
+                tried.append(backend)
+                payload = self.generation_payload(session, conversation_text, False, backend)
+                log.debug("🧠 PROMPT FINAL (%s):\n%s", backend.name, payload['prompt'])
+
+                # Appel à Ollama ; serveur injoignable ou en erreur 5xx : on bascule sur un autre
+                start_time = time.time()
+                ok = False
+                try:
+                    response = self.http.post(backend.url, json=payload, timeout=self.generation_timeout)
+                    ok = response.status_code < 500
+                except requests.ConnectionError as e:
+                    log.warning("🔀 %s injoignable : %s", backend.name, e)
+                    continue
+                finally:
+                    self.router.release(backend, ok, time.time() - start_time)
+
+                processing_time = time.time() - start_time
+                if response.status_code == 200:
+                    result = response.json()
+                    self.record_generation(session, payload, result, backend)
+                    return self.handle_generation(session, conversation_text, result, processing_time)
+                log.error("❌ Erreur Ollama (%s): %s %s", backend.name, response.status_code, response.text)
+                if ok:
+                    return FALLBACK_TECHNICAL
+
+        except requests.Timeout:
+            self.metrics.inc("ollama_timeouts_total")
+            log.warning("⏱️ Timeout Ollama !")
+            return FALLBACK_TIMEOUT
+        except Exception:
+            log.exception("❌ Erreur Gemma2")
+            return FALLBACK_ERROR
+
+    def handle_generation(self, session, conversation_text, result, processing_time):
+        log.debug("🧠 Réponse RAW Ollama JSON: %s", result)
+        gemma_response = result.get('response', '').strip()
+        gemma_response = self.clean_response(gemma_response)
+        self.cache_response(session, conversation_text, gemma_response)
+        self.remember_exchange(session, conversation_text, gemma_response)
+        log.info("⚡ GEMMA2 RÉPOND (%.2fs): '%s'", processing_time, gemma_response)
+        return gemma_response
+
+    def stream_with_gemma2(self, session, conversation, on_sentence, speculation=None, cancel=None):
+        """Streaming NDJSON Ollama : on_sentence(phrase) appelé à chaque phrase complète.
+
+        La génération est interrompue (connexion fermée) dès que
+        max_sentences phrases ont été émises. Retourne la réponse complète.
+        Avec speculation, l'échange n'est pas mémorisé (fait à la confirmation)
+        et la génération s'arrête si le tour est annulé ; retourne alors None.
+        cancel (TurnTicket) arrête de même un tour définitif coupé par le visiteur.
+        """
+        accumulator = SentenceStream(self.max_sentences, self.clean_sentence)
+        remember = speculation is None
+        cancel = cancel or speculation
+
+        try:
+            conversation_text = self.extract_conversation_text(conversation)
+            log.info("🧠 GEMMA2 PROMPT (stream) envoyé : '%s'", conversation_text)
+
+            if not conversation_text.strip():
+                log.warning("🚨 conversation_text vide, envoi réponse défaut")
+                on_sentence(FALLBACK_NOT_UNDERSTOOD)
+                return FALLBACK_NOT_UNDERSTOOD
+
+            cached = self.cached_response(session, conversation_text, remember)
+            if cached is not None:
+                return self.replay_cached(cached, on_sentence)
+
+            tried = []
+            timed_out = False
+            while True:
+                backend = self.route_generation(session, conversation_text, tried)
+                if backend is None:
+                    fallback = FALLBACK_TIMEOUT if timed_out else FALLBACK_TECHNICAL
+                    return self.stream_fallback(accumulator, on_sentence, fallback)
+                tried.append(backend)
+                payload = self.generation_payload(session, conversation_text, True, backend)
+                start_time = time.time()
+                final_chunk = None
+                first_token = None
+                ok = False
+                try:
+                    response = self.http.post(backend.url, json=payload, stream=True,
+                                              timeout=self.generation_timeout)
+                except requests.RequestException as e:
+                    # Injoignable ou trop lent à répondre (en-têtes) : rien n'a encore été dit,
+                    # le backend est compté en échec et on bascule sur un autre serveur
+                    self.router.release(backend, False)
+                    if isinstance(e, requests.Timeout):
+                        timed_out = True
+                        self.metrics.inc("ollama_timeouts_total")
+                    log.warning("🔀 %s injoignable ou trop lent : %s", backend.name, e)
+                    continue
+                try:
+                    if response.status_code != 200:
+                        log.error("❌ Erreur Ollama (%s): %s %s", backend.name, response.status_code, response.text)
+                        if response.status_code >= 500:
+                            continue
+                        ok = True
+                        on_sentence(FALLBACK_TECHNICAL)
+                        return FALLBACK_TECHNICAL
+
+                    for line in response.iter_lines():
+                        if cancel is not None and cancel.cancelled:
+                            log.debug("🗑️ Génération abandonnée")
+                            break
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if first_token is None:
+                            # Vu du client : chargement + prompt-eval, mesuré même si le flux est coupé
+                            first_token = time.time()
+                            self.metrics.record("ollama_first_token", first_token - start_time)
+                        for sentence in accumulator.feed(chunk.get('response', '')):
+                            on_sentence(sentence)
+                        if accumulator.limit_reached:
+                            # Fermer la connexion arrête la génération côté Ollama
+                            log.debug("✂️ Limite de %d phrases atteinte, génération interrompue", self.max_sentences)
+                            break
+                        if chunk.get('done'):
+                            final_chunk = chunk
+                            break
+                    ok = True
+                finally:
+                    response.close()
+                    self.router.release(backend, ok, (first_token or time.time()) - start_time)
+                break
+
+            self.record_generation(session, payload, final_chunk, backend)
+            if cancel is not None and cancel.cancelled:
+                return None
+
+            return self.finish_stream(session, conversation_text, accumulator, on_sentence, start_time, remember)
+
+        except requests.Timeout:
+            self.metrics.inc("ollama_timeouts_total")
+            log.warning("⏱️ Timeout Ollama !")
+            return self.stream_fallback(accumulator, on_sentence, FALLBACK_TIMEOUT)
+        except Exception:
+            log.exception("❌ Erreur Gemma2 (stream)")
+            return self.stream_fallback(accumulator, on_sentence, FALLBACK_ERROR)
+
+    def finish_stream(self, session, conversation_text, accumulator, on_sentence, start_time, remember=True):
+        for sentence in accumulator.flush():
+            on_sentence(sentence)
+        if not accumulator.sentences:
+            on_sentence(FALLBACK_NOT_UNDERSTOOD)
+            return FALLBACK_NOT_UNDERSTOOD
+
+        gemma_response = accumulator.text
+        if remember:
+            self.cache_response(session, conversation_text, gemma_response)
+            self.remember_exchange(session, conversation_text, gemma_response)
+        log.info("⚡ GEMMA2 STREAM (%.2fs): '%s'", time.time() - start_time, gemma_response)
+        return gemma_response
+
+    def replay_cached(self, cached, on_sentence):
+        accumulator = SentenceStream(self.max_sentences, str.strip)
+        for sentence in accumulator.feed(cached) + accumulator.flush():
+            self.remember_frequent(sentence)
+            on_sentence(sentence)
+        return cached
+
+    def remember_frequent(self, sentence):
+        with self.frequent_lock:
+            self.frequent_sentences[sentence] = True
+            self.frequent_sentences.move_to_end(sentence)
+            while len(self.frequent_sentences) > self.max_frequent_sentences:
+                self.frequent_sentences.popitem(last=False)
+
+    def tts_cache_key(self, text):
+        """Clé d'audio pré-rendu pour les phrases qui reviennent (réponses fixes, cache de réponses)"""
+        if text and (text in CANNED_REPLIES or text in self.frequent_sentences):
+            return text_key(text)
+        return None
+
+    def stream_fallback(self, accumulator, on_sentence, fallback):
+        # Rien n'a encore été dit : on envoie la réponse de secours
+        if not accumulator.sentences:
+            on_sentence(fallback)
+        return accumulator.text or fallback
+
+    def stream_response_to_pepper(self, session, conversation, ticket=None):
+        """Envoie chaque phrase comme fragment llm_response numéroté"""
+        turn_id = next(self.turn_counter)
+        utterance_id = conversation[-1].get('utterance_id')
+        fragments = []
+
+        def send_fragment(sentence):
+            if ticket and ticket.cancelled:
+                return
+            fragments.append(sentence)
+            self.send_response_to_pepper(sentence, session, turn_id=turn_id,
+                                         seq=len(fragments) - 1, final=False, utterance_id=utterance_id)
+
+        self.stream_with_gemma2(session, conversation, send_fragment, cancel=ticket)
+        if ticket and ticket.cancelled:
+            return
+        # Marqueur de fin de tour (texte vide) pour que le client sache que c'est terminé
+        self.send_response_to_pepper('', session, turn_id=turn_id, seq=len(fragments), final=True,
+                                     utterance_id=utterance_id)
 
     def clean_response(self, response):
-        response = re.sub(r'^(Assistant|A):\s*', '', response)
-        response = re.sub(r'^(Réponse|Response):\s*', '', response)
-        response = response.replace('*', '').replace('#', '')
-        sentences = response.split('. ')
-        if len(sentences) > 2:
-            response = '. '.join(sentences[:2]) + '.'
-        return response.strip()
-
-    def send_response_to_pepper(self, llm_response, pepper_ip):
+        with self.metrics.span("clean_response"):
+            return speech_text.clean_response(response, self.max_sentences)
+
+    def clean_sentence(self, sentence):
+        with self.metrics.span("clean_response"):
+            return speech_text.clean_sentence(sentence)
+
+    def response_payload(self, llm_response, turn_id=None, seq=None, final=True, utterance_id=None, codec="json",
+                         model=None):
+        response_data = {
+            'type': 'llm_response',
+            'text': llm_response,
+            'timestamp': time.time(),
+            'model': model
+        }
+        if seq is not None:
+            response_data['turn_id'] = turn_id
+            response_data['seq'] = seq
+            response_data['final'] = final
+        if utterance_id is not None:
+            # Le client ignore les réponses à un énoncé déjà dépassé
+            response_data['utterance_id'] = utterance_id
+        cache_key = self.tts_cache_key(llm_response)
+        if cache_key:
+            # Le robot rejoue l'audio déjà rendu au lieu de resynthétiser
+            response_data['cache_key'] = cache_key
+            self.metrics.inc("tts_cache_tagged_total")
+        return wire_format.encode(response_data, codec)
+
+    def reply_address(self, session):
+        """Adresse déclarée pour ce robot dans la config, sinon celle d'où il écrit (NAT et WSL compris)"""
+        return self.robots.get(session.key) or session.addr
+
+    def apply_config(self, config):
+        """Réglages modifiables sans redémarrage : options Ollama, historique, robots déclarés"""
+        self.config = config
+        self.apply_generation_options(config.section("generation"))
+        system_prompt = self.system_prompt
+        for key, value in config.section("conversation").items():
+            if key in DEFAULTS["conversation"]:
+                setattr(self, key, value)
+            else:
+                log.warning("⚠️  Réglage de conversation inconnu ignoré : %s", key)
+        if self.system_prompt != system_prompt:
+            self.drop_ollama_contexts()
+        self.robots = {robot_id: parse_address(address, self.pepper_port)
+                       for robot_id, address in config.section("robots").items()}
+
+    def drop_ollama_contexts(self):
+        """Mode context : l'ancien prompt système est dans les tokens réutilisés, on repart d'un prompt complet"""
+        with self.sessions_lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.ollama_context = None
+        if sessions:
+            log.info("🧹 Prompt système modifié : context Ollama oublié pour %d session(s)", len(sessions))
+
+    def apply_generation_options(self, options):
+        changes = {key: value for key, value in options.items() if self.generation_options.get(key) != value}
+        removed = set(self.generation_options) - set(options)
+        # Une seule affectation : un tour en cours garde les options avec lesquelles il a commencé
+        self.generation_options = dict(options)
+        if changes or removed:
+            log.info("⚙️  Options de génération : %s%s", changes,
+                     f", retirées {sorted(removed)}" if removed else "")
+
+    def on_config_change(self, config, sections):
+        self.apply_config(config)
+        self.metrics.inc("config_reloads_total")
+        log.info("🔄 Configuration rechargée (%s)", ", ".join(sorted(sections)))
+        if "server" in sections:
+            log.warning("⚠️  Section server modifiée : prise en compte au prochain redémarrage")
+
+    def watch_config(self, config):
+        """Recharge à chaud quand le fichier de config change ; les sessions en cours sont conservées"""
+        self.apply_config(config)
+        if config.watch(self.on_config_change, config.get("server", "config_poll", 2.0)):
+            print(f"🔄 Configuration surveillée : {config.path}")
+
+    def send_response_to_pepper(self, llm_response, session, turn_id=None, seq=None, final=True,
+                                utterance_id=None):
         try:
-            response_data = {
-                'type': 'llm_response',
-                'text': llm_response,
-                'timestamp': time.time(),
-                'model': 'gemma2:9b'
-            }
-            json_data = json.dumps(response_data, ensure_ascii=False)
-            payload = json_data.encode('utf-8')
-            
-            # ✅ CORRECTION : Envoie vers WSL, pas vers Pepper physique
-            wsl_ip = "172.25.227.111"  # Ton IP WSL
-            print(f"🟢 Envoi réponse LLM à {wsl_ip}:{self.pepper_port} (WSL)")
-            self.pepper_sock.sendto(payload, (wsl_ip, self.pepper_port))
-            
-        except Exception as e:
-            print(f"❌ Erreur envoi: {e}")
+            with self.metrics.span("send"):
+                codec = self.wire_codec or self.peer_codecs.get(session.addr[0], "json")
+                payload = self.response_payload(llm_response, turn_id, seq, final, utterance_id, codec,
+                                                self.reply_model(llm_response, session))
+                reply_addr = self.reply_address(session)
+                log.debug("🟢 Envoi réponse LLM à %s:%d", reply_addr[0], reply_addr[1])
+                self.udp.send(payload, reply_addr)
+            self.count_response(llm_response)
+
+        except Exception:
+            log.exception("❌ Erreur envoi")
+
+    def reply_model(self, llm_response, session):
+        """Champ model d'une réponse : backend Ollama (nom de backend_requests_total), cache ou canned"""
+        if llm_response in CANNED_REPLIES:
+            return "canned"
+        return session.reply_source
+
+    def count_response(self, llm_response):
+        if llm_response in FALLBACK_KINDS:
+            self.metrics.inc("fallbacks_total", kind=FALLBACK_KINDS[llm_response])
+        trace = current_trace.get()
+        if trace is not None and llm_response:
+            trace.response_sent()
+
+    def metrics_gauges(self):
+        gauges = [("udp_" + name, {}, value) for name, value in self.udp.stats.items()]
+        for backend in self.router.all_backends():
+            gauges.append(("backend_outstanding", {"backend": backend.name}, backend.outstanding))
+            gauges.append(("backend_circuit_open", {"backend": backend.name}, int(backend.state != "closed")))
+        gauges.append(("sessions", {}, len(self.sessions)))
+        gauges.append(("turns_outstanding", {}, self.outstanding_turns))
+        gauges.append(("turns_queued", {}, sum(len(session.queued_turns) for session in list(self.sessions.values()))))
+        gauges.append(("sessions_busy", {}, sum(1 for session in list(self.sessions.values()) if session.running)))
+        return gauges
+
+    def start_metrics(self, port=None, stats_file=None, stats_interval=10.0):
+        """Exporte les métriques : HTTP /metrics + /stats sur port, et/ou fichier JSON périodique"""
+        if port:
+            self.metrics_server = serve_metrics(self.metrics, port)
+            print(f"📊 Métriques: http://0.0.0.0:{port}/metrics")
+        if stats_file:
+            self.stats_writer = StatsFileWriter(self.metrics, stats_file, stats_interval).start()
+            print(f"📊 Stats écrites dans {stats_file} toutes les {stats_interval:.0f}s")
+
+    def stop_metrics(self):
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+        if self.stats_writer:
+            self.stats_writer.stop()
+            self.stats_writer = None
 
     def stop_server(self):
         self.is_running = False
+        self.stop_metrics()
+        self.executor.shutdown(wait=False)
+        self.background_executor.shutdown(wait=False)
+        self.http.close()
+        self.response_cache.stop_saver()
+        self.response_cache.save()
+        print(f"💾 Cache de réponses: {self.response_cache.stats()}")
+        self.prompt_eval_report()
+        self.udp.stop()
+        print(f"📶 Transport UDP: {dict(self.udp.stats)}")
         self.sock.close()
-        self.pepper_sock.close()
         print("🛑 Serveur Gemma2 arrêté")
 
+
 if __name__ == "__main__":
+    import argparse
+
+    # Options absentes de la ligne de commande : valeur du fichier de config, de l'environnement, ou défaut
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default=None,
+                        help="Fichier de config JSON (défaut : $PEPPER_CONFIG), rechargé à chaud s'il change")
+    parser.add_argument("--port", type=int, default=None, help="Port UDP d'écoute (défaut 8888)")
+    parser.add_argument("--mode", choices=["threads", "asyncio"], default=None,
+                        help="threads : serveur historique, asyncio : boucle d'événements unique")
+    parser.add_argument("--max_workers", type=int, default=None, help="Appels LLM concurrents (défaut 4)")
+    parser.add_argument("--keep_alive", default=None,
+                        help="Durée de maintien du modèle en VRAM côté Ollama (ex: 30m, -1 = toujours)")
+    parser.add_argument("--cache_file", default=None,
+                        help="Persistance du cache de réponses (vide pour désactiver)")
+    parser.add_argument("--prompt_mode", choices=["prompt", "context"], default=None,
+                        help="context : réutilise le KV cache Ollama par session (préfixe stable)")
+    parser.add_argument("--cache_embed_model", default=None,
+                        help="Modèle d'embeddings Ollama pour le cache approché (ex: nomic-embed-text)")
+    parser.add_argument("--wire", choices=wire_format.CODECS, default=None,
+                        help="Force le format des réponses (par défaut : celui de chaque robot ; json pour déboguer)")
+    parser.add_argument("--log_level", default=None, choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="WARNING en production : aucun formatage sur le chemin critique")
+    parser.add_argument("--log_json", default=None, help="Journal JSON lines (un objet par record, avec le tour)")
+    parser.add_argument("--backend", action="append", default=[],
+                        help=f"Serveur Ollama URL[=modèle], répétable (défaut : {DEFAULT_OLLAMA_URL}={DEFAULT_MODEL})")
+    parser.add_argument("--small_backend", action="append", default=[],
+                        help="Petit modèle rapide pour salutations et énoncés courts, ex: http://hote:11434=gemma2:2b")
+    parser.add_argument("--num_ctx", type=int, default=None, help="Fenêtre de contexte Ollama (tokens)")
+    parser.add_argument("--num_predict", type=int, default=None, help="Tokens générés au plus par réponse")
+    parser.add_argument("--context_ratio", type=float, default=None,
+                        help="Part de num_ctx pour l'historique (résumé + derniers échanges) : 0.05 par défaut "
+                             "(~200 tokens) ; plus = davantage de contexte mais première phrase plus tardive")
+    parser.add_argument("--metrics_port", type=int, default=None,
+                        help="Expose /metrics (Prometheus) et /stats (JSON) sur ce port")
+    parser.add_argument("--stats_file", default=None, help="Fichier de stats JSON réécrit toutes les 10s")
+    args = parser.parse_args()
+
+    config = Config.load(args.config)
+    config.override("server", port=args.port, mode=args.mode, max_workers=args.max_workers,
+                    keep_alive=args.keep_alive, cache_file=args.cache_file, prompt_mode=args.prompt_mode,
+                    cache_embed_model=args.cache_embed_model, wire=args.wire, log_level=args.log_level,
+                    log_json=args.log_json, backends=args.backend, small_backends=args.small_backend,
+                    metrics_port=args.metrics_port, stats_file=args.stats_file)
+    config.override("generation", num_ctx=args.num_ctx, num_predict=args.num_predict)
+    config.override("conversation", context_ratio=args.context_ratio)
+    settings = config.section("server")
+
+    log_listener = setup_logging(settings["log_level"], json_path=settings["log_json"])
+    kwargs = dict(port=settings["port"], max_workers=settings["max_workers"], keep_alive=settings["keep_alive"],
+                  cache_file=settings["cache_file"] or None, prompt_mode=settings["prompt_mode"],
+                  wire_codec=settings["wire"],
+                  backends=[parse_backend(spec, DEFAULT_MODEL) for spec in settings["backends"]] or None,
+                  small_backends=[parse_backend(spec, DEFAULT_SMALL_MODEL) for spec in settings["small_backends"]])
+
     print("🚀 SERVEUR GEMMA2:9B ULTRA-OPTIMISÉ")
     print("   ⚡ RTX 4070 + i9 = Conversations ultra-rapides")
     print("   🎯 Spécialisé événementiel professionnel")
     print("   🧠 Gemma2:9B > Llama 3.1 8B pour conversations")
-    
-    server = OptimizedGemma2Server()
-    
-    try:
-        server.start_server()
-        print("\n✅ Gemma2:9B prêt pour conversations professionnelles!")
-        while True:
-            time.sleep(1)
-            
-    except KeyboardInterrupt:
-        print("\n🛑 Arrêt Gemma2...")
-    finally:
-        server.stop_server()
+
+    if settings["mode"] == "asyncio":
+        from gemma2_async_server import AsyncGemma2Server
+        server = AsyncGemma2Server(**kwargs)
+        server.watch_config(config)
+        server.start_metrics(settings["metrics_port"], settings["stats_file"])
+        try:
+            server.run()
+        except KeyboardInterrupt:
+            print("\n🛑 Arrêt Gemma2...")
+        finally:
+            config.stop()
+    else:
+        server = OptimizedGemma2Server(cache_embed_model=settings["cache_embed_model"], **kwargs)
+        server.watch_config(config)
+
+        try:
+            server.start_server()
+            server.start_metrics(settings["metrics_port"], settings["stats_file"])
+            print("\n✅ Gemma2:9B prêt pour conversations professionnelles!")
+            while True:
+                time.sleep(1)
+
+        except KeyboardInterrupt:
+            print("\n🛑 Arrêt Gemma2...")
+        finally:
+            config.stop()
+            server.stop_server()
+    log_listener.stop()
@@ -0,0 +1,168 @@
+"""Répartition des générations entre plusieurs serveurs Ollama.
+
+Chaque OllamaBackend a un disjoncteur : après failure_threshold échecs
+consécutifs il est retiré pendant open_seconds, puis une seule requête
+d'essai (ou une sonde de santé) décide de sa réouverture.
+
+LLMRouter.acquire() choisit le backend disponible avec le moins de requêtes
+en cours (latence moyenne pour départager), en gardant de préférence celui
+de la session (KV cache / context Ollama déjà chargés). Les énoncés courts ou
+les salutations peuvent partir vers un pool de petits modèles.
+"""
+import re
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+GREETING_RE = re.compile(r"^\s*(bonjour|bonsoir|salut|coucou|hello|merci|au revoir|bonne journée|ça va)\b",
+                         re.IGNORECASE)
+
+
+class OllamaBackend(object):
+    def __init__(self, url, model, name=None, small=False, failure_threshold=3, open_seconds=15.0):
+        self.url = url
+        self.model = model
+        self.name = name or f"{model}@{url.split('//')[-1].split('/')[0]}"
+        self.small = small
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+        self.outstanding = 0
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.latency = None  # moyenne glissante (s) des requêtes réussies
+        self.last_activity = 0.0  # pour garder le modèle chaud pendant les creux
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def base_url(self):
+        return self.url.rsplit('/api/', 1)[0]
+
+    def endpoint(self, path):
+        return f"{self.base_url}/api/{path}"
+
+    def available(self, now):
+        """Appelé sous le verrou du routeur"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self.trial_running = False
+        return self.state == HALF_OPEN and not self.trial_running
+
+    def record_success(self, latency=None):
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.trial_running = False
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+    def record_failure(self, now):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.trial_running = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = now
+
+
+class LLMRouter(object):
+    def __init__(self, backends, small_backends=(), small_max_words=4):
+        self.backends = list(backends)
+        self.small_backends = list(small_backends)
+        for backend in self.small_backends:
+            backend.small = True
+        self.small_max_words = small_max_words
+        self.lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.backends[0]
+
+    def all_backends(self):
+        return self.backends + self.small_backends
+
+    def is_small_utterance(self, text):
+        return bool(self.small_backends) and (
+            GREETING_RE.match(text) is not None and len(text.split()) <= self.small_max_words * 2
+            or len(text.split()) <= self.small_max_words)
+
+    def _choose(self, pool, preferred, exclude, now):
+        candidates = [backend for backend in pool if backend not in exclude and backend.available(now)]
+        if not candidates:
+            return None
+        least = min(backend.outstanding for backend in candidates)
+        if preferred in candidates and preferred.outstanding <= least:
+            return preferred
+        return min(candidates, key=lambda backend: (backend.outstanding, backend.latency or 0.0))
+
+    def choose(self, text="", preferred=None, exclude=(), prefer_small=False):
+        """Backend qu'acquire() prendrait, sans le réserver (préremplissage, résumé avec prefer_small)"""
+        now = time.time()
+        with self.lock:
+            backend = None
+            if prefer_small or text and self.is_small_utterance(text):
+                backend = self._choose(self.small_backends, preferred, exclude, now)
+            return backend or self._choose(self.backends, preferred, exclude, now)
+
+    def acquire(self, text="", preferred=None, exclude=()):
+        """Réserve un backend ; None si tous sont coupés (disjoncteurs ouverts)"""
+        now = time.time()
+        with self.lock:
+            backend = None
+            if text and self.is_small_utterance(text):
+                backend = self._choose(self.small_backends, preferred, exclude, now)
+            backend = backend or self._choose(self.backends, preferred, exclude, now)
+            if backend is None:
+                return None
+            if backend.state == HALF_OPEN:
+                backend.trial_running = True
+            backend.outstanding += 1
+            backend.requests += 1
+            backend.last_activity = now
+            return backend
+
+    def release(self, backend, ok, latency=None):
+        with self.lock:
+            backend.outstanding -= 1
+            if ok:
+                backend.record_success(latency)
+            else:
+                backend.record_failure(time.time())
+
+    def probe_due(self, backend, now=None):
+        """Un backend coupé dont le délai est écoulé doit être sondé"""
+        now = now or time.time()
+        with self.lock:
+            if backend.state == OPEN and backend.available(now):
+                backend.trial_running = True
+                return True
+            return False
+
+    def record_probe(self, backend, ok):
+        with self.lock:
+            if ok:
+                backend.record_success()
+            else:
+                backend.record_failure(time.time())
+
+    def status(self):
+        with self.lock:
+            return [{"name": backend.name, "model": backend.model, "state": backend.state,
+                     "outstanding": backend.outstanding, "requests": backend.requests,
+                     "failures": backend.failures, "latency": backend.latency, "small": backend.small}
+                    for backend in self.all_backends()]
+
+
+def parse_backend(spec, default_model):
+    """"http://hote:11434" ou "http://hote:11434=modele" -> OllamaBackend"""
+    url, _, model = spec.partition("=")
+    if "/api/" not in url:
+        url = url.rstrip("/") + "/api/generate"
+    return OllamaBackend(url, model or default_model)
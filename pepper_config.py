@@ -0,0 +1,208 @@
+"""Configuration partagée par gemma2_server.py et les clients Pepper.
+
+Trois couches, de la plus faible à la plus forte :
+
+1. un fichier JSON (--config, ou la variable PEPPER_CONFIG), sections "server",
+   "generation", "conversation", "client" et "robots" (voir pepper_config.example.json) ;
+2. les variables d'environnement PEPPER_<SECTION>_<CLÉ>, valeur lue en JSON
+   si possible (PEPPER_GENERATION_NUM_PREDICT=60, PEPPER_CLIENT_LLM_HOST=10.0.0.5) ;
+3. les options de la ligne de commande effectivement passées (override).
+
+Les valeurs absentes gardent DEFAULTS. watch() relit le fichier quand il
+change et signale les sections modifiées : le serveur applique à chaud
+"generation" (options Ollama), "conversation" et "robots" (adresses de
+réponse) ; "server" demande un redémarrage.
+"""
+import copy
+import json
+import os
+import threading
+import time
+
+# Ollama local par défaut : les adresses de déploiement vont dans le fichier de config
+DEFAULT_OLLAMA_URL = "http://127.0.0.1:11434"
+DEFAULT_MODEL = "gemma2:9b"
+DEFAULT_SMALL_MODEL = "gemma2:2b"
+DEFAULT_SYSTEM_PROMPT = ("Tu es un assistant professionnel dans un événement. "
+                         "Réponds de manière concise, claire et professionnelle. "
+                         "Maximum 2 phrases courtes. Sois naturel et aidant.")
+
+DEFAULTS = {
+    "server": {
+        "port": 8888,
+        "mode": "threads",
+        "max_workers": 4,
+        "backends": [f"{DEFAULT_OLLAMA_URL}={DEFAULT_MODEL}"],
+        "small_backends": [],
+        "keep_alive": "30m",
+        "prompt_mode": "prompt",
+        "cache_file": "gemma2_response_cache.json",
+        "cache_embed_model": None,
+        "wire": None,
+        "log_level": "INFO",
+        "log_json": None,
+        "metrics_port": None,
+        "stats_file": None,
+        "config_poll": 2.0,
+    },
+    # Options Ollama de chaque génération, modifiables à chaud
+    "generation": {
+        "temperature": 0.7,
+        "top_p": 0.9,
+        "top_k": 40,
+        "repeat_penalty": 1.1,
+        "num_ctx": 4096,
+        "num_predict": 100,
+        "stop": ["Humain:", "H:"],
+    },
+    # Réglages de conversation du serveur, modifiables à chaud
+    "conversation": {
+        # ~200 tokens d'historique à num_ctx 4096, comme les 3 derniers échanges d'avant :
+        # l'augmenter (0.1-0.25) garde plus de contexte mais rallonge le prompt-eval, donc la première phrase
+        "context_ratio": 0.05,
+        "max_sentences": 2,
+        "prewarm_interval": 30.0,
+        "summary_idle": 8.0,
+        "visitor_reset_idle": 15.0,
+        "system_prompt": DEFAULT_SYSTEM_PROMPT,
+    },
+    "client": {
+        "robot_ip": None,
+        "robot_port": 9559,
+        "llm_host": "127.0.0.1",
+        "llm_port": 8888,
+        # Port d'où le client écrit et où arrivent les réponses
+        "reply_port": 8889,
+        "robot_id": None,
+        "wire": "binary",
+    },
+    # robot_id -> "hôte:port" où répondre ; sinon réponse à l'adresse d'envoi du robot
+    "robots": {},
+}
+
+ENV_PREFIX = "PEPPER_"
+
+
+def merge(base, override):
+    """Fusion récursive : les dictionnaires sont fusionnés, les autres valeurs remplacées"""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def parse_env_value(raw):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw
+
+
+def parse_address(spec, default_port):
+    """"hôte" ou "hôte:port" -> (hôte, port)"""
+    host, _, port = str(spec).rpartition(":")
+    if not host:
+        return str(spec), default_port
+    return host, int(port)
+
+
+class Config(object):
+    def __init__(self, path=None, environ=None):
+        self.environ = os.environ if environ is None else environ
+        self.path = path or self.environ.get(ENV_PREFIX + "CONFIG") or None
+        self.overrides = {}
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.data = copy.deepcopy(DEFAULTS)
+        self.watcher = None
+        self.is_watching = False
+
+    @classmethod
+    def load(cls, path=None, environ=None):
+        config = cls(path, environ)
+        config.data = config.read()
+        return config
+
+    def read(self):
+        """Défauts + fichier + environnement + overrides ; lève ValueError si le fichier est invalide"""
+        data = copy.deepcopy(DEFAULTS)
+        if self.path:
+            self.mtime = self.file_mtime()
+            with open(os.path.expanduser(self.path), encoding='utf-8') as f:
+                content = json.load(f)
+            unknown = set(content) - set(DEFAULTS)
+            if unknown:
+                raise ValueError(f"sections inconnues dans {self.path}: {sorted(unknown)}")
+            data = merge(data, content)
+        data = merge(data, self.env_values())
+        return merge(data, self.overrides)
+
+    def env_values(self):
+        values = {}
+        for name, raw in self.environ.items():
+            if not name.startswith(ENV_PREFIX) or name == ENV_PREFIX + "CONFIG":
+                continue
+            section, _, key = name[len(ENV_PREFIX):].lower().partition("_")
+            if section in DEFAULTS and key:
+                values.setdefault(section, {})[key] = parse_env_value(raw)
+        return values
+
+    def file_mtime(self):
+        try:
+            return os.path.getmtime(os.path.expanduser(self.path))
+        except OSError:
+            return None
+
+    def section(self, name):
+        with self.lock:
+            return copy.deepcopy(self.data[name])
+
+    def get(self, section, key, default=None):
+        with self.lock:
+            return copy.deepcopy(self.data[section].get(key, default))
+
+    def override(self, section, **values):
+        """Options de ligne de commande passées (None ou liste vide = non passée)"""
+        values = {key: value for key, value in values.items() if value is not None and value != []}
+        with self.lock:
+            self.overrides = merge(self.overrides, {section: values})
+            self.data = merge(self.data, {section: values})
+        return self
+
+    def reload(self):
+        """Relit fichier et environnement ; renvoie les sections modifiées (ensemble vide si rien)"""
+        try:
+            data = self.read()
+        except (OSError, ValueError) as e:
+            print(f"❌ Configuration {self.path} non rechargée : {e}")
+            return set()
+        with self.lock:
+            changed = {name for name in data if data[name] != self.data.get(name)}
+            self.data = data
+        return changed
+
+    def watch(self, on_change, interval=2.0):
+        """Surveille le fichier (date de modification) ; on_change(config, sections modifiées)"""
+        if not self.path:
+            return None
+        self.is_watching = True
+
+        def poll():
+            while self.is_watching:
+                time.sleep(interval)
+                if self.file_mtime() == self.mtime:
+                    continue
+                changed = self.reload()
+                if changed:
+                    on_change(self, changed)
+
+        self.watcher = threading.Thread(target=poll)
+        self.watcher.daemon = True
+        self.watcher.start()
+        return self.watcher
+
+    def stop(self):
+        self.is_watching = False
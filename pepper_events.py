@@ -0,0 +1,244 @@
+import json
+import queue
+import threading
+import time
+
+
+class TraceRecorder(object):
+    """Enregistre les événements ALMemory en JSON lines : {"t", "key", "value"}"""
+
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def __call__(self, key, value, timestamp):
+        line = json.dumps({"t": timestamp, "key": key, "value": value}, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + "\n")
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def load_trace(path):
+    """Relit une trace : liste triée de (timestamp, key, value)"""
+    events = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                event = json.loads(line)
+                events.append((event["t"], event["key"], event["value"]))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+class ALMemoryEventDispatcher(object):
+    """Abonnements ALMemory regroupés dans un seul thread de dispatch.
+
+    Les signaux qi arrivent sur des threads qi : ils sont seulement mis en file,
+    les callbacks sont tous exécutés dans l'ordre sur le thread du dispatcher.
+    on_tick(now) est appelé au moins toutes les tick_interval secondes
+    (timeouts de silence, etc.).
+    """
+
+    def __init__(self, memory, tick_interval=0.05, on_tick=None, recorder=None):
+        self.memory = memory
+        self.tick_interval = tick_interval
+        self.on_tick = on_tick
+        self.recorder = recorder
+        self.callbacks = {}
+        self.subscribers = {}
+        self.events = queue.Queue()
+        self.is_running = False
+
+    def add(self, key, callback):
+        """callback(value, timestamp) pour chaque événement ALMemory key"""
+        self.callbacks[key] = callback
+
+    def start(self):
+        """Abonne toutes les clés ; lève une exception si les signaux sont indisponibles"""
+        try:
+            for key in self.callbacks:
+                subscriber = self.memory.subscriber(key)
+                link = subscriber.signal.connect(self._make_handler(key))
+                # Garder la référence au subscriber, sinon qi le libère et le signal se tait
+                self.subscribers[key] = (subscriber, link)
+        except Exception:
+            self.disconnect()
+            raise
+
+        self.is_running = True
+        self.thread = threading.Thread(target=self.dispatch_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _make_handler(self, key):
+        def handler(value):
+            self.events.put((key, value, time.time()))
+        return handler
+
+    def push(self, key, value, timestamp=None):
+        """Injection manuelle (tests, relecture de traces)"""
+        self.events.put((key, value, timestamp if timestamp is not None else time.time()))
+
+    def dispatch_loop(self):
+        next_tick = time.time() + self.tick_interval
+        while self.is_running:
+            try:
+                key, value, timestamp = self.events.get(timeout=max(0.0, next_tick - time.time()))
+            except queue.Empty:
+                key = None
+            if key is not None:
+                if self.recorder:
+                    self.recorder(key, value, timestamp)
+                try:
+                    self.callbacks[key](value, timestamp)
+                except Exception as e:
+                    print(f"❌ Erreur callback {key}: {e}")
+            now = time.time()
+            if now >= next_tick:
+                next_tick = now + self.tick_interval
+                if self.on_tick:
+                    try:
+                        self.on_tick(now)
+                    except Exception as e:
+                        print(f"❌ Erreur tick dispatcher: {e}")
+
+    def disconnect(self):
+        for key, (subscriber, link) in list(self.subscribers.items()):
+            try:
+                subscriber.signal.disconnect(link)
+            except Exception as e:
+                print(f"⚠️  Désabonnement {key} impossible: {e}")
+        self.subscribers = {}
+
+    def stop(self):
+        self.is_running = False
+        self.disconnect()
+        if hasattr(self, 'thread'):
+            self.thread.join(timeout=2)
+        if self.recorder:
+            self.recorder.close()
+
+
+class ALMemorySnapshot(object):
+    """Lecture groupée d'ALMemory : toutes les clés surveillées en un seul getListData par tick.
+
+    Remplace les boucles de polling qui faisaient un getData (un aller-retour
+    RPC) par clé. Les résultats sont distribués sur le thread du snapshot :
+    add(key, callback) -> callback(value, timestamp) à chaque tick, comme le
+    dispatcher ; add_consumer(consumer) -> consumer(snapshot, timestamp) avec
+    le dict complet. add_dynamic(keys_for) ajoute des clés calculées à partir
+    du snapshot précédent (Distance / IsVisible des personnes de PeopleList),
+    lues au tick suivant. Sans getListData, repli sur un getData par clé.
+    """
+
+    def __init__(self, memory, interval=0.05, on_tick=None):
+        self.memory = memory
+        self.interval = interval
+        self.on_tick = on_tick
+        self.static_keys = []
+        self.callbacks = {}
+        self.consumers = []
+        self.dynamic = []
+        self.snapshot = {}
+        self.batched = True
+        self.batch_failures = 0
+        self.ticks = 0
+        self.is_running = False
+
+    def watch(self, *keys):
+        for key in keys:
+            if key not in self.static_keys:
+                self.static_keys.append(key)
+
+    def add(self, key, callback):
+        """callback(value, timestamp) à chaque tick pour la clé ALMemory key"""
+        self.watch(key)
+        self.callbacks[key] = callback
+
+    def add_consumer(self, consumer):
+        """consumer(snapshot, timestamp) à chaque tick, après les callbacks par clé"""
+        self.consumers.append(consumer)
+
+    def add_dynamic(self, keys_for):
+        """keys_for(snapshot) -> clés supplémentaires à lire au prochain tick"""
+        self.dynamic.append(keys_for)
+
+    def keys(self):
+        keys = list(self.static_keys)
+        for keys_for in self.dynamic:
+            for key in keys_for(self.snapshot):
+                if key not in keys:
+                    keys.append(key)
+        return keys
+
+    def read(self, keys):
+        if self.batched:
+            try:
+                values = self.memory.getListData(keys)
+                self.batch_failures = 0
+                return dict(zip(keys, values))
+            except Exception as e:
+                # Clé disparue entre deux ticks (personne partie) ou getListData absent
+                self.batch_failures += 1
+                if self.batch_failures >= 3:
+                    print(f"⚠️  getListData indisponible ({e}), repli sur getData par clé")
+                    self.batched = False
+        snapshot = {}
+        for key in keys:
+            try:
+                snapshot[key] = self.memory.getData(key)
+            except Exception:
+                snapshot[key] = None
+        return snapshot
+
+    def get(self, key, default=None):
+        return self.snapshot.get(key, default)
+
+    def poll_once(self, now=None):
+        snapshot = self.read(self.keys())
+        now = now or time.time()
+        self.snapshot = snapshot
+        self.ticks += 1
+        for key, callback in self.callbacks.items():
+            try:
+                callback(snapshot.get(key), now)
+            except Exception as e:
+                print(f"❌ Erreur callback {key}: {e}")
+        for consumer in self.consumers:
+            try:
+                consumer(snapshot, now)
+            except Exception as e:
+                print(f"❌ Erreur consommateur snapshot: {e}")
+        if self.on_tick:
+            try:
+                self.on_tick(now)
+            except Exception as e:
+                print(f"❌ Erreur tick snapshot: {e}")
+        return snapshot
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self.poll_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def poll_loop(self):
+        next_tick = time.time()
+        while self.is_running:
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"❌ Erreur lecture ALMemory: {e}")
+                time.sleep(0.2)
+            # Cadence fixe : le temps de lecture est déduit de l'attente
+            next_tick = max(next_tick + self.interval, time.time())
+            time.sleep(max(0.0, next_tick - time.time()))
+
+    def stop(self):
+        self.is_running = False
+        if hasattr(self, 'thread'):
+            self.thread.join(timeout=2)
@@ -0,0 +1,223 @@
+"""Présence des visiteurs pilotée par les événements ALPeoplePerception.
+
+Aucune lecture ALMemory : la table des personnes est tenue à jour par les
+signaux (un seul thread de dispatch, voir pepper_events) :
+    PeoplePerception/JustArrived, JustLeft   -> arrivées / départs
+    PeoplePerception/PeopleList              -> liste de référence (rattrape un événement perdu)
+    PeoplePerception/VisiblePeopleList       -> visibilité
+    PeoplePerception/PeopleDetected          -> distance et direction de chaque personne,
+        [[sec, usec], [[id, distance, pitch, yaw], ...], pose caméra/torse, pose caméra/robot, caméra]
+
+Les yeux (ALLeds.fadeRGB) ne changent qu'une fois la présence stable depuis
+led_hold secondes : une détection qui clignote ne fait plus clignoter les LEDs.
+on_approach(person, timestamp) est appelé une fois par visiteur qui s'approche
+(le client prévient le serveur, qui charge le modèle avant le premier mot).
+"""
+import collections
+import threading
+import time
+
+from pepper_events import ALMemoryEventDispatcher
+
+PEOPLE_LIST = "PeoplePerception/PeopleList"
+VISIBLE_PEOPLE = "PeoplePerception/VisiblePeopleList"
+JUST_ARRIVED = "PeoplePerception/JustArrived"
+JUST_LEFT = "PeoplePerception/JustLeft"
+PEOPLE_DETECTED = "PeoplePerception/PeopleDetected"
+
+GREEN = (0.0, 1.0, 0.0)
+RED = (1.0, 0.0, 0.0)
+WHITE = (1.0, 1.0, 1.0)
+
+
+class PersonState(object):
+    """Dernier état connu d'une personne ; distance None tant que PeopleDetected ne l'a pas vue"""
+
+    def __init__(self, person_id, timestamp):
+        self.person_id = person_id
+        self.arrived = timestamp
+        self.updated = timestamp  # dernière position
+        self.seen = timestamp  # dernier événement qui la mentionne
+        self.distance = None
+        self.yaw = None
+        self.speed = 0.0  # m/s, négative quand la personne s'approche
+        self.visible = True
+        self.approach_sent = False
+
+    def update_position(self, distance, yaw, timestamp):
+        if self.distance is not None and timestamp > self.updated:
+            speed = (distance - self.distance) / (timestamp - self.updated)
+            # Lissage : la distance mesurée par la caméra est bruitée d'une image à l'autre
+            self.speed = 0.5 * self.speed + 0.5 * speed
+        self.distance = distance
+        self.yaw = yaw
+        self.updated = self.seen = timestamp
+
+    def __repr__(self):
+        distance = "?" if self.distance is None else f"{self.distance:.2f}m"
+        return f"Personne {self.person_id} ({distance}, {self.speed:+.2f}m/s, visible={self.visible})"
+
+
+class LedDebouncer(object):
+    """fadeRGB seulement quand la couleur demandée est stable depuis hold secondes et différente de l'actuelle"""
+
+    def __init__(self, leds, group="FaceLeds", hold=0.8, duration=0.5):
+        self.leds = leds
+        self.group = group
+        self.hold = hold
+        self.duration = duration
+        self.current = None
+        self.wanted = None
+        self.wanted_since = 0.0
+        self.stats = collections.Counter()
+
+    def request(self, color, timestamp):
+        if color == self.wanted:
+            return
+        if self.wanted is not None and self.wanted != self.current:
+            # Changement pas encore appliqué, déjà contredit : un fadeRGB évité
+            self.stats["suppressed"] += 1
+        self.wanted = color
+        self.wanted_since = timestamp
+
+    def update(self, now):
+        if self.wanted is None or self.wanted == self.current or now - self.wanted_since < self.hold:
+            return False
+        self.apply(self.wanted)
+        return True
+
+    def apply(self, color):
+        self.current = color
+        self.stats["fades"] += 1
+        if self.leds is None:
+            return
+        try:
+            # fadeRGB bloque pendant le fondu : asynchrone pour ne pas retenir le dispatch
+            self.leds.fadeRGB(self.group, color[0], color[1], color[2], self.duration, _async=True)
+        except Exception as e:
+            print(f"⚠️  LEDs indisponibles : {e}")
+
+
+class PresenceEngine(object):
+    def __init__(self, memory, leds=None, on_approach=None, approach_distance=3.0, engage_distance=1.5,
+                 approach_speed=0.15, led_hold=0.8, stale_after=10.0, tick_interval=0.1, verbose=True):
+        self.memory = memory
+        self.on_approach = on_approach
+        self.approach_distance = approach_distance
+        self.engage_distance = engage_distance
+        self.approach_speed = approach_speed
+        self.stale_after = stale_after
+        self.verbose = verbose
+
+        self.people = {}
+        self.lock = threading.Lock()
+        self.leds = LedDebouncer(leds, hold=led_hold)
+        self.stats = collections.Counter()
+
+        self.dispatcher = ALMemoryEventDispatcher(memory, tick_interval=tick_interval, on_tick=self.on_tick)
+        self.dispatcher.add(JUST_ARRIVED, self.on_just_arrived)
+        self.dispatcher.add(JUST_LEFT, self.on_just_left)
+        self.dispatcher.add(PEOPLE_LIST, self.on_people_list)
+        self.dispatcher.add(VISIBLE_PEOPLE, self.on_visible_people)
+        self.dispatcher.add(PEOPLE_DETECTED, self.on_people_detected)
+
+    def start(self):
+        """Abonne les événements ; lève une exception si les signaux sont indisponibles"""
+        self.leds.request(RED, time.time() - self.leds.hold)
+        self.dispatcher.start()
+        return self
+
+    def stop(self):
+        self.dispatcher.stop()
+        self.leds.apply(WHITE)
+
+    def snapshot(self):
+        """Copie de la table des personnes (lisible depuis n'importe quel thread)"""
+        with self.lock:
+            return dict(self.people)
+
+    def present(self):
+        with self.lock:
+            return bool(self.people)
+
+    # --- Table des personnes (thread du dispatcher uniquement) ---
+
+    def arrive(self, person_id, timestamp):
+        with self.lock:
+            if person_id in self.people:
+                person = self.people[person_id]
+                person.seen = max(person.seen, timestamp)
+                return person
+            person = self.people[person_id] = PersonState(person_id, timestamp)
+            count = len(self.people)
+        self.stats["arrivals"] += 1
+        if self.verbose:
+            print(f"👤 Personne {person_id} arrivée ({count} présente(s))")
+        self.leds.request(GREEN, timestamp)
+        return person
+
+    def leave(self, person_id, timestamp):
+        with self.lock:
+            if self.people.pop(person_id, None) is None:
+                return
+            count = len(self.people)
+        self.stats["departures"] += 1
+        if self.verbose:
+            print(f"🚶 Personne {person_id} partie ({count} présente(s))")
+        if not count:
+            self.leds.request(RED, timestamp)
+
+    def on_just_arrived(self, person_id, timestamp):
+        self.arrive(person_id, timestamp)
+
+    def on_just_left(self, person_id, timestamp):
+        self.leave(person_id, timestamp)
+
+    def on_people_list(self, people_list, timestamp):
+        people_list = set(people_list or [])
+        for person_id in people_list:
+            self.arrive(person_id, timestamp)
+        for person_id in set(self.snapshot()) - people_list:
+            self.leave(person_id, timestamp)
+
+    def on_visible_people(self, visible_list, timestamp):
+        visible_list = set(visible_list or [])
+        with self.lock:
+            for person_id, person in self.people.items():
+                person.visible = person_id in visible_list
+                if person.visible:
+                    person.seen = max(person.seen, timestamp)
+
+    def on_people_detected(self, people_detected, timestamp):
+        if not people_detected or len(people_detected) < 2:
+            return
+        for person_data in people_detected[1] or []:
+            if len(person_data) < 4:
+                continue
+            person_id, distance, _, yaw = person_data[:4]
+            person = self.arrive(person_id, timestamp)
+            person.update_position(distance, yaw, timestamp)
+            self.check_approach(person, timestamp)
+
+    def check_approach(self, person, timestamp):
+        """Un seul indice par visiteur : assez près et en train d'avancer, ou déjà tout près"""
+        if person.approach_sent or person.distance is None or person.distance > self.approach_distance:
+            return
+        if person.speed > -self.approach_speed and person.distance > self.engage_distance:
+            return
+        person.approach_sent = True
+        self.stats["approaches"] += 1
+        if self.verbose:
+            print(f"🚶‍➡️ VISITEUR EN APPROCHE : {person}")
+        if self.on_approach:
+            self.on_approach(person, timestamp)
+
+    def on_tick(self, now):
+        # Filet de sécurité : une personne dont on n'a plus aucune nouvelle (JustLeft perdu)
+        stale = [person_id for person_id, person in self.snapshot().items()
+                 if now - person.seen > self.stale_after]
+        for person_id in stale:
+            self.stats["expired"] += 1
+            self.leave(person_id, now)
+        if self.leds.update(now) and self.verbose:
+            print("👀 YEUX VERTS - Personne détectée !" if self.leds.current == GREEN else "👀 YEUX ROUGES - Aucune personne")
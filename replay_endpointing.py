@@ -0,0 +1,133 @@
+"""Relecture hors ligne de traces ALMemory pour comparer les détecteurs de fin d'énoncé.
+
+Usage :
+    python replay_endpointing.py trace1.jsonl trace2.jsonl
+    python replay_endpointing.py --synthetic 200
+
+Les traces sont enregistrées par testOnPepperStreamingVocal.py --record_trace.
+Un énoncé = suite de WordRecognized séparés de moins de --utterance_gap secondes.
+Latence = fin d'énoncé décidée - dernier mot ; coupure = fin décidée avant le dernier mot.
+"""
+import argparse
+import random
+
+from endpointing import AdaptiveEndpointer, FixedEndpointer, SPECULATIVE, FINAL, RETRACT
+from pepper_events import load_trace
+
+
+def synthetic_trace(utterances=100, seed=1):
+    """Énoncés de 1 à 12 mots, pauses naturelles et hésitations, reconnaissance décalée de ~200ms"""
+    rng = random.Random(seed)
+    events = []
+    t = 0.0
+    for _ in range(utterances):
+        t += rng.uniform(3.0, 6.0)
+        events.append((t, "SpeechDetected", 1))
+        word_time = t + rng.uniform(0.3, 0.5)
+        for index in range(rng.randint(1, 12)):
+            if index:
+                pause = rng.uniform(0.12, 0.35)
+                if rng.random() < 0.08:
+                    # Hésitation ("euh...") : SpeechDetected retombe puis reprend
+                    pause = rng.uniform(0.5, 0.9)
+                    events.append((word_time + 0.1, "SpeechDetected", 0))
+                    events.append((word_time + pause - 0.25, "SpeechDetected", 1))
+                word_time += pause
+            events.append((word_time, "WordRecognized", [f"mot{index}", rng.uniform(0.45, 0.95)]))
+        events.append((word_time - rng.uniform(0.05, 0.2), "SpeechDetected", 0))
+        t = word_time
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def split_utterances(events, utterance_gap):
+    utterances = []
+    for t, key, value in events:
+        if key != "WordRecognized":
+            continue
+        if utterances and t - utterances[-1][1] < utterance_gap:
+            utterances[-1][1] = t
+        else:
+            utterances.append([t, t])
+    return utterances
+
+
+def replay(events, endpointer, tick=0.01):
+    """Rejoue la trace en temps simulé ; renvoie les décisions [(t, décision)]"""
+    decisions = []
+    if not events:
+        return decisions
+    now = events[0][0]
+    end = events[-1][0] + 5.0
+    index = 0
+    while now <= end:
+        while index < len(events) and events[index][0] <= now:
+            t, key, value = events[index]
+            index += 1
+            if key == "SpeechDetected":
+                result = endpointer.on_speech(value == 1, t)
+            elif key == "WordRecognized" and value and len(value) >= 2 and value[1] > 0.4:
+                result = endpointer.on_word(value[0], value[1], t)
+            else:
+                result = None
+            if result == RETRACT:
+                decisions.append((t, RETRACT))
+        decision = endpointer.update(now)
+        if decision:
+            decisions.append((now, decision))
+        now += tick
+    return decisions
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def score(events, endpointer, utterance_gap):
+    decisions = replay(events, endpointer)
+    finals = [t for t, decision in decisions if decision == FINAL]
+    utterances = split_utterances(events, utterance_gap)
+    latencies, cuts = [], 0
+    for index, (first_word, last_word) in enumerate(utterances):
+        if any(first_word <= t < last_word for t in finals):
+            cuts += 1
+            continue
+        next_first_word = utterances[index + 1][0] if index + 1 < len(utterances) else float('inf')
+        after = [t for t in finals if last_word <= t < next_first_word]
+        if after:
+            latencies.append(after[0] - last_word)
+    speculative = sum(1 for _, decision in decisions if decision == SPECULATIVE)
+    retracts = sum(1 for _, decision in decisions if decision == RETRACT)
+    return {
+        'utterances': len(utterances),
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'mean': sum(latencies) / len(latencies) if latencies else float('nan'),
+        'cuts': cuts,
+        'speculative': speculative,
+        'retracts': retracts,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("traces", nargs="*")
+    parser.add_argument("--synthetic", type=int, default=0, help="Nombre d'énoncés synthétiques à générer")
+    parser.add_argument("--utterance_gap", type=float, default=2.0)
+    args = parser.parse_args()
+
+    events = []
+    for path in args.traces:
+        events.extend(load_trace(path))
+    if args.synthetic or not events:
+        events.extend(synthetic_trace(args.synthetic or 100))
+    events.sort(key=lambda event: event[0])
+
+    print(f"{'détecteur':<10} {'énoncés':>8} {'p50':>7} {'p95':>7} {'moy':>7} {'coupés':>7} {'spéc.':>6} {'annul.':>6}")
+    for name, endpointer in (("fixe", FixedEndpointer()), ("adaptatif", AdaptiveEndpointer())):
+        result = score(events, endpointer, args.utterance_gap)
+        print(f"{name:<10} {result['utterances']:>8} {result['p50']:>6.2f}s {result['p95']:>6.2f}s "
+              f"{result['mean']:>6.2f}s {result['cuts']:>7} {result['speculative']:>6} {result['retracts']:>6}")
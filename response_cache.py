@@ -0,0 +1,210 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+NON_WORD_RE = re.compile(r"[^\w\s]")
+SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Minuscules, sans accents ni ponctuation : 'Bonjour, présente-toi !' -> 'bonjour presente toi'"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = NON_WORD_RE.sub(" ", text)
+    return SPACES_RE.sub(" ", text).strip()
+
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache(object):
+    """Cache des réponses fréquentes : exact, puis approché (difflib ou embeddings).
+
+    Éviction LRU + TTL, persistance JSON optionnelle entre deux redémarrages.
+    embed(texte) -> vecteur active la recherche par plus proche voisin.
+    Avec start_saver(), la sauvegarde automatique se fait dans un thread dédié :
+    put() ne fait jamais d'écriture disque (boucle asyncio du serveur).
+    """
+
+    def __init__(self, path=None, max_entries=512, ttl=12 * 3600,
+                 similarity_threshold=0.88, fuzzy=True, embed=None, autosave_every=20):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.fuzzy = fuzzy
+        self.embed = embed
+        self.autosave_every = autosave_every
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.unsaved = 0
+        self.save_requested = threading.Event()
+        self.saver = None
+        self.saving = False
+
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+        if path:
+            self.load()
+
+    def key(self, text, context=""):
+        return f"{normalize_text(context)}|{normalize_text(text)}"
+
+    def get(self, text, context=""):
+        key = self.key(text, context)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and now - entry['time'] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry['response']
+            if entry:
+                del self.entries[key]
+
+        if self.fuzzy or self.embed:
+            match = self.nearest(key, text, context, now)
+            if match is not None:
+                with self.lock:
+                    self.fuzzy_hits += 1
+                return match
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def nearest(self, key, text, context, now):
+        prefix = f"{normalize_text(context)}|"
+        query = key[len(prefix):]
+        vector = self.embed(text) if self.embed else None
+        best_score, best_key = 0.0, None
+
+        with self.lock:
+            candidates = [(k, e) for k, e in self.entries.items()
+                          if k.startswith(prefix) and now - e['time'] <= self.ttl]
+
+        for candidate_key, entry in candidates:
+            if vector is not None and entry.get('vector'):
+                score = cosine_similarity(vector, entry['vector'])
+            else:
+                matcher = SequenceMatcher(None, query, candidate_key[len(prefix):])
+                # quick_ratio est une borne haute bon marché : évite le calcul complet
+                if matcher.quick_ratio() < self.similarity_threshold:
+                    continue
+                score = matcher.ratio()
+            if score > best_score:
+                best_score, best_key = score, candidate_key
+
+        if best_key is None or best_score < self.similarity_threshold:
+            return None
+        with self.lock:
+            entry = self.entries.get(best_key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(best_key)
+            return entry['response']
+
+    def put(self, text, response, context=""):
+        if not normalize_text(text):
+            return
+        entry = {'response': response, 'time': time.time()}
+        if self.embed:
+            try:
+                entry['vector'] = self.embed(text)
+            except Exception as e:
+                print(f"⚠️  Embedding cache indisponible: {e}")
+
+        with self.lock:
+            key = self.key(text, context)
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.unsaved += 1
+            autosave = self.path and self.unsaved >= self.autosave_every
+
+        if autosave:
+            if self.saver is not None:
+                self.save_requested.set()
+            else:
+                self.save()
+
+    def start_saver(self):
+        """Sauvegardes automatiques dans un thread de fond (sans effet sans fichier)"""
+        if not self.path or self.saver is not None:
+            return
+        self.saving = True
+        self.saver = threading.Thread(target=self.save_loop, name="response-cache-saver")
+        self.saver.daemon = True
+        self.saver.start()
+
+    def save_loop(self):
+        while True:
+            self.save_requested.wait()
+            self.save_requested.clear()
+            if not self.saving:
+                return
+            self.save()
+
+    def stop_saver(self):
+        saver, self.saver = self.saver, None
+        if saver is None:
+            return
+        self.saving = False
+        self.save_requested.set()
+        saver.join(timeout=5)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.fuzzy_hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'fuzzy_hits': self.fuzzy_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.fuzzy_hits) / lookups if lookups else 0.0,
+            }
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Cache de réponses illisible ({self.path}): {e}")
+            return
+        now = time.time()
+        with self.lock:
+            for key, entry in data.items():
+                if now - entry.get('time', 0) <= self.ttl:
+                    self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        print(f"💾 Cache de réponses chargé: {len(self.entries)} entrées")
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = dict(self.entries)
+            self.unsaved = 0
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"❌ Sauvegarde du cache impossible: {e}")
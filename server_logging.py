@@ -0,0 +1,109 @@
+"""Journalisation du serveur : niveaux, formatage paresseux, écriture en tâche de fond.
+
+Les appels log.debug("... %s", x) ne construisent aucune chaîne sur le chemin
+critique : le record part tel quel dans une file, le formatage (console ou
+JSON lines) est fait par le thread du QueueListener. En production
+(--log_level WARNING), les appels info/debug s'arrêtent au test de niveau.
+
+Chaque record porte l'identifiant du tour en cours (turn), posé par
+turn_context() dans le thread ou la tâche asyncio qui traite le tour. Seul le
+couple (session, énoncé) est gardé : la chaîne "session:énoncé" n'est
+construite que par le formateur, pour les records effectivement écrits.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOGGER_NAME = "gemma2"
+
+current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+def get_logger(name=None):
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+@contextlib.contextmanager
+def turn_context(session_key, utterance_id=None):
+    token = current_turn.set((session_key, utterance_id))
+    try:
+        yield
+    finally:
+        current_turn.reset(token)
+
+
+def turn_id(session_key, utterance_id):
+    return f"{session_key}:{utterance_id}" if utterance_id is not None else str(session_key)
+
+
+def record_turn(record):
+    turn = getattr(record, "turn", None)
+    return turn_id(*turn) if turn else None
+
+
+class TurnFilter(logging.Filter):
+    """Capture le tour (session, énoncé) dans le thread émetteur, avant la file ; formaté par le listener"""
+
+    def filter(self, record):
+        record.turn = current_turn.get()
+        return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui ne formate pas : msg et args sont résolus par le listener"""
+
+    def prepare(self, record):
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "t": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "turn": record_turn(record),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class ConsoleFormatter(logging.Formatter):
+    def format(self, record):
+        message = super(ConsoleFormatter, self).format(record)
+        turn = record_turn(record)
+        return f"[{turn}] {message}" if turn else message
+
+
+def setup_logging(level="INFO", json_path=None, console=True):
+    """Installe la file et son thread d'écriture ; renvoie le listener (à arrêter en sortie)"""
+    handlers = []
+    if console:
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(ConsoleFormatter("%(message)s"))
+        handlers.append(stream_handler)
+    if json_path:
+        file_handler = logging.FileHandler(json_path, encoding='utf-8')
+        file_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(TurnFilter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,262 @@
+"""Métriques du serveur : compteurs, histogrammes par étape et traces par tour.
+
+Étapes (gemma2_stage_seconds{stage=...}) : receive, decode, prompt_build,
+ollama_load, ollama_prompt_eval, ollama_eval, clean_response, send, plus
+first_response (réception -> première phrase envoyée) et turn (tour complet).
+
+Exposition au format Prometheus (GET /metrics) et en JSON (GET /stats, avec les
+derniers tours), ou dans un fichier de stats réécrit périodiquement.
+"""
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bornes en secondes : du décodage (µs) à la génération complète (s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+
+class TurnTrace(object):
+    """Durées des étapes d'un tour ; started = réception du datagramme"""
+
+    def __init__(self, registry, started=None):
+        self.registry = registry
+        self.started = started or time.time()
+        self.turn = None
+        self.spans = {}
+        self.first_response = None
+        self.finished = False
+
+    def add(self, stage, seconds):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+        self.registry.observe("stage_seconds", seconds, stage=stage)
+
+    def response_sent(self):
+        if self.first_response is None:
+            self.first_response = time.time() - self.started
+            self.registry.observe("stage_seconds", self.first_response, stage="first_response")
+
+
+class MetricsRegistry(object):
+    def __init__(self, prefix="gemma2", recent_turns=50):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = collections.defaultdict(float)
+        self.histograms = {}
+        self.collectors = []
+        self.recent = collections.deque(maxlen=recent_turns)
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[self._key(name, labels)] += value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def add_collector(self, collector):
+        """collector() -> [(nom, {labels}, valeur)] lus à chaque export (jauges)"""
+        self.collectors.append(collector)
+
+    # --- Traces par tour ---
+
+    def new_trace(self, started=None):
+        return TurnTrace(self, started)
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """Chronomètre une étape ; rattachée au tour courant s'il y en a un"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            trace = current_trace.get()
+            if trace is not None:
+                trace.add(stage, elapsed)
+            else:
+                self.observe("stage_seconds", elapsed, stage=stage)
+
+    def record(self, stage, seconds):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(stage, seconds)
+        else:
+            self.observe("stage_seconds", seconds, stage=stage)
+
+    def finish(self, trace, outcome="answered"):
+        if trace is None or trace.finished:
+            return
+        trace.finished = True
+        total = time.time() - trace.started
+        self.observe("stage_seconds", total, stage="turn")
+        self.inc("turns_total", outcome=outcome)
+        with self.lock:
+            self.recent.append({
+                "turn": trace.turn,
+                "outcome": outcome,
+                "started": trace.started,
+                "total": total,
+                "first_response": trace.first_response,
+                "spans": dict(trace.spans),
+            })
+
+    # --- Export ---
+
+    def render(self):
+        """Format texte Prometheus"""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        gauges = [gauge for collector in self.collectors for gauge in collector()]
+
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_labels(labels)} {value:g}")
+        for (name, labels), histogram in histograms:
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{metric}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum:.6f}")
+            lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+        for name, labels, value in gauges:
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} gauge")
+                typed.add(metric)
+            lines.append(f"{metric}{_labels(tuple(sorted(labels.items())))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        with self.lock:
+            counters = {_flat(name, labels): value for (name, labels), value in self.counters.items()}
+            stages = {_flat(name, labels): {"count": h.count, "mean": h.sum / h.count if h.count else 0.0}
+                      for (name, labels), h in self.histograms.items()}
+            recent = list(self.recent)
+        gauges = {_flat(name, tuple(sorted(labels.items()))): value
+                  for collector in self.collectors for name, labels, value in collector()}
+        return {"time": time.time(), "counters": counters, "gauges": gauges, "stages": stages,
+                "recent_turns": recent}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def _flat(name, labels):
+    return name + _labels(labels)
+
+
+@contextlib.contextmanager
+def trace_context(trace):
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = self.registry.render(), "text/plain; version=0.0.4"
+        elif self.path == "/stats":
+            body, content_type = json.dumps(self.registry.snapshot(), ensure_ascii=False), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_metrics(registry, port, host="0.0.0.0"):
+    """Démarre l'endpoint HTTP /metrics + /stats dans un thread ; renvoie le serveur (shutdown())"""
+    handler = type("Gemma2MetricsHandler", (MetricsHandler,), {"registry": registry})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return httpd
+
+
+class StatsFileWriter(object):
+    """Réécrit registry.snapshot() dans path toutes les interval secondes"""
+
+    def __init__(self, registry, path, interval=10.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.registry.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def stop(self):
+        self.stopped.set()
+        self.write()
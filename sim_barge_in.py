@@ -0,0 +1,127 @@
+"""Simulation du barge-in : le visiteur coupe la parole à Pepper.
+
+Client VoiceToLLM + serveur + faux Ollama lent (la génération est encore en
+cours quand Pepper commence à parler). Pendant la première phrase :
+    1. un mot de la réponse revient par le micro (écho)  -> ignoré
+    2. le visiteur parle                                  -> Pepper se tait,
+       le serveur coupe la génération, la nouvelle question obtient sa réponse
+
+Puis le visiteur reprend la parole avant que Pepper ait dit quoi que ce soit
+(prompt-eval lent) : la génération déjà lancée pour l'ancien énoncé est coupée
+dès le nouvel énoncé, seule la nouvelle question obtient une réponse.
+
+    python sim_barge_in.py
+    python sim_barge_in.py --server asyncio
+"""
+import argparse
+import re
+import time
+
+from bench_pipeline import PipelineBench
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def say_words(memory, words, confidence=0.8, pause=0.2):
+    """Rejoue un énoncé ; renvoie l'heure du premier mot reconnu"""
+    memory.raiseEvent("SpeechDetected", 1)
+    time.sleep(0.3)
+    first_word = time.time()
+    for word in words:
+        memory.raiseEvent("WordRecognized", [word, confidence])
+        time.sleep(pause)
+    memory.raiseEvent("SpeechDetected", 0)
+    return first_word
+
+
+def run(server_mode, tokens_per_second, words_per_second):
+    bench = PipelineBench(tokens_per_second=tokens_per_second, server_mode=server_mode, speculative=False)
+    bench.tts.words_per_second = words_per_second
+    memory, tts, client, ollama = bench.memory, bench.tts, bench.client, bench.ollama
+    bench.start()
+    checks = []
+    try:
+        say_words(memory, ["où", "est", "le", "vestiaire"])
+        checks.append(("Pepper commence à répondre", wait_for(lambda: tts.said)))
+        first_request = ollama.requests[-1]
+        utterance_before = client.utterance_id
+
+        # Écho : la reconnaissance rend un mot de la phrase en cours
+        echo = re.findall(r"\w+", tts.said[0][1])[1]
+        memory.raiseEvent("SpeechDetected", 1)
+        memory.raiseEvent("WordRecognized", [echo, 0.9])
+        time.sleep(0.1)
+        checks.append((f"écho '{echo}' ignoré", client.utterance_id == utterance_before and not tts.stopped))
+
+        # Vraie prise de parole : Pepper se tait, génération coupée côté serveur
+        interrupted_at = say_words(memory, ["attendez", "une", "question"])
+        checks.append(("Pepper se tait", wait_for(lambda: tts.stopped, 2.0)))
+        if tts.stopped:
+            print(f"✋ Silence {(tts.stopped[0][0] - interrupted_at) * 1000:.0f}ms après le premier mot")
+        checks.append(("génération coupée côté serveur", wait_for(lambda: first_request['aborted'], 5.0)))
+        said_before = len(tts.said)
+        checks.append(("nouvelle question répondue", wait_for(lambda: len(tts.said) > said_before, 10.0)))
+        cancelled = bench.server.metrics.counters.get(("barge_in_total", ()), 0)
+        checks.append(("barge_in_total compté", cancelled >= 1))
+        print(f"🔊 Lecture : {dict(client.player.stats)}")
+    finally:
+        bench.stop()
+    return checks
+
+
+def generations(ollama):
+    return [r for r in ollama.requests if r['payload'].get('options', {}).get('num_predict') != 1]
+
+
+def run_superseded(server_mode, tokens_per_second, prompt_tokens_per_second):
+    """Nouvel énoncé pendant la génération (pas encore de parole côté Pepper, donc pas de barge-in)"""
+    bench = PipelineBench(tokens_per_second=tokens_per_second, server_mode=server_mode, speculative=False)
+    memory, tts, ollama = bench.memory, bench.tts, bench.ollama
+    ollama.prompt_tokens_per_second = prompt_tokens_per_second
+    bench.start()
+    checks = []
+    try:
+        started = len(generations(ollama))
+        say_words(memory, ["où", "est", "le", "vestiaire"])
+        running = wait_for(lambda: len(generations(ollama)) > started, 5.0)
+        checks.append(("ancienne génération déjà lancée", running and not tts.said))
+        first_request = generations(ollama)[started] if running else {'aborted': False}
+
+        say_words(memory, ["et", "les", "toilettes"])
+        # Coupée dès son premier token, pas à la fin de sa première phrase
+        cut = wait_for(lambda: first_request['aborted'], 10.0)
+        checks.append(("ancienne génération coupée dès le nouvel énoncé", cut and first_request['first_token']
+                       and first_request['last_token'] - first_request['first_token'] < 3.0 / tokens_per_second))
+        checks.append(("nouvelle question répondue", wait_for(lambda: tts.said, 10.0)))
+        time.sleep(1.0)
+        answered = [r for r in generations(ollama)[started:] if r['last_token'] and not r['aborted']]
+        checks.append(("seule la nouvelle question a été dite", len(answered) == 1 and "toilettes"
+                       in answered[0]['payload'].get('prompt', '').rsplit("vestiaire", 1)[-1]))
+        superseded = bench.server.metrics.counters.get(("admission_total", (("decision", "superseded"),)), 0)
+        checks.append(("tour en cours compté remplacé", superseded >= 1))
+    finally:
+        bench.stop()
+    return checks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--tokens_per_second", type=float, default=6.0)
+    parser.add_argument("--words_per_second", type=float, default=2.5)
+    parser.add_argument("--prompt_tokens_per_second", type=float, default=20.0,
+                        help="Prompt-eval lent : l'ancien tour est en cours, sans phrase prête")
+    args = parser.parse_args()
+
+    checks = run(args.server, args.tokens_per_second, args.words_per_second)
+    checks += run_superseded(args.server, args.tokens_per_second, args.prompt_tokens_per_second)
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    raise SystemExit(0 if all(ok for _, ok in checks) else 1)
@@ -0,0 +1,147 @@
+"""Simulation de la configuration partagée : priorités, rechargement à chaud, routage des réponses.
+
+Serveur + client VoiceToLLM + faux Ollama (bench_pipeline), config dans un
+fichier temporaire surveillé par le serveur. Pendant la conversation, le
+fichier est réécrit : nouvelles options Ollama, puis un robot déclaré dont
+les réponses partent vers un autre port.
+
+    python sim_config.py
+    python sim_config.py --server asyncio
+
+Vérifie : défauts < fichier < environnement < ligne de commande, options
+appliquées au tour suivant sans perdre la session ni son historique,
+réponses envoyées à l'adresse d'envoi du robot puis à celle déclarée.
+"""
+import argparse
+import json
+import os
+import socket
+import tempfile
+import time
+
+from bench_pipeline import PipelineBench, free_udp_port
+from pepper_config import Config, DEFAULTS
+from sim_barge_in import say_words, wait_for
+
+ROBOT_ID = "pepper-sim"
+
+
+def write_config(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    # Date de modification différente même si deux écritures tombent dans la même milliseconde
+    stamp = time.time() + 0.01
+    os.utime(path, (stamp, stamp))
+
+
+def check_layers(directory):
+    path = os.path.join(directory, "layers.json")
+    write_config(path, {"generation": {"num_predict": 60, "top_k": 20}, "client": {"llm_host": "10.0.0.5"}})
+    environ = {"PEPPER_GENERATION_TOP_K": "30", "PEPPER_CLIENT_LLM_PORT": "9000", "PEPPER_CONFIG": path}
+    config = Config.load(environ=environ).override("generation", top_k=35, num_ctx=None)
+    generation, client = config.section("generation"), config.section("client")
+    print(f"🧩 generation={generation}\n🧩 client={client}")
+    return [
+        ("défauts < fichier < environnement < ligne de commande",
+         generation["num_predict"] == 60 and generation["top_k"] == 35
+         and generation["num_ctx"] == DEFAULTS["generation"]["num_ctx"]
+         and client["llm_host"] == "10.0.0.5" and client["llm_port"] == 9000),
+    ]
+
+
+def last_generation(ollama, since):
+    requests = [r for r in ollama.requests if r['received'] >= since
+                and r['payload'].get('options', {}).get('num_predict') != 1]
+    return requests[-1]['payload'] if requests else None
+
+
+def run(server_mode, directory):
+    path = os.path.join(directory, "pepper.json")
+    data = {"server": {"config_poll": 0.1}, "generation": dict(DEFAULTS["generation"])}
+    write_config(path, data)
+
+    bench = PipelineBench(server_mode=server_mode, speculative=False, client_options={"robot_id": ROBOT_ID})
+    server, ollama, memory = bench.server, bench.ollama, bench.memory
+    config = Config.load(path)
+    server.watch_config(config)
+
+    # Robot déclaré : port où il veut recevoir (simple socket, on ne fait que compter les datagrammes)
+    registered = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    registered_port = free_udp_port()
+    registered.bind(('127.0.0.1', registered_port))
+    registered.settimeout(0.1)
+
+    bench.start()
+    checks = []
+    try:
+        start = time.time()
+        said = len(bench.tts.said)
+        say_words(memory, ["où", "sont", "les", "toilettes"])
+        answered_by_sender = wait_for(lambda: len(bench.tts.said) > said, 10.0)
+        first = last_generation(ollama, start)
+        time.sleep(0.3)
+        session = server.sessions.get(ROBOT_ID)
+
+        # Options Ollama modifiées pendant que la session est ouverte
+        data["generation"].update(num_predict=40, temperature=0.3)
+        data["conversation"] = {"max_sentences": 1}
+        write_config(path, data)
+        reloaded = wait_for(lambda: server.generation_options["num_predict"] == 40, 3.0)
+        start = time.time()
+        said = len(bench.tts.said)
+        say_words(memory, ["à", "quelle", "heure", "est", "la", "conférence"])
+        wait_for(lambda: len(bench.tts.said) > said, 10.0)
+        second = last_generation(ollama, start)
+        time.sleep(0.3)
+        kept = server.sessions.get(ROBOT_ID)
+        kept_turns = len(kept.context) if kept is not None else 0
+        print(f"⚙️  Options du 1er tour : {first and first['options']}")
+        print(f"⚙️  Options du 2e tour  : {second and second['options']}")
+
+        # Robot déclaré dans la config : les réponses partent vers son port
+        data["robots"] = {ROBOT_ID: f"127.0.0.1:{registered_port}"}
+        write_config(path, data)
+        routed = wait_for(lambda: ROBOT_ID in server.robots, 3.0)
+        # Pepper doit avoir fini la réponse précédente, sinon l'énoncé est pris pour un écho
+        wait_for(lambda: not bench.client.player.is_speaking(), 10.0)
+        time.sleep(0.3)
+        said = len(bench.tts.said)
+        say_words(memory, ["où", "est", "le", "vestiaire"])
+        datagrams = 0
+        deadline = time.time() + 5.0
+        while time.time() < deadline and not datagrams:
+            try:
+                registered.recvfrom(65535)
+                datagrams += 1
+            except socket.timeout:
+                pass
+        spoken_after_routing = len(bench.tts.said) - said
+    finally:
+        config.stop()
+        bench.stop()
+        registered.close()
+
+    reloads = server.metrics.counters.get(("config_reloads_total", ()), 0)
+    print(f"🔄 Rechargements : {reloads}, réponses reçues par le robot déclaré : {datagrams}")
+    checks.append(("réponse reçue à l'adresse d'envoi (aucune IP codée en dur)", answered_by_sender))
+    checks.append(("options rechargées à chaud",
+                   reloaded and first is not None and first['options']['num_predict'] == 100
+                   and second is not None and second['options']['num_predict'] == 40
+                   and second['options']['temperature'] == 0.3 and server.max_sentences == 1))
+    checks.append(("session et historique conservés",
+                   session is not None and kept is session and kept_turns == 2))
+    checks.append(("réponses routées vers le robot déclaré", routed and datagrams > 0 and spoken_after_routing == 0))
+    return checks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=["threads", "asyncio"], default="threads")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        checks = check_layers(directory)
+        checks += run(args.server, directory)
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    raise SystemExit(0 if all(ok for _, ok in checks) else 1)
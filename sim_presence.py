@@ -0,0 +1,247 @@
+"""Simulation de présence : moteur événementiel contre l'ancienne boucle de polling.
+
+Un visiteur s'avance vers Pepper (détection perdue 0,3s en chemin), un passant
+reste à distance, puis le visiteur pose une question. Les événements
+ALPeoplePerception sont rejoués en temps réel dans une FakeMemory ; l'ancienne
+boucle (getData de PeopleList toutes les 2s + 2 getData par personne) tourne
+en parallèle sur les mêmes données.
+
+    python sim_presence.py
+    python sim_presence.py --server asyncio --rpc_latency 0.008
+
+Vérifie : arrivée vue en moins de 200ms, aucune lecture ALMemory, yeux
+changés sans clignoter, un seul indice d'approche (pas pour le passant),
+préchauffage Ollama avant le premier mot, question répondue. Comme avec
+testOnPepperDetection, l'indice part d'un autre socket que le client vocal :
+les réponses doivent quand même arriver au client.
+"""
+import argparse
+import socket
+import threading
+import time
+
+import wire_format
+from bench_pipeline import PipelineBench
+from presence import (PresenceEngine, GREEN, PEOPLE_LIST, VISIBLE_PEOPLE, JUST_ARRIVED, JUST_LEFT,
+                      PEOPLE_DETECTED)
+from sim_barge_in import say_words, wait_for
+from udp_transport import ReliableUDPTransport
+
+VISITOR, PASSERBY = 101, 102
+FRAME = 0.2  # PeopleDetected à 5 Hz
+
+
+class CountingMemory(object):
+    """Compte les lectures ALMemory (getData / getListData) d'un seul consommateur"""
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.reads = 0
+
+    def getData(self, key):
+        self.reads += 1
+        return self.memory.getData(key)
+
+    def getListData(self, keys):
+        self.reads += 1
+        return self.memory.getListData(keys)
+
+    def __getattr__(self, name):
+        return getattr(self.memory, name)
+
+
+def positions(t, walk_until):
+    """Personnes perçues à l'instant t (secondes depuis le début) -> distance"""
+    people = {}
+    if 0.5 <= t and not 1.5 <= t < 1.8:
+        # Le visiteur avance de 4,5m à 1m, détection perdue entre 1,5s et 1,8s
+        people[VISITOR] = max(1.0, 4.5 - 1.0 * (min(t, walk_until) - 0.5))
+    if 2.0 <= t < 3.5:
+        people[PASSERBY] = 3.5
+    return people
+
+
+class PerceptionReplay(object):
+    """Publie les événements ALPeoplePerception et les valeurs lues par l'ancienne boucle"""
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.arrivals = {}
+        self.present = set()
+        self.is_running = False
+
+    def frame(self, t, now):
+        people = positions(t, walk_until=4.0)
+        current = set(people)
+        for person_id, distance in people.items():
+            self.memory.insertData(f"PeoplePerception/Person/{person_id}/Distance", distance)
+            self.memory.insertData(f"PeoplePerception/Person/{person_id}/IsVisible", True)
+        if current != self.present:
+            for person_id in current - self.present:
+                self.arrivals.setdefault(person_id, []).append(now)
+                self.memory.raiseEvent(JUST_ARRIVED, person_id)
+            for person_id in self.present - current:
+                self.memory.raiseEvent(JUST_LEFT, person_id)
+            self.memory.raiseEvent(PEOPLE_LIST, sorted(current))
+            self.memory.raiseEvent(VISIBLE_PEOPLE, sorted(current))
+            self.present = current
+        if people:
+            self.memory.raiseEvent(PEOPLE_DETECTED, [
+                [int(now), int((now % 1) * 1e6)],
+                [[person_id, distance, 0.0, 0.1] for person_id, distance in sorted(people.items())],
+                [0.0] * 6, [0.0] * 6, 0])
+
+    def run(self, duration):
+        start = time.time()
+        self.is_running = True
+        while self.is_running and time.time() - start < duration:
+            self.frame(time.time() - start, time.time())
+            time.sleep(FRAME)
+
+    def leave_all(self):
+        self.is_running = False
+        for person_id in self.present:
+            self.memory.raiseEvent(JUST_LEFT, person_id)
+        self.memory.raiseEvent(PEOPLE_LIST, [])
+        self.present = set()
+
+
+class LegacyPresenceLoop(object):
+    """Ancienne boucle : PeopleList toutes les interval secondes, puis Distance et IsVisible par personne"""
+
+    def __init__(self, memory, interval=2.0):
+        self.memory = CountingMemory(memory)
+        self.interval = interval
+        self.first_seen = {}
+        self.detected = False
+        self.led_changes = 0
+        self.is_running = False
+
+    def tick(self):
+        people_list = self.memory.getData(PEOPLE_LIST)
+        for person_id in people_list or []:
+            self.memory.getData(f"PeoplePerception/Person/{person_id}/Distance")
+            self.memory.getData(f"PeoplePerception/Person/{person_id}/IsVisible")
+            self.first_seen.setdefault(person_id, time.time())
+        if bool(people_list) != self.detected:
+            self.detected = bool(people_list)
+            self.led_changes += 1
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while self.is_running:
+            self.tick()
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.is_running = False
+
+
+def run(server_mode, rpc_latency):
+    bench = PipelineBench(server_mode=server_mode, speculative=False)
+    memory, client, ollama, server = bench.memory, bench.client, bench.ollama, bench.server
+    memory.rpc_latency = rpc_latency
+    bench.start()
+
+    hints = []
+    # Socket à part, comme ApproachNotifier (testOnPepperDetection) : pas d'accusé, pas de réponse
+    hint_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    hint_udp = ReliableUDPTransport(hint_sock.sendto)
+
+    def send_hint(person_id, distance, timestamp):
+        hint_udp.send(wire_format.encode({"type": "visitor_approaching", "timestamp": timestamp,
+                                          "person_id": person_id, "distance": round(distance, 2)}),
+                      ("127.0.0.1", server.port), reliable=False)
+
+    def on_approach(person, timestamp):
+        hints.append((time.time(), person.person_id, person.distance))
+        send_hint(person.person_id, person.distance, timestamp)
+
+    engine_memory = CountingMemory(memory)
+    leds = bench.session.service("ALLeds")
+    engine = PresenceEngine(engine_memory, leds=leds, on_approach=on_approach)
+    first_seen = {}
+    arrive = engine.arrive
+
+    def traced_arrive(person_id, timestamp):
+        first_seen.setdefault(person_id, time.time())
+        return arrive(person_id, timestamp)
+    engine.arrive = traced_arrive
+    engine.start()
+    legacy = LegacyPresenceLoop(memory)
+    legacy.start()
+    replay = PerceptionReplay(memory)
+    replay_thread = threading.Thread(target=replay.run, args=(30.0,))
+    replay_thread.daemon = True
+
+    checks = []
+    try:
+        replay_thread.start()
+        time.sleep(4.5)
+        first_word = say_words(memory, ["où", "sont", "les", "toilettes"])
+        # Indice répété pendant la génération : la réponse doit toujours aller au client vocal
+        wait_for(lambda: bench.datagram_times, 5.0)
+        send_hint(VISITOR, 1.0, time.time())
+        answered = wait_for(lambda: bench.tts.said, 10.0)
+        time.sleep(0.5)
+        replay.leave_all()
+        time.sleep(engine.leds.hold + 0.5)
+    finally:
+        legacy.stop()
+        engine.stop()
+        bench.stop()
+        hint_sock.close()
+
+    arrival = replay.arrivals[VISITOR][0]
+    engine_latency = first_seen.get(VISITOR, float('inf')) - arrival
+    legacy_latency = legacy.first_seen.get(VISITOR, float('inf')) - arrival
+    print(f"\n👤 Arrivée du visiteur vue après {engine_latency * 1000:.0f}ms "
+          f"(ancienne boucle : {legacy_latency * 1000:.0f}ms)")
+    print(f"📡 Lectures ALMemory : moteur {engine_memory.reads}, ancienne boucle {legacy.memory.reads}")
+    fades = [call for call in leds.calls if call[0] == "fadeRGB"]
+    print(f"👀 fadeRGB : {len(fades)} ({dict(engine.leds.stats)}), "
+          f"ancienne boucle : {legacy.led_changes} changement(s)")
+    table = engine.snapshot()
+    print(f"📊 Présence : {dict(engine.stats)}, table finale : {table}")
+
+    prewarms = [r for r in ollama.requests
+                if hints and r['received'] >= hints[0][0]
+                and r['payload'].get('options', {}).get('num_predict') == 1
+                and r['payload'].get('prompt', '').endswith("Humain: ")]
+    prewarm_sent = server.metrics.counters.get(("prewarm_total", (("outcome", "sent"),)), 0)
+    if hints:
+        print(f"🚶 Indice d'approche {(first_word - hints[0][0]) * 1000:.0f}ms avant le premier mot "
+              f"(visiteur à {hints[0][2]:.2f}m)")
+    if prewarms:
+        print(f"🔥 Préchauffage reçu par Ollama {(first_word - prewarms[0]['received']) * 1000:.0f}ms "
+              f"avant le premier mot")
+
+    checks.append(("arrivée vue en moins de 200ms", engine_latency < 0.2))
+    checks.append(("aucune lecture ALMemory par le moteur", engine_memory.reads == 0))
+    colors = [call[1][1:4] for call in fades]
+    checks.append(("yeux : rouge, vert, rouge, blanc, sans clignoter",
+                   len(colors) == 4 and colors[1] == GREEN and engine.leds.stats["suppressed"] >= 1))
+    checks.append(("un seul indice d'approche (pas le passant)",
+                   [person_id for _, person_id, _ in hints] == [VISITOR]))
+    checks.append(("préchauffage Ollama avant le premier mot",
+                   prewarm_sent == 1 and bool(prewarms) and prewarms[0]['received'] < first_word))
+    checks.append(("question répondue", answered))
+    checks.append(("départ vu, table vide", not table))
+    return checks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--rpc_latency", type=float, default=0.008, help="Coût d'un aller-retour qi (s)")
+    args = parser.parse_args()
+
+    checks = run(args.server, args.rpc_latency)
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    raise SystemExit(0 if all(ok for _, ok in checks) else 1)
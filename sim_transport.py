@@ -0,0 +1,157 @@
+"""Simulation d'un Wi-Fi dégradé pour udp_transport.py : pertes, doublons, réordonnancement.
+
+Deux extrémités ReliableUDPTransport reliées par un canal en mémoire ; on envoie des
+messages de tailles variées (jusqu'à plusieurs fragments) et on vérifie qu'ils
+arrivent tous, intacts, une seule fois.
+
+    python sim_transport.py --loss 0.1 --duplicate 0.05 --jitter 0.03 --messages 300
+"""
+import argparse
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from udp_transport import ReliableUDPTransport
+
+
+class LossyChannel(object):
+    """Livre les datagrammes après un délai aléatoire ; en perd et en duplique certains"""
+
+    def __init__(self, loss=0.1, duplicate=0.05, latency=0.005, jitter=0.03, seed=0):
+        self.loss = loss
+        self.duplicate = duplicate
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.queue = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.endpoints = {}
+        self.stats = {'datagrams': 0, 'lost': 0, 'duplicated': 0}
+        self.is_running = False
+
+    def endpoint(self, addr, on_message):
+        transport = ReliableUDPTransport(lambda data, to: self.send(data, addr, to))
+        self.endpoints[addr] = (transport, on_message)
+        return transport
+
+    def send(self, data, source, destination):
+        with self.condition:
+            self.stats['datagrams'] += 1
+            if self.random.random() < self.loss:
+                self.stats['lost'] += 1
+                return
+            copies = 2 if self.random.random() < self.duplicate else 1
+            self.stats['duplicated'] += copies - 1
+            for _ in range(copies):
+                # Le jitter suffit à réordonner les fragments d'un même message
+                due = time.time() + self.latency + self.random.uniform(0, self.jitter)
+                heapq.heappush(self.queue, (due, next(self.counter), data, source, destination))
+            self.condition.notify()
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self.deliver_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        for transport, _ in self.endpoints.values():
+            transport.start()
+
+    def deliver_loop(self):
+        while self.is_running:
+            with self.condition:
+                if not self.queue:
+                    self.condition.wait(0.05)
+                    continue
+                due, _, data, source, destination = self.queue[0]
+                delay = due - time.time()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                heapq.heappop(self.queue)
+            transport, on_message = self.endpoints[destination]
+            message = transport.on_datagram(data, source)
+            if message is not None:
+                on_message(message, source)
+
+    def stop(self):
+        self.is_running = False
+        for transport, _ in self.endpoints.values():
+            transport.stop()
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def simulate(messages=200, loss=0.1, duplicate=0.05, jitter=0.03, max_size=6000, seed=0, rate=100.0):
+    channel = LossyChannel(loss=loss, duplicate=duplicate, jitter=jitter, seed=seed)
+    rng = random.Random(seed + 1)
+    sent = {}
+    received = {}
+    corrupted = []
+    lock = threading.Lock()
+
+    def on_message(message, source):
+        index = int(message[:8])
+        with lock:
+            if index in received:
+                corrupted.append(index)  # doublon livré à l'application
+            received[index] = time.time()
+            if message != sent[index][1]:
+                corrupted.append(index)
+
+    server_addr, robot_addr = ("serveur", 8888), ("pepper", 8889)
+    channel.endpoint(server_addr, on_message)
+    robot = channel.endpoint(robot_addr, lambda message, source: None)
+    channel.start()
+
+    for index in range(messages):
+        size = rng.randint(20, max_size)
+        body = b"%08d" % index + bytes(rng.randrange(32, 127) for _ in range(size))
+        sent[index] = (time.time(), body)
+        robot.send(body, server_addr)
+        time.sleep(1.0 / rate)
+
+    # Laisse finir les retransmissions (backoff compris)
+    deadline = time.time() + robot.retransmit_interval * (robot.max_retries + 2) ** 2
+    while robot.unacked() and time.time() < deadline:
+        time.sleep(0.05)
+    channel.stop()
+
+    latencies = [received[i] - sent[i][0] for i in received]
+    return {
+        'messages': messages,
+        'delivered': len(received),
+        'corrupted_or_duplicated': len(corrupted),
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'channel': channel.stats,
+        'sender': dict(robot.stats),
+        'receiver': dict(channel.endpoints[server_addr][0].stats),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--loss", type=float, default=0.1, help="Probabilité de perte par datagramme")
+    parser.add_argument("--duplicate", type=float, default=0.05, help="Probabilité de doublon par datagramme")
+    parser.add_argument("--jitter", type=float, default=0.03, help="Délai aléatoire max (réordonnancement)")
+    parser.add_argument("--max_size", type=int, default=6000, help="Taille max d'un message (octets)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = simulate(args.messages, args.loss, args.duplicate, args.jitter, args.max_size, args.seed)
+    print(f"📶 Perte {args.loss:.0%}, doublons {args.duplicate:.0%}, jitter {args.jitter * 1000:.0f}ms")
+    print(f"   livrés: {result['delivered']}/{result['messages']}, "
+          f"corrompus ou en double: {result['corrupted_or_duplicated']}")
+    print(f"   latence p50 {result['p50'] * 1000:.0f}ms, p95 {result['p95'] * 1000:.0f}ms")
+    print(f"   canal: {result['channel']}")
+    print(f"   émetteur: {result['sender']}")
+    print(f"   récepteur: {result['receiver']}")
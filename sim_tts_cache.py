@@ -0,0 +1,144 @@
+"""Simulation du cache audio TTS : phrases fréquentes rejouées sans synthèse.
+
+Client VoiceToLLM (cache audio dans un dossier temporaire) + serveur avec son
+cache de réponses + faux Ollama. La fausse TTS met synthesis_latency avant le
+premier son d'un say ; un fichier rendu par sayToFile part tout de suite.
+Les visiteurs reposent les mêmes questions, Ollama tombe en panne un moment
+(réponse de secours, rendue d'avance au démarrage).
+
+    python sim_tts_cache.py
+    python sim_tts_cache.py --server asyncio --synthesis_latency 0.4
+
+Vérifie aussi le budget disque : éviction LRU, index rechargé au redémarrage.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from bench_pipeline import PipelineBench
+from canned_replies import CANNED_REPLIES, FALLBACK_RESPONSES
+from fake_qi import AUDIO_BYTES_PER_SECOND, FakeAudioPlayer, FakeTextToSpeech
+from sim_barge_in import say_words, wait_for
+from tts_cache import TTSAudioCache, text_key
+
+QUESTIONS = [
+    ["où", "sont", "les", "toilettes"],
+    ["à", "quelle", "heure", "commence", "la", "conférence"],
+    ["où", "sont", "les", "toilettes"],
+    ["où", "est", "le", "vestiaire"],
+    ["à", "quelle", "heure", "commence", "la", "conférence"],
+    ["où", "sont", "les", "toilettes"],
+    ["comment", "aller", "à", "la", "gare"],
+    ["à", "quelle", "heure", "commence", "la", "conférence"],
+    ["comment", "aller", "à", "la", "gare"],
+]
+
+
+def run(server_mode, synthesis_latency, directory):
+    bench = PipelineBench(server_mode=server_mode, cache=True, speculative=False,
+                          client_options={"tts_cache_dir": directory})
+    bench.tts.synthesis_latency = synthesis_latency
+    client, ollama = bench.client, bench.ollama
+    audio_player = bench.session.service("ALAudioPlayer")
+
+    # Heure de réception de chaque phrase côté client, indice de la première phrase de chaque réponse
+    received = []
+    first_fragments = []
+    enqueue = client.player.enqueue
+
+    def traced_enqueue(text, utterance_id=None, cache_key=None):
+        received.append((time.time(), text, cache_key))
+        enqueue(text, utterance_id, cache_key)
+    client.player.enqueue = traced_enqueue
+
+    bench.start()
+    checks = []
+    try:
+        checks.append(("réponses fixes rendues au démarrage",
+                       wait_for(lambda: client.audio_cache.stats["rendered"] >= len(CANNED_REPLIES), 10.0)))
+        for index, words in enumerate(QUESTIONS):
+            if index == 6:
+                ollama.failure_rate = 1.0  # panne : réponse de secours
+            elif index == 8:
+                ollama.failure_rate = 0.0
+            before = len(received)
+            first_fragments.append(before)
+            say_words(bench.memory, words)
+            wait_for(lambda: len(received) > before, 10.0)
+            time.sleep(0.2)
+            wait_for(lambda: not client.player.is_speaking() and not client.audio_cache.pending, 10.0)
+    finally:
+        bench.stop()
+
+    # Délai réception de la première phrase -> premier son de la réponse (TTS ou fichier)
+    starts = sorted([(t, False) for t, _ in bench.tts.started] + [(t, True) for t, _ in audio_player.played])
+    delays = {True: [], False: []}
+    for index in first_fragments:
+        if index >= len(received):
+            continue
+        received_at = received[index][0]
+        started_at, cached = next((start for start in starts if start[0] >= received_at), (None, None))
+        if started_at is not None:
+            delays[cached].append(started_at - received_at)
+    report = client.audio_cache.report()
+    print(f"\n🔊 Cache audio : {report}")
+    print(f"🔊 Lecture : {dict(client.player.stats)}")
+    for cached, label in ((False, "synthèse TTS"), (True, "audio en cache")):
+        if delays[cached]:
+            print(f"{label:<16} {len(delays[cached]):>3} réponses, premier son après "
+                  f"{statistics.median(delays[cached]) * 1000:.0f}ms (médiane)")
+
+    tagged = [text for _, text, cache_key in received if cache_key]
+    fallbacks = [text for _, text, _ in received if text in FALLBACK_RESPONSES]
+    checks.append(("phrases du cache de réponses marquées", len(tagged) >= 4))
+    checks.append(("réponse de secours marquée", bool(fallbacks) and all(text in tagged for text in fallbacks)))
+    checks.append(("hits rejoués sans synthèse",
+                   report['hits'] >= 3 and len(audio_player.played) == report['hits']))
+    checks.append(("premier son plus rapide en cache",
+                   bool(delays[True]) and max(delays[True]) < synthesis_latency / 2
+                   and statistics.median(delays[False]) >= synthesis_latency * 0.9))
+    checks.append(("millisecondes économisées comptées", report['saved_ms'] >= report['hits'] * synthesis_latency * 900))
+    return checks
+
+
+def check_budget(directory):
+    """Éviction LRU sous budget disque, puis index rechargé par une nouvelle instance"""
+    tts = FakeTextToSpeech(words_per_second=3.0)
+    texts = [f"Phrase numéro {index} du test." for index in range(5)]
+    sentence_bytes = int(len(texts[0].split()) / tts.words_per_second * AUDIO_BYTES_PER_SECOND)
+    cache = TTSAudioCache(tts, FakeAudioPlayer(), directory, max_bytes=3 * sentence_bytes).start()
+    for text in texts[:3]:
+        cache.render_later(text_key(text), text)
+    wait_for(lambda: cache.stats["rendered"] == 3)
+    cache.play(text_key(texts[0]))  # texts[0] redevient le plus récent
+    for text in texts[3:]:
+        cache.render_later(text_key(text), text)
+    wait_for(lambda: cache.stats["rendered"] == 5)
+    cache.stop()
+
+    kept = {entry['text'] for entry in cache.entries.values()}
+    files = [name for name in os.listdir(directory) if name.endswith(".wav")]
+    reloaded = TTSAudioCache(tts, FakeAudioPlayer(), directory, max_bytes=3 * sentence_bytes).start()
+    reloaded.stop()
+    print(f"💽 Budget {3 * sentence_bytes} octets : gardées {sorted(kept)}, {cache.stats['evicted']} évincées")
+    return [
+        ("budget disque respecté", cache.total_bytes <= cache.max_bytes and len(files) == 3),
+        ("éviction LRU (la phrase rejouée reste)", kept == {texts[0], texts[3], texts[4]}),
+        ("index rechargé au redémarrage", set(reloaded.entries) == set(cache.entries)),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--synthesis_latency", type=float, default=0.3, help="Délai de synthèse de la fausse TTS (s)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as budget_directory:
+        checks = run(args.server, args.synthesis_latency, directory)
+        checks += check_budget(budget_directory)
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    raise SystemExit(0 if all(ok for _, ok in checks) else 1)
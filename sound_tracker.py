@@ -0,0 +1,138 @@
+"""Suivi de la direction des sons (ALSoundLocalization/SoundLocated) sur fenêtre glissante.
+
+SoundLocated = [[sec, usec], [azimut, élévation, confiance, énergie],
+                [position tête 6D, repère torse], [position tête 6D, repère robot]]
+
+L'azimut est relatif à la tête : on lui ajoute le lacet de la tête (repère
+torse) pour que la direction d'un locuteur ne bouge pas quand Pepper tourne la
+tête. Les échantillons vont dans des tableaux NumPy circulaires ; dominant()
+fait un histogramme circulaire pondéré (confiance x décroissance temporelle),
+lissé, dont le pic donne le groupe de directions du locuteur principal.
+"""
+import collections
+import math
+import threading
+import time
+
+import numpy as np
+
+TWO_PI = 2 * np.pi
+
+# azimuth (rad, repère torse), confidence : moyenne du groupe, share : part du poids total
+SpeakerDirection = collections.namedtuple("SpeakerDirection", "azimuth confidence share samples")
+
+
+def angle_diff(a, b):
+    """Écart signé a - b ramené dans [-pi, pi[ (scalaires ou tableaux)"""
+    return (a - b + np.pi) % TWO_PI - np.pi
+
+
+class SoundDirectionTracker(object):
+    def __init__(self, capacity=512, window=2.0, min_confidence=0.3, cluster_width=math.radians(20),
+                 half_life=0.7):
+        self.capacity = capacity
+        self.window = window
+        self.min_confidence = min_confidence
+        self.cluster_width = cluster_width
+        self.half_life = half_life
+        self.bins = max(3, int(round(TWO_PI / cluster_width)))
+
+        self.times = np.zeros(capacity)
+        self.azimuths = np.zeros(capacity)
+        self.confidences = np.zeros(capacity)
+        self.index = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+        self.head_yaw = 0.0
+        self.last_stamp = None
+        self.turned_to = None
+        self.stats = collections.Counter()
+
+    def add(self, timestamp, azimuth, confidence):
+        with self.lock:
+            index = self.index
+            self.times[index] = timestamp
+            self.azimuths[index] = azimuth
+            self.confidences[index] = confidence
+            self.index = (index + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def add_batch(self, timestamps, azimuths, confidences):
+        """Ajout vectorisé (relecture de traces) ; seuls les capacity derniers sont gardés"""
+        timestamps = np.asarray(timestamps, dtype=float)[-self.capacity:]
+        size = len(timestamps)
+        if not size:
+            return
+        with self.lock:
+            slots = (self.index + np.arange(size)) % self.capacity
+            self.times[slots] = timestamps
+            self.azimuths[slots] = np.asarray(azimuths, dtype=float)[-size:]
+            self.confidences[slots] = np.asarray(confidences, dtype=float)[-size:]
+            self.index = (self.index + size) % self.capacity
+            self.count = min(self.count + size, self.capacity)
+
+    def add_event(self, sound_located, now=None):
+        """Valeur brute de SoundLocated ; False si invalide, déjà vue ou trop peu sûre"""
+        if not sound_located or len(sound_located) < 2 or len(sound_located[1]) < 3:
+            return False
+        stamp = sound_located[0]
+        if stamp == self.last_stamp:
+            # Polling : la même valeur est relue tant qu'aucun nouveau son n'arrive
+            return False
+        self.last_stamp = stamp
+        azimuth, confidence = sound_located[1][0], sound_located[1][2]
+        if len(sound_located) >= 3 and len(sound_located[2]) >= 6:
+            self.head_yaw = sound_located[2][5]
+        if confidence < self.min_confidence:
+            self.stats["rejected"] += 1
+            return False
+        self.stats["accepted"] += 1
+        self.add(now if now is not None else time.time(), azimuth + self.head_yaw, confidence)
+        return True
+
+    def dominant(self, now=None, window=None):
+        """Direction du locuteur principal sur la fenêtre, ou None sans échantillon récent"""
+        now = now if now is not None else time.time()
+        window = window or self.window
+        with self.lock:
+            count = self.count
+            times = self.times[:count].copy()
+            azimuths = self.azimuths[:count].copy()
+            confidences = self.confidences[:count].copy()
+
+        recent = (times >= now - window) & (times <= now)
+        if not recent.any():
+            return None
+        times, azimuths = times[recent], azimuths[recent]
+        weights = confidences[recent] * 0.5 ** ((now - times) / self.half_life)
+
+        # Histogramme circulaire pondéré, lissé sur les cases voisines : le pic est le groupe dominant
+        slots = ((azimuths % TWO_PI) * (self.bins / TWO_PI)).astype(int) % self.bins
+        histogram = np.bincount(slots, weights=weights, minlength=self.bins)
+        smoothed = histogram + 0.5 * (np.roll(histogram, 1) + np.roll(histogram, -1))
+        peak = (np.argmax(smoothed) + 0.5) * TWO_PI / self.bins
+
+        cluster = np.abs(angle_diff(azimuths, peak)) <= self.cluster_width
+        cluster_weights = weights[cluster]
+        azimuth = math.atan2(np.dot(cluster_weights, np.sin(azimuths[cluster])),
+                             np.dot(cluster_weights, np.cos(azimuths[cluster])))
+        return SpeakerDirection(azimuth, float(confidences[recent][cluster].mean()),
+                                float(cluster_weights.sum() / weights.sum()), int(cluster.sum()))
+
+    def off_axis(self, now=None, tolerance=math.radians(45), window=1.0, min_share=0.5):
+        """Le son dominant récent vient d'ailleurs que de face ; False si on ne sait pas"""
+        direction = self.dominant(now, window)
+        if direction is None or direction.share < min_share:
+            return False
+        return abs(angle_diff(direction.azimuth, self.head_yaw)) > tolerance
+
+    def turn_target(self, now=None, min_share=0.6, min_samples=3, hysteresis=math.radians(15)):
+        """Azimut vers lequel tourner la tête, une seule fois par changement de locuteur"""
+        direction = self.dominant(now)
+        if direction is None or direction.share < min_share or direction.samples < min_samples:
+            return None
+        if self.turned_to is not None and abs(angle_diff(direction.azimuth, self.turned_to)) < hysteresis:
+            return None
+        self.turned_to = direction.azimuth
+        return direction.azimuth
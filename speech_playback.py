@@ -0,0 +1,146 @@
+"""Lecture TTS interruptible pour le client Pepper (barge-in).
+
+Les fragments de réponse passent par une file lue par un thread unique :
+chaque phrase part en ALTextToSpeech.say(_async=True), dont la future est
+annulable. interrupt() vide la file et coupe la phrase en cours (cancel()
+puis stopAll(), qui arrête aussi un say non annulable).
+
+Avec audio_cache (tts_cache.TTSAudioCache), une phrase marquée d'une
+cache_key déjà rendue est jouée par ALAudioPlayer sans synthèse ; sinon elle
+est dite par la TTS et rendue en tâche de fond pour la fois suivante.
+
+is_speaking() reste vrai echo_tail secondes après la dernière phrase : la
+reconnaissance vocale rend encore des mots de la voix du robot juste après.
+"""
+import collections
+import threading
+import time
+
+
+class SpeechPlayer(object):
+    def __init__(self, tts, echo_tail=0.4, audio_cache=None):
+        self.tts = tts
+        self.audio_cache = audio_cache
+        self.echo_tail = echo_tail
+        self.fragments = collections.deque()
+        self.condition = threading.Condition()
+        self.current = None  # (utterance_id, texte, future) en cours de lecture (future None : lancement)
+        self.generation = 0  # incrémenté par interrupt()
+        self.speaking_until = 0.0
+        self.is_running = False
+        self.stats = collections.Counter()
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.interrupt()
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+        self.thread.join(timeout=2)
+
+    def enqueue(self, text, utterance_id=None, cache_key=None):
+        with self.condition:
+            self.fragments.append((utterance_id, text, cache_key))
+            self.condition.notify()
+
+    def is_speaking(self, now=None):
+        with self.condition:
+            if self.current is not None or self.fragments:
+                return True
+        return (now or time.time()) < self.speaking_until
+
+    def current_text(self):
+        """Texte de la phrase en cours et de celles en file (filtre d'écho)"""
+        with self.condition:
+            texts = [text for _, text, _ in self.fragments]
+            if self.current is not None:
+                texts.insert(0, self.current[1])
+        return " ".join(texts)
+
+    def interrupt(self):
+        """Coupe la parole ; renvoie l'utterance_id de la réponse interrompue (None si silence)"""
+        with self.condition:
+            current = self.current
+            dropped = len(self.fragments)
+            utterance_id = current[0] if current else (self.fragments[0][0] if self.fragments else None)
+            self.fragments.clear()
+            self.current = None
+            # Une phrase en cours de lancement (appel au robot) verra le changement et se coupera
+            self.generation += 1
+        if current is None and not dropped:
+            return None
+        self.stats["interrupted"] += 1
+        self.stats["dropped"] += dropped
+        if current is not None and current[2] is not None:
+            self.halt(current[2])
+        return utterance_id
+
+    def halt(self, future):
+        try:
+            future.cancel()
+        except Exception:
+            pass
+        try:
+            self.tts.stopAll()
+        except Exception as e:
+            print(f"⚠️  stopAll TTS : {e}")
+        if self.audio_cache:
+            self.audio_cache.stop_playback()
+
+    def launch(self, text, cache_key):
+        """Lance la phrase (RPC vers le robot) ; future, ou None si la TTS a échoué"""
+        future = self.audio_cache.play(cache_key) if self.audio_cache else None
+        if future is not None:
+            self.stats["cached"] += 1
+            return future
+        try:
+            future = self.tts.say(text, _async=True)
+        except Exception as e:
+            print(f"❌ Erreur TTS : {e}")
+            return None
+        if self.audio_cache and cache_key:
+            self.audio_cache.render_later(cache_key, text)
+        return future
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.is_running and not self.fragments:
+                    self.condition.wait()
+                if not self.is_running:
+                    return
+                utterance_id, text, cache_key = self.fragments.popleft()
+                generation = self.generation
+                # Phrase visible (is_speaking, écho, interrupt) pendant son lancement
+                starting = (utterance_id, text, None)
+                self.current = starting
+            # Appels au robot hors verrou : is_speaking() et interrupt() n'attendent pas une RPC
+            future = self.launch(text, cache_key)
+            with self.condition:
+                interrupted = not self.is_running or self.generation != generation
+                if future is not None and not interrupted:
+                    self.current = (utterance_id, text, future)
+                elif self.current is starting:
+                    self.current = None
+            if future is None:
+                continue
+            if interrupted:
+                # interrupt() arrivé pendant le lancement : la phrase ne doit pas être dite
+                self.halt(future)
+                continue
+            try:
+                future.wait()
+            except Exception:
+                # Future annulée ou say interrompu par stopAll
+                pass
+            with self.condition:
+                if self.current is not None and self.current[2] is future:
+                    self.current = None
+                    self.stats["spoken"] += 1
+                self.speaking_until = time.time() + self.echo_tail
@@ -0,0 +1,160 @@
+"""Post-traitement des réponses du LLM pour la synthèse vocale, en streaming.
+
+SentenceStream reçoit les tokens d'Ollama au fil de l'eau et rend les phrases
+complètes, nettoyées pour la TTS (rôle « Assistant: », markdown, emojis).
+La fin de phrase suit la typographie française :
+
+- ponctuation forte (. ! ? … ...) suivie d'un blanc, guillemets fermants
+  compris (« … bonjour. » reste dans la phrase) ;
+- pas de coupure si le mot suivant commence par une minuscule (« etc. et »,
+  « je vois… peut-être ») ni après une abréviation (M., Mme., Dr., p. ex.) ;
+- un saut de ligne termine la phrase (listes markdown) ; « 1. » en début de
+  ligne est une puce, pas une phrase.
+
+Le tampon n'est parcouru qu'une fois : chaque feed reprend l'analyse là où
+la précédente s'est arrêtée. Toutes les expressions sont compilées ici.
+"""
+import re
+
+# Candidat fin de phrase : ponctuation forte (+ guillemets fermants), ou saut de ligne
+BOUNDARY_RE = re.compile(r'[.!?…]+(?:[ \u00a0\u202f]?»|[”")\]])*|\n')
+# Blancs après la ponctuation (espaces insécables compris), sans le saut de ligne
+SPACE_RE = re.compile(r'[ \t\r\u00a0\u202f]*')
+ROLE_PREFIX_RE = re.compile(r'^\s*(?:Assistant|A|Réponse|Response)\s*:\s*', re.IGNORECASE)
+LIST_MARKER_RE = re.compile(r'^\s*(?:[-*•+>]|\d{1,2}[.)])\s+')
+LINK_RE = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+# Balisage markdown, puis pictogrammes, drapeaux, symboles divers et dingbats, sélecteurs de variante, ZWJ
+UNSPOKEN_RE = re.compile(r'[*#`~|]+|(?<!\w)_+|_+(?!\w)'
+                         r'|[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\uFE0E\uFE0F\u200D\u20E3]+')
+LIST_MARKER_CHARS = "-*•+>0123456789"
+SPACE_BEFORE_PUNCT_RE = re.compile(r'\s+([,.…])')
+
+# Mots suivis d'un point qui ne terminent pas la phrase (en minuscules, sans le point)
+ABBREVIATIONS = frozenset([
+    "m", "mm", "mme", "mmes", "mlle", "mlles", "mr", "dr", "pr", "me", "st", "ste", "sté", "cie",
+    "av", "bd", "boul", "cf", "ex", "p", "pp", "env", "n", "no", "vol", "chap", "fig", "tél", "tel",
+    "min", "max", "approx", "réf", "ref", "art", "éd", "ed", "hab",
+])
+
+
+def clean_sentence(sentence):
+    """Texte d'une phrase pour la TTS : sans rôle, markdown ni emojis, espaces normalisés"""
+    # Les motifs rares ne sont appliqués que si un caractère les annonce
+    if ":" in sentence[:14]:
+        sentence = ROLE_PREFIX_RE.sub('', sentence)
+    if sentence.lstrip()[:1] in LIST_MARKER_CHARS:
+        sentence = LIST_MARKER_RE.sub('', sentence)
+    if "](" in sentence:
+        sentence = LINK_RE.sub(r'\1', sentence)
+    sentence = " ".join(UNSPOKEN_RE.sub('', sentence).split())
+    # Emoji ou symbole retiré avant la ponctuation : « Bienvenue 😊 ! » -> « Bienvenue ! »
+    sentence = SPACE_BEFORE_PUNCT_RE.sub(r'\1', sentence)
+    # Rien à dire : ponctuation ou puce seule
+    if not any(char.isalnum() for char in sentence):
+        return ""
+    return sentence
+
+
+class SentenceStream(object):
+    """Découpe en phrases un texte reçu par morceaux ; limit_reached signale qu'il faut couper la génération"""
+
+    def __init__(self, max_sentences=2, clean=clean_sentence):
+        self.max_sentences = max_sentences
+        self.clean = clean
+        self.buffer = ""
+        self.scan_from = 0  # rien à trouver avant cette position du tampon
+        self.sentences = []
+
+    @property
+    def limit_reached(self):
+        return self.max_sentences is not None and len(self.sentences) >= self.max_sentences
+
+    @property
+    def text(self):
+        return " ".join(self.sentences)
+
+    def feed(self, chunk):
+        """Ajoute un morceau de texte ; renvoie les nouvelles phrases complètes (nettoyées)"""
+        if self.limit_reached or not chunk:
+            return []
+        self.buffer += chunk
+        if BOUNDARY_RE.search(self.buffer, self.scan_from) is None:
+            # Cas le plus fréquent : pas de ponctuation dans le token
+            self.scan_from = len(self.buffer)
+            return []
+        return self._split(final=False)
+
+    def flush(self):
+        """Fin du flux : le reste du tampon est la dernière phrase"""
+        if self.limit_reached:
+            self.buffer = ""
+            return []
+        new_sentences = self._split(final=True)
+        rest, self.buffer, self.scan_from = self.buffer, "", 0
+        return new_sentences + self._accept(rest)
+
+    def _split(self, final):
+        buffer = self.buffer
+        new_sentences = []
+        start = 0
+        pos = self.scan_from
+        while not self.limit_reached:
+            match = BOUNDARY_RE.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+            end = SPACE_RE.match(buffer, match.end()).end()
+            if match.group() != "\n":
+                if end == len(buffer) and not final:
+                    # Pas encore vu ce qui suit la ponctuation
+                    pos = match.start()
+                    break
+                if end == match.end() and end < len(buffer) and buffer[end] != "\n":
+                    # Pas de blanc après : 3.5, www.site.fr, « ?! » collé
+                    pos = match.end()
+                    continue
+                if end < len(buffer) and not self._ends_sentence(buffer, start, match, end):
+                    pos = end
+                    continue
+            new_sentences.extend(self._accept(buffer[start:match.end()]))
+            start = pos = end
+        if start:
+            self.buffer = buffer[start:]
+            pos -= start
+        self.scan_from = max(0, pos)
+        return new_sentences
+
+    def _ends_sentence(self, buffer, start, match, next_index):
+        if buffer[next_index].islower():
+            return False
+        if not match.group().startswith(".") or match.group().startswith(".."):
+            return True
+        # Mot qui précède un point simple : abréviation ou puce numérotée ?
+        word_start = max(start, buffer.rfind(" ", start, match.start()) + 1,
+                         buffer.rfind("\n", start, match.start()) + 1)
+        word = buffer[word_start:match.start()]
+        if word.lower().lstrip("(«\"") in ABBREVIATIONS:
+            return False
+        if word.isdigit() and not buffer[start:word_start].strip():
+            return False
+        return True
+
+    def _accept(self, candidate):
+        if self.limit_reached:
+            return []
+        sentence = self.clean(candidate)
+        if not sentence:
+            return []
+        self.sentences.append(sentence)
+        return [sentence]
+
+
+def split_sentences(text, max_sentences=None, clean=clean_sentence):
+    """Phrases d'un texte complet"""
+    stream = SentenceStream(max_sentences, clean)
+    return stream.feed(text) + stream.flush()
+
+
+def clean_response(text, max_sentences=2):
+    """Réponse complète nettoyée pour la TTS, limitée à max_sentences phrases"""
+    return " ".join(split_sentences(text, max_sentences))
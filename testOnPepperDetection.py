@@ -1,91 +1,103 @@
 import qi
 import argparse
+import socket
 import time
 
-class EventHandler(object):
-    def __init__(self):
-        pass
-    
-    def on_people_list(self, key, value, message):
-        print("Liste des personnes changée:", value)
+from pepper_config import Config
+from presence import PresenceEngine
+from udp_transport import ReliableUDPTransport
+import wire_format
+
+
+class ApproachNotifier(object):
+    """Prévient le serveur LLM qu'un visiteur s'approche (il charge le modèle avant le premier mot)"""
+
+    def __init__(self, llm_host, llm_port, robot_id=None):
+        self.addr = (llm_host, llm_port)
+        self.robot_id = robot_id
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp = ReliableUDPTransport(self.sock.sendto)
+
+    def __call__(self, person, timestamp):
+        msg = {
+            "type": "visitor_approaching",
+            "timestamp": timestamp,
+            "person_id": person.person_id,
+            "distance": round(person.distance, 2)
+        }
+        if self.robot_id:
+            msg["robot_id"] = self.robot_id
+        try:
+            # Simple indice : pas d'accusé attendu, un indice perdu ne coûte qu'un démarrage à froid
+            self.udp.send(wire_format.encode(msg), self.addr, reliable=False)
+            print(f"📤 Visiteur en approche signalé à {self.addr[0]}:{self.addr[1]}")
+        except Exception as e:
+            print(f"❌ Erreur envoi LLM : {e}")
+
+    def close(self):
+        self.sock.close()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--ip", type=str, required=True)
-    parser.add_argument("--port", type=int, default=9559)
+    parser.add_argument("--config", default=None, help="Fichier de config JSON (défaut : $PEPPER_CONFIG)")
+    parser.add_argument("--ip", type=str, default=None, help="Adresse du robot (config : client.robot_ip)")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--llm_host", default=None,
+                        help="Serveur LLM à préchauffer quand un visiteur s'approche (config : client.llm_host)")
+    parser.add_argument("--llm_port", type=int, default=None)
+    parser.add_argument("--robot_id", default=None)
+    parser.add_argument("--approach_distance", type=float, default=3.0, help="Distance (m) d'un visiteur en approche")
+    parser.add_argument("--led_hold", type=float, default=0.8, help="Stabilité requise avant de changer les yeux (s)")
     args = parser.parse_args()
+    config = Config.load(args.config).override("client", robot_ip=args.ip, robot_port=args.port,
+                                               llm_host=args.llm_host, llm_port=args.llm_port,
+                                               robot_id=args.robot_id)
+    client = config.section("client")
+    if not client["robot_ip"]:
+        parser.error("adresse du robot requise : --ip ou client.robot_ip dans la config")
+    # Serveur LLM prévenu seulement s'il est désigné (option ou fichier de config)
+    llm_host = client["llm_host"] if args.llm_host or config.path else None
 
     # Connexion au robot Pepper via qi
-    connection_url = "tcp://{}:{}".format(args.ip, args.port)
+    connection_url = "tcp://{}:{}".format(client["robot_ip"], client["robot_port"])
     app = qi.Application(['pepper_presence', '--qi-url=' + connection_url])
     app.start()
     session = app.session
 
     # Vérifier et activer les services nécessaires
+    leds = None
     try:
         people_perception = session.service("ALPeoplePerception")
         print("ALPeoplePerception trouvé et activé")
-        
+
         basic_awareness = session.service("ALBasicAwareness")
         basic_awareness.setEnabled(True)
         print("ALBasicAwareness activé")
-        
+
         # Service pour contrôler les LEDs
         leds = session.service("ALLeds")
+        leds.setIntensity("FaceLeds", 1.0)  # Intensité maximale
         print("ALLeds activé")
-        
+
     except Exception as e:
         print("Erreur lors de l'activation des services:", e)
 
-    # Abonnement via événement
-    handler = EventHandler()
-    session.registerService("EventHandler", handler)
-    memory = session.service("ALMemory")
-    memory.subscribeToEvent("PeoplePerception/PeopleList", "EventHandler", "on_people_list")
+    notifier = ApproachNotifier(llm_host, client["llm_port"], client["robot_id"]) if llm_host else None
+    presence = PresenceEngine(session.service("ALMemory"), leds=leds, on_approach=notifier,
+                              approach_distance=args.approach_distance, led_hold=args.led_hold)
+    presence.start()
+    print("Abonnements actifs : présence suivie par événements, sans lecture ALMemory")
 
-    print("Abonnements actifs. Test manuel toutes les 2 secondes...")
-    
-    # Variable pour suivre l'état précédent
-    previous_people_detected = False
-    
     try:
         while True:
-            # VERIFICATION MANUELLE des données ALMemory
-            try:
-                people_list = memory.getData("PeoplePerception/PeopleList")
-                current_people_detected = bool(people_list)
-                
-                if people_list:
-                    print("*** MANUEL: Personnes détectées:", people_list)
-                    for person_id in people_list:
-                        distance = memory.getData(f"PeoplePerception/Person/{person_id}/Distance")
-                        visible = memory.getData(f"PeoplePerception/Person/{person_id}/IsVisible")
-                        print(f"  - Personne {person_id}: distance={distance:.2f}m, visible={visible}")
-                    
-                    # Changer les yeux en VERT quand quelqu'un est détecté
-                    if not previous_people_detected:
-                        leds.setIntensity("FaceLeds", 1.0)  # Intensité maximale
-                        leds.fadeRGB("FaceLeds", 0, 255, 0, 0.5)  # Vert (R=0, G=255, B=0)
-                        print("👀 YEUX VERTS - Personne détectée !")
-                        
-                else:
-                    print("*** MANUEL: Aucune personne dans PeopleList")
-                    
-                    # Changer les yeux en ROUGE quand personne n'est détecté
-                    if previous_people_detected:
-                        leds.setIntensity("FaceLeds", 1.0)
-                        leds.fadeRGB("FaceLeds", 255, 0, 0, 0.5)  # Rouge (R=255, G=0, B=0)
-                        print("👀 YEUX ROUGES - Aucune personne")
-                
-                # Mettre à jour l'état précédent
-                previous_people_detected = current_people_detected
-                        
-            except Exception as e:
-                print("Erreur lecture manuelle:", e)
-            
-            time.sleep(2)
+            time.sleep(10)
+            people = presence.snapshot()
+            print(f"*** {len(people)} personne(s) :", ", ".join(repr(person) for person in people.values()) or "aucune")
     except KeyboardInterrupt:
         # Remettre les yeux en blanc avant de quitter
-        leds.fadeRGB("FaceLeds", 255, 255, 255, 1.0)  # Blanc
-        memory.unsubscribeToEvent("PeoplePerception/PeopleList", "EventHandler")
+        presence.stop()
+        if notifier:
+            notifier.close()
+        print(f"📊 Présence : {dict(presence.stats)}, LEDs : {dict(presence.leds.stats)}")
         print("Arrêté proprement - yeux remis en blanc.")
@@ -1,34 +1,88 @@
-import qi
 import argparse
+import math
+import re
 import time
-import numpy as np
 import threading
 import socket
-import json
+
+from pepper_events import ALMemoryEventDispatcher, ALMemorySnapshot, TraceRecorder
+from endpointing import AdaptiveEndpointer, SPECULATIVE, FINAL, RETRACT
+from udp_transport import ReliableUDPTransport
+from speech_playback import SpeechPlayer
+from sound_tracker import SoundDirectionTracker
+from presence import PresenceEngine
+from tts_cache import TTSAudioCache
+from canned_replies import CANNED_REPLIES
+from pepper_config import Config
+import wire_format
 
 class VoiceToLLM(object):
-    def __init__(self, session, llm_host="127.0.0.1", llm_port=8888):
+    def __init__(self, session, llm_host="127.0.0.1", llm_port=8888, robot_id=None, use_events=True,
+                 endpointer=None, speculative=True, trace_path=None, wire_codec="binary", barge_in=True,
+                 barge_in_confidence=0.55, off_axis_deg=45.0, turn_head=False, presence=False,
+                 tts_cache_dir=None, tts_cache_mb=50, reply_port=8889):
         self.session = session
         self.memory = session.service("ALMemory")
         self.tts = session.service("ALTextToSpeech")  # AJOUTÉ pour faire parler Pepper
         self.is_running = False
 
+        # Pepper parle sans bloquer la réception ; la parole du visiteur peut l'interrompre
+        # Phrases fréquentes (marquées par le serveur) rejouées depuis l'audio déjà rendu
+        self.audio_cache = TTSAudioCache(self.tts, session.service("ALAudioPlayer"), tts_cache_dir,
+                                         max_bytes=int(tts_cache_mb * 1024 * 1024)) if tts_cache_dir else None
+        self.player = SpeechPlayer(self.tts, audio_cache=self.audio_cache)
+        if self.audio_cache:
+            self.audio_cache.busy = self.player.is_speaking
+        self.barge_in = barge_in
+        self.barge_in_confidence = barge_in_confidence
+        self.last_polled_words = None
+
+        # Direction des sons : mots venant de côté ignorés, tête tournée une fois vers le locuteur
+        self.sound_tracker = SoundDirectionTracker()
+        self.off_axis_tolerance = math.radians(off_axis_deg) if off_axis_deg else None
+        self.turn_head = turn_head
+
+        # Présence : un visiteur qui s'approche prévient le serveur avant son premier mot
+        self.presence = PresenceEngine(self.memory, leds=session.service("ALLeds"),
+                                       on_approach=self.on_visitor_approaching) if presence else None
+
         # Pour LLM
         self.llm_host = llm_host
         self.llm_port = llm_port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.robot_id = robot_id  # Identifie la session côté serveur (sinon IP)
         
         # AJOUTÉ : Socket pour recevoir les réponses LLM
+        # (sert aussi à l'envoi : accusés et réponses arrivent sur le même port)
         self.response_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.response_port = 8889
+        self.response_port = reply_port
+        self.udp = ReliableUDPTransport(self.response_sock.sendto)
+        # Le serveur répond dans le format qu'on lui envoie ("json" pour déboguer)
+        self.wire_codec = wire_codec
         
         # Prise de parole
         self.last_speech_state = 0
+        self.speech_active = False
         self.words_buffer = []
         self.recording = False
         self.speech_start_time = 0
         self.silence_timeout = 1.5
 
+        # Fin d'énoncé adaptative, mesurée depuis le dernier mot reconnu
+        self.endpointer = endpointer or AdaptiveEndpointer(max_timeout=self.silence_timeout)
+        self.speculative = speculative
+        self.speculative_pending = False
+        self.utterance_id = 0
+        self.trace_path = trace_path
+
+        # Abonnements ALMemory (le polling ne sert plus que de repli)
+        self.use_events = use_events
+        self.dispatcher = None
+        self.snapshot = None
+
+        # Réponses en fragments (une phrase par llm_response)
+        self.current_turn_id = None
+        self.last_fragment_seq = -1
+
     def start_detection(self):
         print("✅ Démarrage détection vocale + envoi LLM")
         
@@ -36,12 +90,39 @@ class VoiceToLLM(object):
         self.response_sock.bind(('0.0.0.0', self.response_port))
         
         self.is_running = True
+        self.udp.start()
+        if self.audio_cache:
+            try:
+                self.audio_cache.start()
+                # Réponses fixes du serveur rendues d'avance (seulement celles absentes du cache)
+                self.audio_cache.prerender(CANNED_REPLIES)
+            except Exception as e:
+                print(f"⚠️  Cache audio TTS indisponible : {e}")
+                self.audio_cache = self.player.audio_cache = None
+        self.player.start()
+        try:
+            # ALSoundLocalization ne publie SoundLocated que s'il a au moins un abonné
+            self.session.service("ALSoundLocalization").subscribe("VoiceToLLM")
+        except Exception as e:
+            print(f"⚠️  Localisation sonore indisponible : {e}")
         
-        # Thread monitoring vocal
-        self.monitoring_thread = threading.Thread(target=self.monitor_audio_activity)
-        self.monitoring_thread.daemon = True
-        self.monitoring_thread.start()
+        if self.use_events and self.start_event_dispatch():
+            print("⚡ Détection vocale par événements ALMemory")
+        else:
+            # Repli polling : SpeechDetected + WordRecognized en un getListData toutes les 50ms
+            self.snapshot = ALMemorySnapshot(self.memory, interval=0.05, on_tick=self.on_tick)
+            self.snapshot.watch("SpeechDetected", "WordRecognized")
+            self.snapshot.add("ALSoundLocalization/SoundLocated", self.on_sound_located)
+            self.snapshot.add_consumer(self.on_snapshot)
+            self.snapshot.start()
         
+        if self.presence:
+            try:
+                self.presence.start()
+            except Exception as e:
+                print(f"⚠️  Détection de présence indisponible : {e}")
+                self.presence = None
+
         # AJOUTÉ : Thread pour recevoir les réponses LLM
         self.response_thread = threading.Thread(target=self.receive_llm_responses)
         self.response_thread.daemon = True
@@ -49,57 +130,188 @@ class VoiceToLLM(object):
         
         print("📡 Monitoring audio + streaming LLM + réception réponses actifs...")
 
-    def monitor_audio_activity(self):
-        while self.is_running:
-            try:
-                current_time = time.time()
-                speech_detected = self.memory.getData("SpeechDetected")
-                
-                if speech_detected == 1 and not self.recording:
-                    print(f"🗣️ PAROLE DÉTECTÉE! (Timestamp: {current_time:.2f})")
-                    self.words_buffer = []
-                    self.speech_start_time = current_time
-                    self.recording = True
-
-                # Pendant la parole
-                if self.recording:
-                    word_recognized = self.memory.getData("WordRecognized")
-                    if (word_recognized and len(word_recognized) >= 2):
-                        word = word_recognized[0].strip()
-                        confidence = word_recognized[1]
-                        if word and confidence > 0.4:
-                            print(f"💬 MOT RECONNU: '{word}' (confiance: {confidence:.2f})")
-                            # Ajoute au buffer tous les NEW mots (évite répétition immédiate)
-                            if not self.words_buffer or word != self.words_buffer[-1][0]:
-                                self.words_buffer.append((word, confidence))
-
-                # Fin de parole (silence)
-                if speech_detected == 0 and self.recording:
-                    if (current_time - self.speech_start_time > self.silence_timeout):
-                        self.send_to_llm()
-                        self.recording = False
-
-                time.sleep(0.05)
-            except Exception as e:
-                print(f"❌ Erreur monitoring: {e}")
-                time.sleep(0.2)
+    def start_event_dispatch(self):
+        """Abonnements ALMemory ; False si indisponibles (repli sur le polling)"""
+        recorder = TraceRecorder(self.trace_path) if self.trace_path else None
+        self.dispatcher = ALMemoryEventDispatcher(self.memory, on_tick=self.on_tick, recorder=recorder)
+        self.dispatcher.add("SpeechDetected", self.on_speech_detected)
+        self.dispatcher.add("WordRecognized", self.on_word_recognized)
+        self.dispatcher.add("ALSoundLocalization/SoundLocated", self.on_sound_located)
+        try:
+            self.dispatcher.start()
+            return True
+        except Exception as e:
+            print(f"⚠️  Abonnements ALMemory indisponibles ({e}), repli sur le polling")
+            self.dispatcher = None
+            return False
+
+    def on_speech_detected(self, speech_detected, timestamp):
+        self.speech_active = speech_detected == 1
+        if self.speech_active and not self.recording:
+            if self.player.is_speaking(timestamp):
+                # Peut-être la voix de Pepper : on attend un mot qui n'en vient pas (on_word_recognized)
+                return
+            self.start_utterance(timestamp)
+        if self.recording and self.endpointer.on_speech(self.speech_active, timestamp) == RETRACT:
+            self.send_retract()
 
-    def send_to_llm(self):
+    def on_sound_located(self, sound_located, timestamp):
+        self.sound_tracker.add_event(sound_located, timestamp)
+
+    def face_speaker(self, timestamp):
+        """Tourne la tête vers le locuteur dominant, seulement s'il a changé"""
+        target = self.sound_tracker.turn_target(timestamp)
+        if target is None:
+            return
+        try:
+            # HeadYaw limité à ±119.5° ; setAngles n'est pas bloquant
+            self.session.service("ALMotion").setAngles("HeadYaw", max(-2.08, min(2.08, target)), 0.15)
+            print(f"↪️ Tête tournée vers {math.degrees(target):.0f}°")
+        except Exception as e:
+            print(f"⚠️  Rotation de la tête impossible : {e}")
+
+    def on_visitor_approaching(self, person, timestamp):
+        self.send_message({
+            "type": "visitor_approaching",
+            "timestamp": timestamp,
+            "person_id": person.person_id,
+            "distance": round(person.distance, 2)
+        })
+
+    def start_utterance(self, timestamp):
+        print(f"🗣️ PAROLE DÉTECTÉE! (Timestamp: {timestamp:.2f})")
+        if self.turn_head:
+            self.face_speaker(timestamp)
+        self.words_buffer = []
+        self.speech_start_time = timestamp
+        self.recording = True
+        self.utterance_id += 1
+        self.endpointer.reset()
+        self.send_message({
+            "type": "conversation_start",
+            "timestamp": timestamp,
+            "utterance_id": self.utterance_id
+        })
+
+    def is_echo(self, word):
+        """Mot présent dans ce que Pepper est en train de dire"""
+        return word.lower() in re.findall(r"\w+", self.player.current_text().lower())
+
+    def check_barge_in(self, word_recognized, timestamp):
+        """Capture coupée pendant que Pepper parle ; un mot sûr qui n'est pas un écho l'interrompt"""
+        if not word_recognized or len(word_recognized) < 2:
+            return
+        word, confidence = word_recognized[0].strip(), word_recognized[1]
+        if not self.barge_in or not word or confidence < self.barge_in_confidence or self.is_echo(word):
+            print(f"🔇 Mot ignoré pendant la parole de Pepper : '{word}' ({confidence:.2f})")
+            return
+        interrupted = self.player.interrupt()
+        print(f"✋ BARGE-IN : '{word}' ({confidence:.2f}), Pepper se tait")
+        # Le serveur arrête la génération en cours pour ce tour (sans effet s'il a fini)
+        self.send_message({
+            "type": "conversation_cancel",
+            "timestamp": timestamp,
+            "utterance_id": interrupted if interrupted is not None else self.utterance_id
+        })
+        self.start_utterance(timestamp)
+        self.endpointer.on_speech(True, timestamp)
+        self.on_word_recognized(word_recognized, timestamp)
+
+    def off_axis(self, timestamp):
+        return self.off_axis_tolerance is not None and self.sound_tracker.off_axis(
+            timestamp, tolerance=self.off_axis_tolerance)
+
+    def on_word_recognized(self, word_recognized, timestamp):
+        if word_recognized and (self.recording or self.player.is_speaking(timestamp)) and self.off_axis(timestamp):
+            # Le son dominant du moment vient de côté : bruit ou conversation voisine
+            print(f"🧭 Mot hors axe ignoré : '{word_recognized[0]}'")
+            return
+        # Pendant la parole
+        if not self.recording:
+            if self.player.is_speaking(timestamp):
+                self.check_barge_in(word_recognized, timestamp)
+            return
+        if (word_recognized and len(word_recognized) >= 2):
+            word = word_recognized[0].strip()
+            confidence = word_recognized[1]
+            if word and confidence > 0.4:
+                print(f"💬 MOT RECONNU: '{word}' (confiance: {confidence:.2f})")
+                # Ajoute au buffer tous les NEW mots (évite répétition immédiate)
+                if not self.words_buffer or word != self.words_buffer[-1][0]:
+                    self.words_buffer.append((word, confidence))
+                    # Chaque mot part tout de suite : le serveur prépare le prompt pendant la parole
+                    self.send_message({
+                        "type": "speech_chunk",
+                        "timestamp": timestamp,
+                        "words": word,
+                        "confidence": confidence,
+                        "utterance_id": self.utterance_id
+                    })
+                    if self.endpointer.on_word(word, confidence, timestamp) == RETRACT:
+                        self.send_retract()
+
+    def on_tick(self, current_time):
+        # Fin de parole (silence adaptatif)
+        if not self.recording:
+            return
+        decision = self.endpointer.update(current_time)
+        if decision == SPECULATIVE and self.speculative and self.words_buffer:
+            self.send_to_llm(speculative=True)
+        elif decision == FINAL:
+            self.send_to_llm()
+            self.recording = False
+
+    def on_snapshot(self, snapshot, current_time):
+        """Repli polling : mêmes handlers que les événements, alimentés par le snapshot"""
+        self.on_speech_detected(snapshot.get("SpeechDetected"), current_time)
+        words = snapshot.get("WordRecognized")
+        if self.recording:
+            self.on_word_recognized(words, current_time)
+        elif self.player.is_speaking(current_time) and words != self.last_polled_words:
+            # Seule une nouvelle reconnaissance peut interrompre Pepper (pas la dernière valeur lue)
+            self.on_word_recognized(words, current_time)
+        self.last_polled_words = words
+
+    def send_to_llm(self, speculative=False):
+        self.speculative_pending = speculative
         if not self.words_buffer:
             print("⏭️ Aucun mot à envoyer au LLM.")
             return
 
         # Assemble phrase à partir des mots confidence > 0.3
         phrase = " ".join([w[0] for w in self.words_buffer if w[1] > 0.4])
-        print(f"✅ PHRASE CAPTÉE : '{phrase}'")
+        print(f"✅ PHRASE CAPTÉE{' (spéculative)' if speculative else ''} : '{phrase}'")
         msg = {
             "type": "conversation_end",
             "timestamp": time.time(),
-            "conversation_text": phrase
+            "conversation_text": phrase,
+            "utterance_id": self.utterance_id
         }
+        if speculative:
+            # Le serveur peut commencer à générer ; confirmé par la fin définitive ou annulé
+            msg["speculative"] = True
+        self.send_message(msg)
+
+    def send_retract(self):
+        """La parole reprend : annule la fin spéculative déjà envoyée"""
+        if not self.speculative_pending:
+            return
+        self.speculative_pending = False
+        print(f"↩️ Reprise de parole, fin spéculative annulée (énoncé {self.utterance_id})")
+        self.send_message({
+            "type": "conversation_retract",
+            "timestamp": time.time(),
+            "utterance_id": self.utterance_id
+        })
+
+    def send_message(self, msg):
+        if self.robot_id:
+            msg["robot_id"] = self.robot_id
         try:
-            print(f"📤 Envoi UDP LLM : {self.llm_host}:{self.llm_port} -> '{phrase}'")
-            self.sock.sendto(json.dumps(msg, ensure_ascii=False).encode("utf-8"), (self.llm_host, self.llm_port))
+            print(f"📤 Envoi UDP LLM : {self.llm_host}:{self.llm_port} -> {msg['type']}")
+            # Les chunks ne servent qu'au préremplissage : inutile de les retransmettre
+            self.udp.send(wire_format.encode(msg, self.wire_codec), (self.llm_host, self.llm_port),
+                          reliable=msg['type'] != 'speech_chunk')
         except Exception as e:
             print(f"❌ Erreur envoi LLM : {e}")
 
@@ -107,44 +319,124 @@ class VoiceToLLM(object):
         """Écoute les réponses du LLM et les fait parler par Pepper"""
         while self.is_running:
             try:
-                data, addr = self.response_sock.recvfrom(4096)
-                response_data = json.loads(data.decode('utf-8'))
+                data, addr = self.response_sock.recvfrom(65535)
+                message = self.udp.on_datagram(data, addr)
+                if message is None:
+                    continue
+                response_data, _ = wire_format.decode(message)
                 
                 if response_data.get('type') == 'llm_response':
+                    if not self.accept_fragment(response_data):
+                        continue
                     llm_text = response_data.get('text', '')
                     if llm_text:
                         print(f"🧠➡️🗣️ PEPPER PARLE: {llm_text}")
-                        self.tts.say(llm_text)  # ICI PEPPER PARLE !
+                        # ICI PEPPER PARLE ! (file de lecture, interruptible)
+                        self.player.enqueue(llm_text, response_data.get('utterance_id'),
+                                            response_data.get('cache_key'))
                         
             except Exception as e:
                 print(f"❌ Erreur réception réponse LLM: {e}")
                 time.sleep(0.1)
 
+    def accept_fragment(self, response_data):
+        """Filtre les fragments en double, d'un tour précédent ou d'un énoncé dépassé"""
+        utterance_id = response_data.get('utterance_id')
+        if utterance_id is not None and utterance_id < self.utterance_id:
+            # Le visiteur a déjà reposé une question : cette réponse arrive trop tard
+            print(f"⏭️ Réponse à l'énoncé {utterance_id} ignorée (énoncé courant {self.utterance_id})")
+            return False
+        seq = response_data.get('seq')
+        if seq is None:
+            # Réponse complète (serveur non streaming)
+            return True
+        turn_id = response_data.get('turn_id')
+        if turn_id != self.current_turn_id:
+            if self.current_turn_id is not None and turn_id is not None and turn_id < self.current_turn_id:
+                print(f"⏭️ Fragment d'un ancien tour ignoré (tour {turn_id})")
+                return False
+            self.current_turn_id = turn_id
+            self.last_fragment_seq = -1
+        if seq <= self.last_fragment_seq:
+            return False
+        self.last_fragment_seq = seq
+        return True
+
     def stop_detection(self):
         self.is_running = False
-        if hasattr(self, 'monitoring_thread'):
-            self.monitoring_thread.join(timeout=2)
+        if self.dispatcher:
+            self.dispatcher.stop()
+        if self.snapshot:
+            self.snapshot.stop()
+        if self.presence:
+            self.presence.stop()
         if hasattr(self, 'response_thread'):
             self.response_thread.join(timeout=2)
-        self.sock.close()
+        self.player.stop()
+        print(f"🔊 Lecture TTS : {dict(self.player.stats)}")
+        if self.audio_cache:
+            self.audio_cache.stop()
+            print(f"🔊 Cache audio TTS : {self.audio_cache.report()}")
+        try:
+            self.session.service("ALSoundLocalization").unsubscribe("VoiceToLLM")
+        except Exception:
+            pass
+        self.udp.stop()
         self.response_sock.close()
         print("🛑 Détection et streaming arrêtés")
 
 if __name__ == "__main__":
+    # Adresses et ports : ligne de commande, sinon section "client" de la config partagée (pepper_config.py)
     parser = argparse.ArgumentParser()
-    parser.add_argument("--ip", type=str, required=True)
-    parser.add_argument("--port", type=int, default=9559)
-    parser.add_argument("--llm_host", default="127.0.0.1")
-    parser.add_argument("--llm_port", type=int, default=8888)
+    parser.add_argument("--config", default=None, help="Fichier de config JSON (défaut : $PEPPER_CONFIG)")
+    parser.add_argument("--ip", type=str, default=None, help="Adresse du robot (config : client.robot_ip)")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--llm_host", default=None)
+    parser.add_argument("--llm_port", type=int, default=None)
+    parser.add_argument("--reply_port", type=int, default=None, help="Port local d'envoi et de réception des réponses")
+    parser.add_argument("--robot_id", default=None)
+    parser.add_argument("--polling", action="store_true", help="Force le polling ALMemory (sans abonnements)")
+    parser.add_argument("--no_speculative", action="store_true", help="N'envoie que des fins d'énoncé définitives")
+    parser.add_argument("--record_trace", default=None,
+                        help="Enregistre les événements ALMemory (JSON lines) pour replay_endpointing.py")
+    parser.add_argument("--wire", choices=wire_format.CODECS, default=None,
+                        help="Format des datagrammes (json pour déboguer)")
+    parser.add_argument("--off_axis_deg", type=float, default=45.0,
+                        help="Mots ignorés si le son dominant vient de plus loin que cet angle (0 : désactivé)")
+    parser.add_argument("--turn_head", action="store_true", help="Tourne la tête vers le locuteur en début d'énoncé")
+    parser.add_argument("--presence", action="store_true",
+                        help="Suit les visiteurs (ALPeoplePerception) et préchauffe le serveur à leur approche")
+    parser.add_argument("--tts_cache_dir", default=None,
+                        help="Audio pré-rendu des phrases fréquentes : dossier absolu sur le robot, "
+                             "par ex. /home/nao/.cache/pepper_tts (défaut : désactivé)")
+    parser.add_argument("--tts_cache_mb", type=float, default=50.0, help="Budget disque du cache audio (Mo)")
+    parser.add_argument("--no_barge_in", action="store_true", help="Pepper finit toujours sa phrase")
+    parser.add_argument("--barge_in_confidence", type=float, default=0.55,
+                        help="Confiance minimale d'un mot pour couper la parole à Pepper")
     args = parser.parse_args()
+    config = Config.load(args.config).override("client", robot_ip=args.ip, robot_port=args.port,
+                                               llm_host=args.llm_host, llm_port=args.llm_port,
+                                               reply_port=args.reply_port, robot_id=args.robot_id, wire=args.wire)
+    client = config.section("client")
+    if not client["robot_ip"]:
+        parser.error("adresse du robot requise : --ip ou client.robot_ip dans la config")
+
+    import qi
 
-    connection_url = f"tcp://{args.ip}:{args.port}"
+    connection_url = f"tcp://{client['robot_ip']}:{client['robot_port']}"
     app = qi.Application(['VoiceToLLM', '--qi-url=' + connection_url])
     app.start()
     session = app.session
 
     print("🤖 Détecteur vocal + Streaming LLM événementiel")
-    detector = VoiceToLLM(session, llm_host=args.llm_host, llm_port=args.llm_port)
+    detector = VoiceToLLM(session, llm_host=client["llm_host"], llm_port=client["llm_port"],
+                          robot_id=client["robot_id"], use_events=not args.polling,
+                          speculative=not args.no_speculative, trace_path=args.record_trace,
+                          wire_codec=client["wire"], barge_in=not args.no_barge_in,
+                          barge_in_confidence=args.barge_in_confidence, off_axis_deg=args.off_axis_deg,
+                          turn_head=args.turn_head, presence=args.presence,
+                          tts_cache_dir=args.tts_cache_dir or None, tts_cache_mb=args.tts_cache_mb,
+                          reply_port=client["reply_port"])
     try:
         detector.start_detection()
         print("\n🎤 Parlez à Pepper, le LLM répondra dès la fin !")
@@ -1,117 +1,139 @@
-import qi
 import argparse
+import math
 import time
-import numpy as np
-import threading
+
+from pepper_events import ALMemoryEventDispatcher, ALMemorySnapshot
+from sound_tracker import SoundDirectionTracker, angle_diff
 
 class WorkingVoiceDetector(object):
-    def __init__(self, session):
+    def __init__(self, session, use_events=True, poll_interval=0.05):
         self.session = session
         self.memory = session.service("ALMemory")
         self.is_running = False
         
         # État de détection
-        self.last_sound_time = 0
+        self.sound_tracker = SoundDirectionTracker()
+        self.last_speaker = None
         self.last_speech_state = 0
         self.last_emotion_data = None
         self.sound_activity_count = 0
 
+        # Abonnements ALMemory (le polling ne sert plus que de repli)
+        self.use_events = use_events
+        self.dispatcher = None
+        self.poll_interval = poll_interval
+        self.snapshot = None
+
     def start_detection(self):
         """Démarre la détection avec les vraies clés ALMemory"""
         try:
             print("✅ Démarrage détection vocale avec données réelles")
             
             self.is_running = True
-            self.monitoring_thread = threading.Thread(target=self.monitor_audio_activity)
-            self.monitoring_thread.daemon = True
-            self.monitoring_thread.start()
+            if self.use_events and self.start_event_dispatch():
+                print("⚡ Détection par événements ALMemory")
+            else:
+                self.start_polling()
             
             print("📡 Monitoring audio actif...")
             
         except Exception as e:
             print(f"❌ Erreur démarrage: {e}")
 
-    def monitor_audio_activity(self):
-        """Surveille l'activité audio en temps réel"""
-        while self.is_running:
-            try:
-                current_time = time.time()
-                
-                # 1. Vérifier la détection de parole
-                speech_detected = self.memory.getData("SpeechDetected")
-                if speech_detected != self.last_speech_state:
-                    if speech_detected == 1:
-                        print(f"🗣️  PAROLE DÉTECTÉE! (Timestamp: {current_time:.2f})")
-                    else:
-                        print(f"🔇 Fin de parole détectée")
-                    self.last_speech_state = speech_detected
-                
-                # 2. Analyser la localisation sonore
-                sound_located = self.memory.getData("ALSoundLocalization/SoundLocated")
-                if sound_located and len(sound_located) >= 2:
-                    timestamp = sound_located[0]  # [frame, time_us]
-                    position = sound_located[1]   # [x, y, z, confidence]
-                    
-                    if len(position) >= 4:
-                        x, y, z, confidence = position[:4]
-                        
-                        # Nouveau son détecté si timestamp différent
-                        if timestamp != self.last_sound_time and confidence > 0.3:
-                            self.last_sound_time = timestamp
-                            self.sound_activity_count += 1
-                            
-                            # Calculer direction approximative
-                            angle = np.arctan2(y, x) * 180 / np.pi
-                            distance = np.sqrt(x*x + y*y + z*z)
-                            
-                            print(f"🎵 SON LOCALISÉ: Angle={angle:.1f}°, Distance={distance:.2f}m, Conf={confidence:.2f}")
-                
-                # 3. Analyser les émotions vocales
-                emotion_data = self.memory.getData("ALVoiceEmotionAnalysis/EmotionRecognized")
-                if emotion_data != self.last_emotion_data and emotion_data:
-                    if len(emotion_data) >= 2:
-                        emotion_values = emotion_data[1]  # Liste des valeurs émotionnelles
-                        if emotion_values and max(emotion_values) > 0:
-                            emotions = ["Neutre", "Joie", "Colère", "Surprise", "Tristesse"]
-                            max_emotion_idx = emotion_values.index(max(emotion_values))
-                            max_emotion = emotions[max_emotion_idx] if max_emotion_idx < len(emotions) else "Inconnue"
-                            confidence_emo = max(emotion_values)
-                            
-                            print(f"😊 ÉMOTION DÉTECTÉE: {max_emotion} (intensité: {confidence_emo})")
-                    
-                    self.last_emotion_data = emotion_data
-                
-                # 4. Vérifier la reconnaissance de mots
-                word_recognized = self.memory.getData("WordRecognized")
-                if word_recognized and len(word_recognized) >= 2:
-                    word = word_recognized[0]
-                    confidence = word_recognized[1]
+    def start_event_dispatch(self):
+        """Abonnements ALMemory ; False si indisponibles (repli sur le polling)"""
+        self.dispatcher = ALMemoryEventDispatcher(self.memory, tick_interval=1.0)
+        self.dispatcher.add("SpeechDetected", self.on_speech_detected)
+        self.dispatcher.add("ALSoundLocalization/SoundLocated", self.on_sound_located)
+        self.dispatcher.add("ALVoiceEmotionAnalysis/EmotionRecognized", self.on_emotion_recognized)
+        self.dispatcher.add("WordRecognized", self.on_word_recognized)
+        try:
+            self.dispatcher.start()
+            return True
+        except Exception as e:
+            print(f"⚠️  Abonnements ALMemory indisponibles ({e}), repli sur le polling")
+            self.dispatcher = None
+            return False
+
+    def on_speech_detected(self, speech_detected, current_time):
+        """1. Vérifier la détection de parole"""
+        if speech_detected != self.last_speech_state:
+            if speech_detected == 1:
+                print(f"🗣️  PAROLE DÉTECTÉE! (Timestamp: {current_time:.2f})")
+            else:
+                print(f"🔇 Fin de parole détectée")
+            self.last_speech_state = speech_detected
+
+    def on_sound_located(self, sound_located, current_time):
+        """2. Analyser la localisation sonore"""
+        # [[sec, usec], [azimut, élévation, confiance, énergie], tête/torse, tête/robot]
+        if not self.sound_tracker.add_event(sound_located, current_time):
+            return
+        self.sound_activity_count += 1
+
+        # Locuteur dominant sur la fenêtre glissante : affiché quand il change, pas à chaque son
+        speaker = self.sound_tracker.dominant(current_time)
+        if speaker and (self.last_speaker is None
+                        or abs(angle_diff(speaker.azimuth, self.last_speaker)) > self.sound_tracker.cluster_width):
+            self.last_speaker = speaker.azimuth
+            print(f"🎵 LOCUTEUR DOMINANT: Azimut={math.degrees(speaker.azimuth):.1f}°, "
+                  f"Conf={speaker.confidence:.2f}, Part={speaker.share:.0%} ({speaker.samples} sons)")
+
+        # Debug périodique
+        if self.sound_activity_count % 50 == 0:
+            print(f"📊 Activité totale: {self.sound_activity_count} sons détectés")
+
+    def on_emotion_recognized(self, emotion_data, current_time):
+        """3. Analyser les émotions vocales"""
+        if emotion_data != self.last_emotion_data and emotion_data:
+            if len(emotion_data) >= 2:
+                emotion_values = emotion_data[1]  # Liste des valeurs émotionnelles
+                if emotion_values and max(emotion_values) > 0:
+                    emotions = ["Neutre", "Joie", "Colère", "Surprise", "Tristesse"]
+                    max_emotion_idx = emotion_values.index(max(emotion_values))
+                    max_emotion = emotions[max_emotion_idx] if max_emotion_idx < len(emotions) else "Inconnue"
+                    confidence_emo = max(emotion_values)
                     
-                    if word and word != '' and confidence > 0.3:
-                        print(f"💬 MOT RECONNU: '{word}' (confiance: {confidence:.2f})")
-                
-                # Debug périodique
-                if self.sound_activity_count % 50 == 0 and self.sound_activity_count > 0:
-                    print(f"📊 Activité totale: {self.sound_activity_count} sons détectés")
-                
-                time.sleep(0.05)  # 50ms entre vérifications
-                
-            except Exception as e:
-                print(f"❌ Erreur monitoring: {e}")
-                time.sleep(0.2)
+                    print(f"😊 ÉMOTION DÉTECTÉE: {max_emotion} (intensité: {confidence_emo})")
+            
+            self.last_emotion_data = emotion_data
+
+    def on_word_recognized(self, word_recognized, current_time):
+        """4. Vérifier la reconnaissance de mots"""
+        if word_recognized and len(word_recognized) >= 2:
+            word = word_recognized[0]
+            confidence = word_recognized[1]
+            
+            if word and word != '' and confidence > 0.3:
+                print(f"💬 MOT RECONNU: '{word}' (confiance: {confidence:.2f})")
+
+    def start_polling(self):
+        """Repli polling : les quatre clés en un seul getListData toutes les 50ms"""
+        self.snapshot = ALMemorySnapshot(self.memory, interval=self.poll_interval)
+        self.snapshot.add("SpeechDetected", self.on_speech_detected)
+        self.snapshot.add("ALSoundLocalization/SoundLocated", self.on_sound_located)
+        self.snapshot.add("ALVoiceEmotionAnalysis/EmotionRecognized", self.on_emotion_recognized)
+        self.snapshot.add("WordRecognized", self.on_word_recognized)
+        self.snapshot.start()
 
     def stop_detection(self):
         self.is_running = False
-        if hasattr(self, 'monitoring_thread'):
-            self.monitoring_thread.join(timeout=2)
+        if self.dispatcher:
+            self.dispatcher.stop()
+        if self.snapshot:
+            self.snapshot.stop()
         print("🛑 Détection vocale arrêtée")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--ip", type=str, required=True)
     parser.add_argument("--port", type=int, default=9559)
+    parser.add_argument("--polling", action="store_true", help="Force le polling ALMemory (sans abonnements)")
+    parser.add_argument("--poll_interval", type=float, default=0.05, help="Période du polling (s)")
     args = parser.parse_args()
 
+    import qi
+
     # Connexion à Pepper
     connection_url = f"tcp://{args.ip}:{args.port}"
     app = qi.Application(['WorkingVoiceDetector', '--qi-url=' + connection_url])
@@ -125,7 +147,7 @@ if __name__ == "__main__":
     print("   ✅ Reconnaissance de mots")
     
     # Création du détecteur
-    voice_detector = WorkingVoiceDetector(session)
+    voice_detector = WorkingVoiceDetector(session, use_events=not args.polling, poll_interval=args.poll_interval)
     
     try:
         voice_detector.start_detection()
@@ -2,8 +2,14 @@ import socket
 import json
 import time
 
-server_ip = '192.168.1.17'  # ← IP de la machine où tourne gemma2_server.py
-port = 8888
+from pepper_config import Config
+from udp_transport import ReliableUDPTransport
+
+# Machine où tourne gemma2_server.py : client.llm_host / client.llm_port de la config
+# ($PEPPER_CONFIG, ou PEPPER_CLIENT_LLM_HOST=192.168.1.17 python testping.py)
+config = Config.load()
+server_ip = config.get("client", "llm_host")
+port = config.get("client", "llm_port")
 
 msg = {
     "type": "conversation_end",
@@ -12,5 +18,10 @@ msg = {
 }
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.sendto(json.dumps(msg, ensure_ascii=False).encode('utf-8'), (server_ip, port))
-print("✅ Message envoyé à gemma2_server.py")
+sock.settimeout(0.1)
+udp = ReliableUDPTransport(sock.sendto)
+udp.send(json.dumps(msg, ensure_ascii=False).encode('utf-8'), (server_ip, port))
+if udp.flush(lambda: sock.recvfrom(65535)):
+    print("✅ Message envoyé à gemma2_server.py (accusé reçu)")
+else:
+    print("⚠️  Message envoyé, mais aucun accusé de gemma2_server.py")
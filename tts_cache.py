@@ -0,0 +1,250 @@
+"""Cache audio TTS sur le robot : phrases déjà synthétisées rejouées par ALAudioPlayer.
+
+Le serveur marque d'une cache_key (text_key) les phrases qui reviennent :
+réponses de secours, attente, réponses servies par son cache. Le client
+cherche cette clé, complétée de la signature de la voix (langue, voix,
+vitesse, hauteur) ; un hit part directement en ALAudioPlayer.playFile, sans
+synthèse. Un miss est dit normalement par ALTextToSpeech.say puis rendu en
+tâche de fond (sayToFile) pour la fois suivante.
+
+Fichiers dans directory, index JSON à côté : éviction LRU dès que la taille
+totale dépasse max_bytes. Les fichiers sont écrits et lus par NAOqi : le
+client doit tourner sur le robot : directory est un chemin du robot, pris tel
+quel (pas de ~). Le cache se désactive au premier rendu en échec ou introuvable.
+"""
+import collections
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import unicodedata
+
+
+def normalize_speech(text):
+    """Forme canonique d'une phrase à dire : NFC, espaces réduits (ponctuation gardée, elle change l'intonation)"""
+    return " ".join(unicodedata.normalize('NFC', text).split())
+
+
+def text_key(text):
+    return hashlib.sha1(normalize_speech(text).encode('utf-8')).hexdigest()[:16]
+
+
+class TTSAudioCache(object):
+    def __init__(self, tts, audio_player, directory, max_bytes=50 * 1024 * 1024, busy=None):
+        self.tts = tts
+        self.audio_player = audio_player
+        # Chemin côté robot (sayToFile l'écrit là-bas) : pas d'expanduser local
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # busy() -> True tant que le robot parle : le rendu attend (une seule synthèse à la fois)
+        self.busy = busy
+        self.index_path = os.path.join(self.directory, "index.json")
+
+        # clé -> {'path', 'bytes', 'render_ms', 'text'}, du moins au plus récemment utilisé
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.enabled = True
+        self.voice = "default"
+
+        self.renders = queue.Queue()
+        self.pending = set()
+        self.is_running = False
+        self.stats = collections.Counter()
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.voice = self.voice_signature()
+        self.load()
+        self.is_running = True
+        self.thread = threading.Thread(target=self.render_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.is_running = False
+        self.renders.put(None)
+        if hasattr(self, 'thread'):
+            self.thread.join(timeout=5)
+        self.save()
+
+    def voice_signature(self):
+        """Langue, voix et réglages courants : un changement de voix invalide l'audio rendu"""
+        settings = []
+        for getter, args in (("getLanguage", ()), ("getVoice", ()), ("getParameter", ("speed",)),
+                             ("getParameter", ("pitchShift",))):
+            try:
+                settings.append(str(getattr(self.tts, getter)(*args)))
+            except Exception:
+                settings.append("-")
+        return hashlib.sha1("|".join(settings).encode('utf-8')).hexdigest()[:8]
+
+    def entry_key(self, cache_key):
+        return f"{cache_key}-{self.voice}"
+
+    # --- Lecture ---
+
+    def play(self, cache_key):
+        """Future de lecture du fichier en cache, ou None (miss : à dire par la TTS)"""
+        if not self.enabled or not cache_key:
+            return None
+        key = self.entry_key(cache_key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None or not os.path.exists(entry['path']):
+            self.stats["misses"] += 1
+            if entry is not None:
+                self.forget(key)
+            return None
+        try:
+            future = self.audio_player.playFile(entry['path'], _async=True)
+        except Exception as e:
+            print(f"⚠️  Lecture audio en cache impossible : {e}")
+            self.stats["errors"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.stats["saved_ms"] += entry['render_ms']
+        return future
+
+    def stop_playback(self):
+        try:
+            self.audio_player.stopAll()
+        except Exception as e:
+            print(f"⚠️  stopAll ALAudioPlayer : {e}")
+
+    # --- Rendu ---
+
+    def render_later(self, cache_key, text):
+        """Programme le rendu d'une phrase absente du cache (fil de rendu, après la phrase en cours)"""
+        if not self.enabled or not cache_key:
+            return
+        key = self.entry_key(cache_key)
+        with self.lock:
+            if key in self.entries or key in self.pending:
+                return
+            self.pending.add(key)
+        self.renders.put((key, text))
+
+    def prerender(self, texts):
+        for text in texts:
+            self.render_later(text_key(text), text)
+
+    def render_loop(self):
+        while self.is_running:
+            item = self.renders.get()
+            if item is None:
+                return
+            key, text = item
+            if not self.enabled:
+                # Cache désactivé : les rendus encore en file sont abandonnés
+                with self.lock:
+                    self.pending.discard(key)
+                continue
+            while self.busy and self.busy() and self.is_running:
+                time.sleep(0.1)
+            try:
+                self.render(key, text)
+            except Exception as e:
+                print(f"⚠️  Rendu audio impossible ({text[:30]}…) : {e}")
+                self.stats["errors"] += 1
+            finally:
+                with self.lock:
+                    self.pending.discard(key)
+
+    def render(self, key, text):
+        path = os.path.join(self.directory, f"{key}.wav")
+        start = time.perf_counter()
+        try:
+            self.tts.sayToFile(text, path)
+        except Exception as e:
+            # Chemin non inscriptible sur le robot : inutile d'occuper la TTS à chaque phrase
+            print(f"⚠️  sayToFile({path}) impossible : cache audio TTS désactivé ({e})")
+            self.stats["errors"] += 1
+            self.enabled = False
+            return
+        render_ms = (time.perf_counter() - start) * 1000
+        if not os.path.exists(path):
+            # Client hors du robot : NAOqi a écrit le fichier sur le robot, pas ici
+            print(f"⚠️  {path} introuvable : cache audio TTS désactivé (le client doit tourner sur le robot)")
+            self.enabled = False
+            return
+        size = os.path.getsize(path)
+        with self.lock:
+            self.entries[key] = {'path': path, 'bytes': size, 'render_ms': render_ms, 'text': text}
+            self.total_bytes += size
+            evicted = self.evict()
+        self.stats["rendered"] += 1
+        self.stats["evicted"] += len(evicted)
+        for old_path in evicted:
+            self.remove_file(old_path)
+
+    def evict(self):
+        """Retire les entrées les moins récentes au-delà du budget ; renvoie leurs fichiers (sous verrou)"""
+        evicted = []
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry['bytes']
+            evicted.append(entry['path'])
+        return evicted
+
+    def forget(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry['bytes']
+
+    def remove_file(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # --- Persistance ---
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Index du cache audio illisible ({self.index_path}): {e}")
+            return
+        with self.lock:
+            for key, entry in data:
+                if os.path.exists(entry['path']):
+                    self.entries[key] = entry
+                    self.total_bytes += entry['bytes']
+            evicted = self.evict()
+        for old_path in evicted:
+            self.remove_file(old_path)
+        print(f"🔊 Cache audio TTS chargé : {len(self.entries)} phrases, {self.total_bytes / 1e6:.1f} Mo")
+
+    def save(self):
+        with self.lock:
+            data = list(self.entries.items())
+        tmp_path = f"{self.index_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"❌ Sauvegarde de l'index audio impossible: {e}")
+
+    def report(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            'size': len(self.entries),
+            'megabytes': round(self.total_bytes / 1e6, 2),
+            'hits': self.stats["hits"],
+            'misses': self.stats["misses"],
+            'hit_rate': round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            'saved_ms': round(self.stats["saved_ms"]),
+            'rendered': self.stats["rendered"],
+            'evicted': self.stats["evicted"],
+        }
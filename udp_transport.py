@@ -0,0 +1,199 @@
+import collections
+import struct
+import threading
+import time
+
+# magic, version, flags, msg_id, index du fragment, nombre de fragments
+HEADER = struct.Struct("!2sBBIHH")
+MAGIC = b"PT"
+VERSION = 1
+
+FLAG_DATA = 0x01
+FLAG_ACK = 0x02
+FLAG_NOACK = 0x04  # message non fiable : pas d'accusé, pas de retransmission
+
+
+class ReliableUDPTransport(object):
+    """Couche de transport UDP partagée par le serveur et les clients Pepper.
+
+    Chaque message reçoit un identifiant, est découpé en fragments de
+    max_fragment octets, acquitté sélectivement (bitmap des fragments reçus)
+    et retransmis au plus max_retries fois. Les doublons sont filtrés côté
+    réception. Un datagramme sans en-tête (JSON brut) est livré tel quel,
+    pour rester compatible avec les anciens clients.
+
+    sendto(data, addr) est la fonction d'envoi (socket.sendto ou transport asyncio).
+    """
+
+    def __init__(self, sendto, max_fragment=1200, retransmit_interval=0.15, max_retries=5,
+                 reassembly_timeout=5.0, dedup_window=1024):
+        self.sendto = sendto
+        self.max_fragment = max_fragment
+        self.retransmit_interval = retransmit_interval
+        self.max_retries = max_retries
+        self.reassembly_timeout = reassembly_timeout
+
+        self.lock = threading.Lock()
+        # Démarre à l'horodatage : pas de collision avec la fenêtre anti-doublons après un redémarrage
+        self.next_id = int(time.time() * 1000) & 0xFFFFFFFF
+        self.pending = {}
+        self.partial = {}
+        self.completed = collections.OrderedDict()
+        self.dedup_window = dedup_window
+        self.is_running = False
+
+        self.stats = collections.Counter()
+
+    # --- Envoi ---
+
+    def send(self, payload, addr, reliable=True):
+        with self.lock:
+            msg_id = self.next_id
+            self.next_id = (self.next_id + 1) & 0xFFFFFFFF
+
+        chunks = [payload[i:i + self.max_fragment] for i in range(0, len(payload), self.max_fragment)] or [b""]
+        if len(chunks) > 0xFFFF:
+            raise ValueError(f"Message trop long: {len(payload)} octets")
+        flags = FLAG_DATA if reliable else FLAG_DATA | FLAG_NOACK
+        fragments = [HEADER.pack(MAGIC, VERSION, flags, msg_id, index, len(chunks)) + chunk
+                     for index, chunk in enumerate(chunks)]
+
+        if reliable:
+            with self.lock:
+                self.pending[msg_id] = {
+                    'addr': addr,
+                    'fragments': fragments,
+                    'acked': set(),
+                    'attempts': 1,
+                    'next_retry': time.time() + self.retransmit_interval,
+                }
+        for fragment in fragments:
+            self.sendto(fragment, addr)
+        self.stats['sent'] += 1
+        self.stats['fragments_sent'] += len(fragments)
+        return msg_id
+
+    def poll_retransmits(self, now=None):
+        """Renvoie les fragments non acquittés ; à appeler régulièrement"""
+        now = now or time.time()
+        resend = []
+        with self.lock:
+            for msg_id, entry in list(self.pending.items()):
+                if now < entry['next_retry']:
+                    continue
+                if entry['attempts'] > self.max_retries:
+                    del self.pending[msg_id]
+                    self.stats['dropped'] += 1
+                    continue
+                entry['attempts'] += 1
+                # Backoff linéaire : laisse respirer un Wi-Fi congestionné
+                entry['next_retry'] = now + self.retransmit_interval * entry['attempts']
+                for index, fragment in enumerate(entry['fragments']):
+                    if index not in entry['acked']:
+                        resend.append((fragment, entry['addr']))
+        for fragment, addr in resend:
+            self.sendto(fragment, addr)
+        self.stats['retransmits'] += len(resend)
+
+    def unacked(self):
+        with self.lock:
+            return len(self.pending)
+
+    def flush(self, receive, timeout=2.0):
+        """Attend les accusés des messages en cours ; receive() lit un datagramme (ou lève un timeout)"""
+        deadline = time.time() + timeout
+        while self.unacked() and time.time() < deadline:
+            try:
+                data, addr = receive()
+                self.on_datagram(data, addr)
+            except OSError:
+                pass
+            self.poll_retransmits()
+        return self.unacked() == 0
+
+    # --- Réception ---
+
+    def on_datagram(self, data, addr):
+        """Traite un datagramme ; renvoie le message complet (bytes) ou None"""
+        if len(data) < HEADER.size or data[:2] != MAGIC:
+            self.stats['legacy'] += 1
+            return data
+
+        _, version, flags, msg_id, index, count = HEADER.unpack_from(data)
+        body = data[HEADER.size:]
+
+        if flags & FLAG_ACK:
+            self.handle_ack(msg_id, body)
+            return None
+
+        key = (addr, msg_id)
+        now = time.time()
+        with self.lock:
+            if key in self.completed:
+                self.stats['duplicates'] += 1
+                message = None
+                received = range(count)
+            else:
+                entry = self.partial.get(key)
+                if entry is None:
+                    entry = self.partial[key] = {'count': count, 'fragments': {}, 'first_seen': now}
+                entry['fragments'][index] = body
+                received = entry['fragments'].keys()
+                message = None
+                if len(entry['fragments']) == count:
+                    del self.partial[key]
+                    self.completed[key] = now
+                    while len(self.completed) > self.dedup_window:
+                        self.completed.popitem(last=False)
+                    message = b"".join(entry['fragments'][i] for i in range(count))
+            self.expire_partial(now)
+
+        if not flags & FLAG_NOACK:
+            self.send_ack(msg_id, count, received, addr)
+        if message is not None:
+            self.stats['received'] += 1
+        return message
+
+    def expire_partial(self, now):
+        # Appelé sous self.lock
+        for key, entry in list(self.partial.items()):
+            if now - entry['first_seen'] > self.reassembly_timeout:
+                del self.partial[key]
+                self.stats['expired'] += 1
+
+    def send_ack(self, msg_id, count, received, addr):
+        bitmap = bytearray((count + 7) // 8)
+        for index in received:
+            bitmap[index // 8] |= 1 << (index % 8)
+        self.sendto(HEADER.pack(MAGIC, VERSION, FLAG_ACK, msg_id, 0, count) + bytes(bitmap), addr)
+
+    def handle_ack(self, msg_id, bitmap):
+        with self.lock:
+            entry = self.pending.get(msg_id)
+            if entry is None:
+                return
+            for index in range(len(entry['fragments'])):
+                if index // 8 < len(bitmap) and bitmap[index // 8] & (1 << (index % 8)):
+                    entry['acked'].add(index)
+            if len(entry['acked']) == len(entry['fragments']):
+                del self.pending[msg_id]
+                self.stats['acked'] += 1
+
+    # --- Thread de retransmission (mode socket bloquante) ---
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self.retransmit_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def retransmit_loop(self):
+        while self.is_running:
+            time.sleep(self.retransmit_interval / 3)
+            try:
+                self.poll_retransmits()
+            except OSError as e:
+                print(f"❌ Erreur retransmission: {e}")
+
+    def stop(self):
+        self.is_running = False
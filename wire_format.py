@@ -0,0 +1,175 @@
+"""Encodage des messages UDP serveur <-> Pepper.
+
+"json"    : lisible, pour le débogage (format historique)
+"binary"  : en-tête struct fixe + textes UTF-8, pour les messages du protocole vocal
+"msgpack" : si le module msgpack est installé
+
+Le format est reconnu au premier octet : un serveur répond à chaque robot
+dans le format que ce robot utilise (négociation implicite). Un message que
+le format binaire ne sait pas représenter part en JSON, avec "wire": "binary" :
+le serveur ne rétrograde pas ses réponses en JSON pour autant.
+"""
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+BINARY_MAGIC = 0xC1  # octet jamais utilisé par msgpack, jamais en tête d'un JSON
+
+# magic, type, flags, timestamp, turn_id, utterance_id, seq, confidence
+BINARY_HEADER = struct.Struct("!BBBdQIIf")
+
+# Nouveaux types ajoutés en fin de tuple : les codes existants ne changent pas
+MESSAGE_TYPES = ("conversation_start", "speech_chunk", "conversation_end", "conversation_retract", "llm_response",
+                 "conversation_cancel", "visitor_approaching")
+TYPE_CODES = {name: code for code, name in enumerate(MESSAGE_TYPES)}
+# Champ texte principal de chaque type
+TEXT_FIELDS = {
+    "conversation_start": None,
+    "speech_chunk": "words",
+    "conversation_end": "conversation_text",
+    "conversation_retract": None,
+    "llm_response": "text",
+    "conversation_cancel": None,
+    "visitor_approaching": None,
+}
+
+FLAG_SPECULATIVE = 0x01
+FLAG_FINAL = 0x02
+FLAG_SEQ = 0x04  # turn_id / seq / final présents
+FLAG_UTTERANCE = 0x08
+FLAG_CONFIDENCE = 0x10
+FLAG_CACHE_KEY = 0x20  # clé d'audio pré-rendu, chaîne courte après model
+
+BINARY_FIELDS = {"type", "timestamp", "turn_id", "seq", "final", "utterance_id", "confidence",
+                 "speculative", "robot_id", "model", "cache_key"}
+
+CODECS = ["json", "binary"] + (["msgpack"] if msgpack else [])
+
+
+def encode(msg, codec="json"):
+    if codec == "binary":
+        data = encode_binary(msg)
+        if data is not None:
+            return data
+        # Repli JSON ponctuel : le format du robot reste annoncé
+        msg = dict(msg, wire="binary")
+    elif codec == "msgpack" and msgpack is not None:
+        return msgpack.packb(msg, use_bin_type=True)
+    return json.dumps(msg, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def peer_codec(message, codec):
+    """Format de réponse annoncé par un message reçu ; None si ce message n'en dit rien (JSON simple)"""
+    if codec != "json":
+        return codec
+    advertised = message.get("wire") if isinstance(message, dict) else None
+    return advertised if advertised in CODECS else None
+
+
+def detect(data):
+    if not data:
+        return "json"
+    first = data[0]
+    if first == BINARY_MAGIC:
+        return "binary"
+    if 0x80 <= first <= 0x8f or first in (0xde, 0xdf):
+        return "msgpack"
+    return "json"
+
+
+def decode(data):
+    """Renvoie (message, codec)"""
+    codec = detect(data)
+    if codec == "binary":
+        return decode_binary(data), codec
+    if codec == "msgpack":
+        if msgpack is None:
+            raise ValueError("Message msgpack reçu mais msgpack n'est pas installé")
+        return msgpack.unpackb(data, raw=False), codec
+    return json.loads(data.decode('utf-8')), codec
+
+
+def _short_string(value):
+    raw = (value or "").encode('utf-8')
+    if len(raw) > 255:
+        raise ValueError("Chaîne trop longue pour le format binaire")
+    return bytes((len(raw),)) + raw
+
+
+def encode_binary(msg):
+    """Encodage binaire, ou None si le message sort du format (repli JSON)"""
+    msg_type = msg.get("type")
+    if msg_type not in TYPE_CODES:
+        return None
+    text_field = TEXT_FIELDS[msg_type]
+    if any(key not in BINARY_FIELDS and key != text_field for key in msg):
+        return None
+
+    flags = 0
+    if msg.get("speculative"):
+        flags |= FLAG_SPECULATIVE
+    if msg.get("seq") is not None:
+        flags |= FLAG_SEQ
+        if msg.get("final"):
+            flags |= FLAG_FINAL
+    if msg.get("utterance_id") is not None:
+        flags |= FLAG_UTTERANCE
+    if msg.get("confidence") is not None:
+        flags |= FLAG_CONFIDENCE
+    if msg.get("cache_key"):
+        flags |= FLAG_CACHE_KEY
+
+    try:
+        header = BINARY_HEADER.pack(BINARY_MAGIC, TYPE_CODES[msg_type], flags, msg.get("timestamp") or 0.0,
+                                    msg.get("turn_id") or 0, msg.get("utterance_id") or 0,
+                                    msg.get("seq") or 0, msg.get("confidence") or 0.0)
+        strings = _short_string(msg.get("robot_id")) + _short_string(msg.get("model"))
+        if flags & FLAG_CACHE_KEY:
+            strings += _short_string(msg["cache_key"])
+    except (struct.error, ValueError, TypeError):
+        return None
+    text = (msg.get(text_field) or "") if text_field else ""
+    return header + strings + text.encode('utf-8')
+
+
+def decode_binary(data):
+    _, type_code, flags, timestamp, turn_id, utterance_id, seq, confidence = BINARY_HEADER.unpack_from(data)
+    offset = BINARY_HEADER.size
+    robot_length = data[offset]
+    robot_id = data[offset + 1:offset + 1 + robot_length].decode('utf-8')
+    offset += 1 + robot_length
+    model_length = data[offset]
+    model = data[offset + 1:offset + 1 + model_length].decode('utf-8')
+    offset += 1 + model_length
+    cache_key = None
+    if flags & FLAG_CACHE_KEY:
+        key_length = data[offset]
+        cache_key = data[offset + 1:offset + 1 + key_length].decode('utf-8')
+        offset += 1 + key_length
+
+    msg_type = MESSAGE_TYPES[type_code]
+    msg = {"type": msg_type, "timestamp": timestamp}
+    text_field = TEXT_FIELDS[msg_type]
+    if text_field:
+        msg[text_field] = data[offset:].decode('utf-8')
+    if flags & FLAG_UTTERANCE:
+        msg["utterance_id"] = utterance_id
+    if flags & FLAG_CONFIDENCE:
+        msg["confidence"] = confidence
+    if flags & FLAG_SPECULATIVE:
+        msg["speculative"] = True
+    if flags & FLAG_SEQ:
+        msg["turn_id"] = turn_id
+        msg["seq"] = seq
+        msg["final"] = bool(flags & FLAG_FINAL)
+    if robot_id:
+        msg["robot_id"] = robot_id
+    if model:
+        msg["model"] = model
+    if cache_key:
+        msg["cache_key"] = cache_key
+    return msg